@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+from time import perf_counter
+
+import synth_bldg
+from gendgn import batch_eval
+# the stand-ins of ifcarch2osmod, add_sch2osmod, execute_osmod and epsql2csv
+STUB_DIR = Path(__file__).resolve().parent.joinpath('stubs')
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Benchmark the scheduling overhead of batch_eval with stand-ins of the openstudio tools")
+
+    # defining arguments for parser object
+    parser.add_argument('-n', '--nvariants', type = int, nargs = '+', default = [8, 32],
+                        metavar = 'NVARIANTS',
+                        help = 'The numbers of variants to evaluate')
+
+    parser.add_argument('-j', '--njobs', type = int, nargs = '+', default = [1, 2, 4],
+                        metavar = 'NJOBS',
+                        help = 'The numbers of variants evaluated at the same time')
+
+    parser.add_argument('-t', '--sim_secs', type = float, default = 0.0,
+                        metavar = 'SECONDS',
+                        help = 'The seconds each simulation of the stand-in execute_osmod takes')
+
+    parser.add_argument('-o', '--output', type = str, default = None,
+                        metavar = 'FILEPATH',
+                        help = 'The path of the json file to write the results to')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def write_variants(var_dir: str, nvariants: int) -> list[str]:
+    '''
+    Write distinct copies of a small synthetic building as the variants, the copies differ in the name of the project.
+
+    Parameters
+    ----------
+    var_dir: str
+        The directory to write the variants to.
+
+    nvariants: int
+        The number of variants.
+
+    Returns
+    -------
+    list[str]
+        the paths of the variants.
+    '''
+    Path(var_dir).mkdir(parents=True, exist_ok=True)
+    ifcmodel = synth_bldg.gen_synth_bldg()
+    ifc_project = ifcmodel.by_type('IfcProject')[0]
+    var_paths = []
+    for vcnt in range(nvariants):
+        ifc_project.Name = f"synthetic building {vcnt}"
+        var_path = str(Path(var_dir).joinpath(f"synth_{vcnt}.ifc"))
+        ifcmodel.write(var_path)
+        var_paths.append(var_path)
+    return var_paths
+
+def time_batch_eval(var_dir: str, res_dir: str, input_paths: list[str], njobs: int) -> tuple[float, dict]:
+    '''
+    Time batch_eval_variants with its output suppressed.
+
+    Parameters
+    ----------
+    var_dir: str
+        The directory of the variants.
+
+    res_dir: str
+        The results directory.
+
+    input_paths: list[str]
+        the paths of the weather, design day and measure files.
+
+    njobs: int
+        The number of variants evaluated at the same time.
+
+    Returns
+    -------
+    tuple[float, dict]
+        the seconds and the summary of batch_eval_variants.
+    '''
+    epw_path, ddy_path, measure_path = input_paths
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        t1 = perf_counter()
+        summary = batch_eval.batch_eval_variants(var_dir, res_dir, epw_path, ddy_path, measure_path, njobs=njobs)
+        t2 = perf_counter()
+    return t2 - t1, summary
+
+def bench_batch_eval(nvariants_ls: list[int], njobs_ls: list[int], sim_secs: float = 0.0) -> list[dict]:
+    '''
+    Benchmark the scheduling overhead of batch_eval. The openstudio tools are replaced by the executables in the stubs directory, so the time
+    beyond the simulated seconds is the overhead of batch_eval and of starting the 4 processes of each variant. Each run is followed by a rerun
+    that finds all the results cached.
+
+    Parameters
+    ----------
+    nvariants_ls: list[int]
+        The numbers of variants to evaluate.
+
+    njobs_ls: list[int]
+        The numbers of variants evaluated at the same time.
+
+    sim_secs: float, optional
+        The seconds each simulation takes. Default = 0.0.
+
+    Returns
+    -------
+    list[dict]
+        the nvariants, njobs, secs, overhead per variant, cached_secs and the number of failed variants of each run.
+    '''
+    os.environ['PATH'] = f"{STUB_DIR}{os.pathsep}{os.environ['PATH']}"
+    os.environ['GENDGN_STUB_SIM_SECS'] = str(sim_secs)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        input_paths = []
+        for input_name in ['weather.epw', 'design_day.ddy', 'measure.osw']:
+            input_path = work_dir.joinpath(input_name)
+            input_path.write_text(input_name)
+            input_paths.append(str(input_path))
+
+        for nvariants in nvariants_ls:
+            var_dir = str(work_dir.joinpath(f"variants_{nvariants}"))
+            write_variants(var_dir, nvariants)
+            for njobs in njobs_ls:
+                res_dir = str(work_dir.joinpath(f"res_{nvariants}_{njobs}"))
+                secs, summary = time_batch_eval(var_dir, res_dir, input_paths, njobs)
+                cached_secs, _ = time_batch_eval(var_dir, res_dir, input_paths, njobs)
+                # the wall time of each variant minus the simulation
+                overhead = secs*min(njobs, nvariants)/nvariants - sim_secs
+                res = {'nvariants': nvariants, 'njobs': njobs, 'secs': secs, 'overhead': overhead, 'cached_secs': cached_secs,
+                       'nfailed': len(summary['failed'])}
+                results.append(res)
+                print(f"{nvariants:>9} {njobs:>5} {secs:>9.3f} s {nvariants/secs:>9.2f} variants/s  overhead {overhead:.3f} s/variant  "
+                      f"cached {cached_secs/nvariants*1000:.2f} ms/variant  {res['nfailed']} failed")
+                sys.stdout.flush()
+    return results
+
+def main():
+    args = parse_args()
+    print(f"{'nvariants':>9} {'njobs':>5} {'wall':>11}")
+    results = bench_batch_eval(args.nvariants, args.njobs, sim_secs=args.sim_secs)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(results, indent=4))
+        print(args.output)
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
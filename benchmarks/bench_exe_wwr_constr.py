@@ -0,0 +1,194 @@
+import sys
+import json
+import argparse
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+import synth_bldg
+from gendgn import pmtrz_wwr_constr, sample_variants, exe_wwr_constr, profiler
+# the stages of each variant that are reported per variant, the other stages are reported per building
+VARIANT_STAGES = ['change_wwr', 'pset_edits', 'write', 'variant']
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Benchmark the parameterization and variant generation of exe_wwr_constr on synthetic buildings of increasing size")
+
+    # defining arguments for parser object
+    parser.add_argument('-s', '--sizes', type = synth_bldg.parse_size, nargs = '+', default = [(1, 2, 1, 2), (1, 4, 2, 2), (2, 4, 3, 2), (3, 6, 4, 3)],
+                        metavar = 'SxXxYxW',
+                        help = 'The sizes of the synthetic buildings, storeys x zones along x x zones along y x windows per wall')
+
+    parser.add_argument('-n', '--nsamples', type = int, default = 8,
+                        metavar = 'NSAMPLES',
+                        help = 'The number of variants generated for each building')
+
+    parser.add_argument('-o', '--output', type = str, default = None,
+                        metavar = 'FILEPATH',
+                        help = 'The path of the json file to write the results to')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def bench_bldg(size: tuple[int, int, int, int], nsamples: int, work_dir: str) -> dict:
+    '''
+    Benchmark the tools on a synthetic building. pmtrz_wwr_constr and sample_pmtrs are timed directly, the stages of exe_pmtrc_wwr_constr
+    are read from its profile.
+
+    Parameters
+    ----------
+    size: tuple[int, int, int, int]
+        the number of storeys, zones along x, zones along y and windows per wall, see synth_bldg.parse_size.
+
+    nsamples: int
+        the number of variants to generate.
+
+    work_dir: str
+        the directory to write the building, the parametric model and the variants to.
+
+    Returns
+    -------
+    dict
+        the size, the counts of synth_bldg.count_objs and the seconds of each stage, the per-variant stages are the mean of one variant.
+    '''
+    nstoreys, nzones_x, nzones_y, nwins = size
+    work_dir = Path(work_dir)
+    size_str = 'x'.join([str(val) for val in size])
+    ifc_path = str(work_dir.joinpath(f"synth_{size_str}.ifc"))
+    pmtrc_path = str(work_dir.joinpath(f"synth_{size_str}.json"))
+    profile_path = str(work_dir.joinpath(f"synth_{size_str}.jsonl"))
+    synth_bldg.write_synth_bldg(ifc_path, nstoreys=nstoreys, nzones_x=nzones_x, nzones_y=nzones_y, nwins=nwins)
+
+    secs = {}
+    t1 = perf_counter()
+    pmtrz_wwr_constr.pmtrz_wwr_constr(ifc_path, pmtrc_path)
+    t2 = perf_counter()
+    sample_variants.sample_pmtrs(nsamples, pmtrc_path, pmtrc_path, seed=0)
+    t3 = perf_counter()
+    secs['pmtrz_wwr_constr'] = t2 - t1
+    secs['sample_pmtrs'] = t3 - t2
+
+    exe_wwr_constr.exe_pmtrc_wwr_constr(pmtrc_path, ifc_path, str(work_dir.joinpath(f"variants_{size_str}")), profile_path=profile_path)
+    t4 = perf_counter()
+    secs['exe_pmtrc_wwr_constr'] = t4 - t3
+    for summary in profiler.summarize_profile(profiler.read_profile(profile_path)):
+        if summary['stage'] in VARIANT_STAGES:
+            # change_wwr is recorded once for each wwr parameter of each variant
+            secs[summary['stage']] = summary['wall']/nsamples
+        else:
+            secs[summary['stage']] = summary['wall']
+    secs['variant_loop'] = secs['variant']*nsamples
+    res = {'size': size_str}
+    res.update(synth_bldg.count_objs(nstoreys, nzones_x, nzones_y, nwins))
+    res['secs'] = secs
+    return res
+
+def calc_scaling(results: list[dict], stage: str, count_key: str = 'nwins') -> float:
+    '''
+    Calculate the scaling exponent of a stage, the slope of log(seconds) over log(count), 1 for linear and 2 for quadratic scaling.
+
+    Parameters
+    ----------
+    results: list[dict]
+        the results of bench_bldg.
+
+    stage: str
+        the name of the stage.
+
+    count_key: str, optional
+        the count the stage scales with. Default = 'nwins'.
+
+    Returns
+    -------
+    float
+        the scaling exponent, None if fewer than 2 sizes have the stage.
+    '''
+    counts = []
+    secs = []
+    for res in results:
+        if stage in res['secs'] and res['secs'][stage] > 0:
+            counts.append(res[count_key])
+            secs.append(res['secs'][stage])
+    if len(set(counts)) < 2:
+        return None
+    slope = np.polyfit(np.log(counts), np.log(secs), 1)[0]
+    return float(slope)
+
+def print_results(results: list[dict]):
+    '''
+    Print the seconds of each stage for each size and the scaling exponents.
+
+    Parameters
+    ----------
+    results: list[dict]
+        the results of bench_bldg.
+    '''
+    stages = []
+    for res in results:
+        for stage in res['secs'].keys():
+            if stage not in stages:
+                stages.append(stage)
+    header = f"{'stage':<24}" + ''.join([f"{res['size']:>11}" for res in results]) + f"{'exponent':>10}"
+    print(header)
+    print(f"{'  zones/walls/windows':<24}" + ''.join([f"{str(res['nzones']) + '/' + str(res['nwalls']) + '/' + str(res['nwins']):>11}" for res in results]))
+    for stage in stages:
+        row = f"{stage:<24}"
+        for res in results:
+            sec = res['secs'].get(stage)
+            row += f"{'-':>11}" if sec is None else f"{sec:>11.4f}"
+        exponent = calc_scaling(results, stage)
+        row += f"{'-':>10}" if exponent is None else f"{exponent:>10.2f}"
+        print(row)
+    print(f"seconds, {', '.join(VARIANT_STAGES)} per variant, exponent of the seconds over the number of windows")
+
+def bench_exe_wwr_constr(sizes: list[tuple[int, int, int, int]], nsamples: int) -> list[dict]:
+    '''
+    Benchmark the tools on synthetic buildings of increasing size.
+
+    Parameters
+    ----------
+    sizes: list[tuple[int, int, int, int]]
+        the sizes of the buildings, see synth_bldg.parse_size.
+
+    nsamples: int
+        the number of variants to generate for each building.
+
+    Returns
+    -------
+    list[dict]
+        the results of bench_bldg for each size.
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            res = bench_bldg(size, nsamples, work_dir)
+            print(f"{res['size']}: {res['nwins']} windows, {res['secs']['exe_pmtrc_wwr_constr']:.2f} s")
+            sys.stdout.flush()
+            results.append(res)
+    return results
+
+def main():
+    args = parse_args()
+    results = bench_exe_wwr_constr(args.sizes, args.nsamples)
+    print_results(results)
+    if args.output is not None:
+        exponents = {stage: calc_scaling(results, stage) for stage in results[-1]['secs'].keys()}
+        with open(args.output, 'w') as f:
+            f.write(json.dumps({'results': results, 'exponents': exponents}, indent=4))
+        print(args.output)
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
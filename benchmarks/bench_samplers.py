@@ -0,0 +1,111 @@
+import sys
+import argparse
+import warnings
+from time import perf_counter
+
+import numpy as np
+from scipy.stats import qmc
+from scipy.spatial import cKDTree
+
+from gendgn import sample_variants
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Benchmark the generation time of the sampling methods of sample_variants")
+
+    # defining arguments for parser object
+    parser.add_argument('-n', '--nsamples', type = int, nargs = '+', default = [1000, 10000, 50000],
+                        metavar = 'NSAMPLES',
+                        help = 'The numbers of samples to benchmark')
+
+    parser.add_argument('-d', '--nparameters', type = int, default = 8,
+                        metavar = 'NPARAMETERS',
+                        help = 'The number of parameters')
+
+    parser.add_argument('-x', '--max_pymoo', type = int, default = 10000,
+                        metavar = 'NSAMPLES',
+                        help = 'The largest number of samples to benchmark pymoo LHS with, it needs nsamples**2 memory')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def calc_quality(smpls: np.ndarray) -> tuple[float, float]:
+    '''
+    Calculate the space-filling quality of a sample.
+
+    Parameters
+    ----------
+    smpls: np.ndarray
+        np.ndarray[shape(nsamples, nparameters)] the normalized samples.
+
+    Returns
+    -------
+    tuple[float, float]
+        the minimum distance between the samples and the centered L2 discrepancy, the discrepancy is None for more than 10,000 samples.
+    '''
+    min_dist = cKDTree(smpls).query(smpls, k=2)[0][:, 1].min()
+    disc = None
+    if len(smpls) <= 10000:
+        disc = qmc.discrepancy(smpls)
+    return min_dist, disc
+
+def bench_samplers(nsamples_ls: list[int], npmtrs: int, max_pymoo: int = 10000) -> list[dict]:
+    '''
+    Benchmark the generation time of the sampling methods.
+
+    Parameters
+    ----------
+    nsamples_ls: list[int]
+        The numbers of samples to benchmark.
+
+    npmtrs: int
+        The number of parameters.
+
+    max_pymoo: int, optional
+        The largest number of samples to benchmark pymoo LHS with. Default = 10000.
+
+    Returns
+    -------
+    list[dict]
+        the method, nsamples, secs, min_dist and discrepancy of each run.
+    '''
+    from pymoo.core.problem import Problem
+    from pymoo.operators.sampling.lhs import LHS
+    samplers = [(method, lambda nsamples, method=method: sample_variants.sample_unit(method, nsamples, npmtrs, seed=0))
+                for method in sample_variants.SAMPLING_METHODS]
+    samplers.append(('pymoo_lhs', lambda nsamples: LHS()(Problem(n_var=npmtrs, xl=0, xu=1), nsamples).get('X')))
+    results = []
+    for nsamples in nsamples_ls:
+        for method, sampler in samplers:
+            if method == 'pymoo_lhs' and nsamples > max_pymoo:
+                continue
+            with warnings.catch_warnings():
+                # the sobol warning for nsamples that are not a power of 2
+                warnings.simplefilter('ignore')
+                t1 = perf_counter()
+                smpls = sampler(nsamples)
+                t2 = perf_counter()
+            min_dist, disc = calc_quality(smpls)
+            results.append({'method': method, 'nsamples': nsamples, 'secs': t2 - t1, 'min_dist': min_dist, 'discrepancy': disc})
+            disc_str = '-' if disc is None else f"{disc:.3e}"
+            print(f"{method:<10} {nsamples:>8} {t2 - t1:>9.3f} s  min dist {min_dist:.4f}  discrepancy {disc_str}")
+            sys.stdout.flush()
+    return results
+
+def main():
+    args = parse_args()
+    bench_samplers(args.nsamples, args.nparameters, max_pymoo=args.max_pymoo)
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
@@ -0,0 +1,181 @@
+import sys
+import json
+import argparse
+import subprocess
+from time import perf_counter
+from pathlib import Path
+
+import numpy as np
+
+# the command line tools are read from the [project.scripts] of the pyproject.toml
+PYPROJECT_PATH = str(Path(__file__).resolve().parent.parent.joinpath('pyproject.toml'))
+# the packages that take long to import, reported when a command line tool imports them before parsing its arguments
+HEAVY_PACKAGES = ['ifcopenshell', 'ifc_utils', 'geomie3d', 'ifc2osmod', 'openstudio', 'scipy', 'jsonschema', 'pymoo', 'PyQt5', 'PyQt6', 'pyqtgraph']
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Benchmark the startup time of the command line tools of gendgn, the time to print their help")
+
+    # defining arguments for parser object
+    parser.add_argument('-n', '--nrepeats', type = int, default = 5,
+                        metavar = 'NREPEATS',
+                        help = 'The number of times each tool is started, the median is reported')
+
+    parser.add_argument('-o', '--output', type = str, default = None,
+                        metavar = 'FILEPATH',
+                        help = 'The path of the json file to write the results to, it can be used as the baseline of later runs')
+
+    parser.add_argument('-b', '--baseline', type = str, default = None,
+                        metavar = 'FILEPATH',
+                        help = 'The path of the json file of a previous run, the tools that start slower than the baseline are reported as regressions')
+
+    parser.add_argument('-t', '--tolerance', type = float, default = 0.25,
+                        metavar = 'FRACTION',
+                        help = 'The fraction a tool may start slower than the baseline before it is a regression')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def get_cli_modules(pyproject_path: str = PYPROJECT_PATH) -> dict:
+    '''
+    Get the command line tools of gendgn from the [project.scripts] of its pyproject.toml.
+
+    Parameters
+    ----------
+    pyproject_path: str, optional
+        the path of the pyproject.toml. Default to the pyproject.toml of this repository.
+
+    Returns
+    -------
+    dict
+        the module of each command line tool, e.g. {'batch_eval': 'gendgn.batch_eval'}.
+    '''
+    cli_modules = {}
+    in_scripts = False
+    with open(pyproject_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('['):
+                in_scripts = line == '[project.scripts]'
+            elif in_scripts and '=' in line:
+                cli_name, entry_point = [val.strip().strip('"\'') for val in line.split('=', 1)]
+                cli_modules[cli_name] = entry_point.split(':')[0]
+    return dict(sorted(cli_modules.items()))
+
+def find_heavy_imports(module_name: str) -> list[str]:
+    '''
+    Find the heavy packages imported by importing a module.
+
+    Parameters
+    ----------
+    module_name: str
+        the name of the module.
+
+    Returns
+    -------
+    list[str]
+        the packages of HEAVY_PACKAGES that are imported.
+    '''
+    code = f"import sys, json, {module_name}; print(json.dumps(sorted(set(name.split('.')[0] for name in sys.modules))))"
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if completed.returncode != 0:
+        return None
+    imported = json.loads(completed.stdout.strip().splitlines()[-1])
+    return [pkg for pkg in HEAVY_PACKAGES if pkg in imported]
+
+def time_startup(module_name: str, nrepeats: int) -> float:
+    '''
+    Time the start of a command line tool, from starting the interpreter to printing the help.
+
+    Parameters
+    ----------
+    module_name: str
+        the name of the module of the tool, None to time the start of the interpreter alone.
+
+    nrepeats: int
+        the number of times the tool is started.
+
+    Returns
+    -------
+    float
+        the median seconds, None if the tool fails.
+    '''
+    cmd = [sys.executable, '-c', 'pass']
+    if module_name is not None:
+        cmd = [sys.executable, '-m', module_name, '--help']
+    secs = []
+    for _ in range(nrepeats):
+        t1 = perf_counter()
+        completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        t2 = perf_counter()
+        if completed.returncode != 0:
+            return None
+        secs.append(t2 - t1)
+    return float(np.median(secs))
+
+def bench_startup(nrepeats: int, baseline: dict = None, tolerance: float = 0.25) -> dict:
+    '''
+    Benchmark the startup time of the command line tools.
+
+    Parameters
+    ----------
+    nrepeats: int
+        the number of times each tool is started.
+
+    baseline: dict, optional
+        the results of a previous run. Default to no comparison.
+
+    tolerance: float, optional
+        the fraction a tool may start slower than the baseline. Default = 0.25.
+
+    Returns
+    -------
+    dict
+        the results of each tool with keys module, secs, heavy_imports and regression.
+    '''
+    # the start of the interpreter itself
+    python_secs = time_startup(None, nrepeats)
+    print(f"{'python':<22} {python_secs:>8.3f} s")
+    results = {'python': {'module': None, 'secs': python_secs, 'heavy_imports': [], 'regression': False}}
+    for cli_name, module_name in get_cli_modules().items():
+        secs = time_startup(module_name, nrepeats)
+        heavy_imports = find_heavy_imports(module_name)
+        regression = False
+        base_str = ''
+        if baseline is not None and cli_name in baseline and baseline[cli_name]['secs'] is not None and secs is not None:
+            base_secs = baseline[cli_name]['secs']
+            regression = secs > base_secs*(1 + tolerance)
+            base_str = f"  baseline {base_secs:.3f} s{'  REGRESSION' if regression else ''}"
+        results[cli_name] = {'module': module_name, 'secs': secs, 'heavy_imports': heavy_imports, 'regression': regression}
+        secs_str = f"{'failed':>8}  " if secs is None else f"{secs:>8.3f} s"
+        print(f"{cli_name:<22} {secs_str}  imports {', '.join(heavy_imports or []) or '-'}{base_str}")
+        sys.stdout.flush()
+    return results
+
+def main():
+    args = parse_args()
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = bench_startup(args.nrepeats, baseline=baseline, tolerance=args.tolerance)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(results, indent=4))
+        print(args.output)
+    if any(res['regression'] for res in results.values()):
+        sys.exit(1)
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
@@ -0,0 +1,346 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import ifcopenshell
+import ifcopenshell.api
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Generate a synthetic rectangular building with spatial zones, walls and windows to benchmark the tools")
+
+    # defining arguments for parser object
+    parser.add_argument('-r', '--res', type = str,
+                        metavar = 'FILEPATH',
+                        help = 'The path of the generated ifc')
+
+    parser.add_argument('-s', '--nstoreys', type = int, default = 1,
+                        metavar = 'NSTOREYS',
+                        help = 'The number of storeys')
+
+    parser.add_argument('-x', '--nzones_x', type = int, default = 2,
+                        metavar = 'NZONES',
+                        help = 'The number of spatial zones along x of each storey, also the number of walls on the north and south facades')
+
+    parser.add_argument('-y', '--nzones_y', type = int, default = 1,
+                        metavar = 'NZONES',
+                        help = 'The number of spatial zones along y of each storey, also the number of walls on the east and west facades')
+
+    parser.add_argument('-w', '--nwins', type = int, default = 2,
+                        metavar = 'NWINDOWS',
+                        help = 'The number of windows of each wall')
+
+    parser.add_argument('-p', '--process', action = 'store_true', default=False,
+                        help = 'turn it on if piping in the res path')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def parse_size(size_str: str) -> tuple[int, int, int, int]:
+    '''
+    Parse the size of a synthetic building, SxXxYxW, e.g. 2x4x3x2 for 2 storeys of 4 by 3 zones with 2 windows per wall.
+
+    Parameters
+    ----------
+    size_str: str
+        the size of the building.
+
+    Returns
+    -------
+    tuple[int, int, int, int]
+        the number of storeys, zones along x, zones along y and windows per wall.
+    '''
+    try:
+        nstoreys, nzones_x, nzones_y, nwins = [int(val) for val in size_str.lower().split('x')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{size_str} is not a size SxXxYxW, e.g. 2x4x3x2")
+    if min(nstoreys, nzones_x, nzones_y, nwins) < 1:
+        raise argparse.ArgumentTypeError(f"the size {size_str} needs at least 1 of each")
+    return nstoreys, nzones_x, nzones_y, nwins
+
+def count_objs(nstoreys: int, nzones_x: int, nzones_y: int, nwins: int) -> dict:
+    '''
+    Count the objects of a synthetic building.
+
+    Parameters
+    ----------
+    nstoreys: int
+        The number of storeys.
+
+    nzones_x: int
+        The number of spatial zones along x of each storey.
+
+    nzones_y: int
+        The number of spatial zones along y of each storey.
+
+    nwins: int
+        The number of windows of each wall.
+
+    Returns
+    -------
+    dict
+        the number of zones, walls and windows.
+    '''
+    nwalls = nstoreys*2*(nzones_x + nzones_y)
+    return {'nzones': nstoreys*nzones_x*nzones_y, 'nwalls': nwalls, 'nwins': nwalls*nwins}
+
+def calc_box_mesh(mn: list[float], mx: list[float]) -> tuple[list[tuple], list[list[int]]]:
+    '''
+    Calculate the mesh of an axis aligned box with the faces pointing outwards.
+
+    Parameters
+    ----------
+    mn: list[float]
+        the minimum corner of the box.
+
+    mx: list[float]
+        the maximum corner of the box.
+
+    Returns
+    -------
+    tuple[list[tuple], list[list[int]]]
+        the vertices and the faces of the box.
+    '''
+    x0, y0, z0 = mn
+    x1, y1, z1 = mx
+    verts = [(x0, y0, z0), (x1, y0, z0), (x1, y1, z0), (x0, y1, z0),
+             (x0, y0, z1), (x1, y0, z1), (x1, y1, z1), (x0, y1, z1)]
+    faces = [[0, 3, 2, 1], [4, 5, 6, 7], [0, 1, 5, 4], [1, 2, 6, 5], [2, 3, 7, 6], [3, 0, 4, 7]]
+    return verts, faces
+
+def add_box_obj(ifcmodel: ifcopenshell.file, body: ifcopenshell.entity_instance, ifc_class: str, name: str, mn: list[float], mx: list[float],
+                container: ifcopenshell.entity_instance = None) -> ifcopenshell.entity_instance:
+    '''
+    Add an object with the mesh of a box to the ifc model.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model.
+
+    body: ifcopenshell.entity_instance
+        the body context.
+
+    ifc_class: str
+        the ifc class of the object.
+
+    name: str
+        the name of the object.
+
+    mn: list[float]
+        the minimum corner of the box.
+
+    mx: list[float]
+        the maximum corner of the box.
+
+    container: ifcopenshell.entity_instance, optional
+        the storey containing the object. Default to not contained.
+
+    Returns
+    -------
+    ifcopenshell.entity_instance
+        the object.
+    '''
+    ifc_obj = ifcopenshell.api.run('root.create_entity', ifcmodel, ifc_class=ifc_class, name=name)
+    ifcopenshell.api.run('geometry.edit_object_placement', ifcmodel, product=ifc_obj, matrix=np.eye(4))
+    verts, faces = calc_box_mesh(mn, mx)
+    mesh_repr = ifcopenshell.api.run('geometry.add_mesh_representation', ifcmodel, context=body, vertices=[verts], faces=[faces])
+    ifcopenshell.api.run('geometry.assign_representation', ifcmodel, product=ifc_obj, representation=mesh_repr)
+    if container is not None:
+        ifcopenshell.api.run('spatial.assign_container', ifcmodel, products=[ifc_obj], relating_structure=container)
+    return ifc_obj
+
+def add_pset_val(ifcmodel: ifcopenshell.file, ifc_obj: ifcopenshell.entity_instance, pset_name: str, prop_name: str, val: float):
+    '''
+    Add a pset with a single value to an object.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model.
+
+    ifc_obj: ifcopenshell.entity_instance
+        the object.
+
+    pset_name: str
+        the name of the pset, e.g. Pset_OsmodThermalResistance.
+
+    prop_name: str
+        the name of the property, e.g. ThermalResistance.
+
+    val: float
+        the value of the property.
+    '''
+    pset = ifcopenshell.api.run('pset.add_pset', ifcmodel, product=ifc_obj, name=pset_name)
+    ifcopenshell.api.run('pset.edit_pset', ifcmodel, pset=pset, properties={prop_name: val})
+
+def gen_synth_bldg(nstoreys: int = 1, nzones_x: int = 2, nzones_y: int = 1, nwins: int = 2, zone_width: float = 6.0, zone_depth: float = 6.0,
+                   storey_height: float = 3.5, wall_thickness: float = 0.2) -> ifcopenshell.file:
+    '''
+    Generate a synthetic rectangular building. Each storey is a grid of box IfcSpatialZones, enclosed by one exterior wall per zone on each facade.
+    Each wall has nwins windows filling openings. The walls, slabs and roof have Pset_OsmodThermalResistance and the windows Pset_OsmodUfactor.
+
+    Parameters
+    ----------
+    nstoreys: int, optional
+        The number of storeys. Default = 1.
+
+    nzones_x: int, optional
+        The number of spatial zones along x of each storey, also the number of walls on the north and south facades. Default = 2.
+
+    nzones_y: int, optional
+        The number of spatial zones along y of each storey, also the number of walls on the east and west facades. Default = 1.
+
+    nwins: int, optional
+        The number of windows of each wall. Default = 2.
+
+    zone_width: float, optional
+        The size of the zones along x in meters. Default = 6.0.
+
+    zone_depth: float, optional
+        The size of the zones along y in meters. Default = 6.0.
+
+    storey_height: float, optional
+        The height of the storeys in meters. Default = 3.5.
+
+    wall_thickness: float, optional
+        The thickness of the walls in meters. Default = 0.2.
+
+    Returns
+    -------
+    ifcopenshell.file
+        the ifc model, None if the windows do not fit on the walls.
+    '''
+    win_width = min(1.2, min(zone_width, zone_depth)/nwins - 0.4)
+    if win_width < 0.2:
+        print(f"{nwins} windows do not fit on walls of {min(zone_width, zone_depth)} m")
+        return None
+
+    ifcmodel = ifcopenshell.file(schema='IFC4')
+    project = ifcopenshell.api.run('root.create_entity', ifcmodel, ifc_class='IfcProject', name='synthetic building')
+    ifcopenshell.api.run('unit.assign_unit', ifcmodel)
+    model_context = ifcopenshell.api.run('context.add_context', ifcmodel, context_type='Model')
+    body = ifcopenshell.api.run('context.add_context', ifcmodel, context_type='Model', context_identifier='Body', target_view='MODEL_VIEW',
+                                parent=model_context)
+    site = ifcopenshell.api.run('root.create_entity', ifcmodel, ifc_class='IfcSite', name='site')
+    bldg = ifcopenshell.api.run('root.create_entity', ifcmodel, ifc_class='IfcBuilding', name='building')
+    ifcopenshell.api.run('aggregate.assign_object', ifcmodel, products=[site], relating_object=project)
+    ifcopenshell.api.run('aggregate.assign_object', ifcmodel, products=[bldg], relating_object=site)
+
+    bldg_x = nzones_x*zone_width
+    bldg_y = nzones_y*zone_depth
+    half_t = wall_thickness/2
+    for scnt in range(nstoreys):
+        z0 = scnt*storey_height
+        z1 = z0 + storey_height
+        storey = ifcopenshell.api.run('root.create_entity', ifcmodel, ifc_class='IfcBuildingStorey', name=f"storey {scnt}")
+        ifcopenshell.api.run('aggregate.assign_object', ifcmodel, products=[storey], relating_object=bldg)
+        slab = add_box_obj(ifcmodel, body, 'IfcSlab', f"slab {scnt}", [0, 0, z0 - wall_thickness], [bldg_x, bldg_y, z0], container=storey)
+        add_pset_val(ifcmodel, slab, 'Pset_OsmodThermalResistance', 'ThermalResistance', 3.0)
+        if scnt == nstoreys - 1:
+            roof = add_box_obj(ifcmodel, body, 'IfcRoof', 'roof', [0, 0, z1], [bldg_x, bldg_y, z1 + wall_thickness], container=storey)
+            add_pset_val(ifcmodel, roof, 'Pset_OsmodThermalResistance', 'ThermalResistance', 3.0)
+
+        for xcnt in range(nzones_x):
+            for ycnt in range(nzones_y):
+                zone_mn = [xcnt*zone_width, ycnt*zone_depth, z0]
+                zone_mx = [(xcnt + 1)*zone_width, (ycnt + 1)*zone_depth, z1]
+                spacezone = add_box_obj(ifcmodel, body, 'IfcSpatialZone', f"zone {scnt}_{xcnt}_{ycnt}", zone_mn, zone_mx)
+                ifcopenshell.api.run('aggregate.assign_object', ifcmodel, products=[spacezone], relating_object=storey)
+
+        # one exterior wall for each zone on each facade, with the axis the wall runs along
+        wall_boxes = []
+        for xcnt in range(nzones_x):
+            x0 = xcnt*zone_width
+            x1 = x0 + zone_width
+            wall_boxes.append(('south', [x0, -half_t, z0], [x1, half_t, z1], 0))
+            wall_boxes.append(('north', [x0, bldg_y - half_t, z0], [x1, bldg_y + half_t, z1], 0))
+        for ycnt in range(nzones_y):
+            y0 = ycnt*zone_depth
+            y1 = y0 + zone_depth
+            wall_boxes.append(('west', [-half_t, y0, z0], [half_t, y1, z1], 1))
+            wall_boxes.append(('east', [bldg_x - half_t, y0, z0], [bldg_x + half_t, y1, z1], 1))
+
+        for wcnt, (facade, wall_mn, wall_mx, axis) in enumerate(wall_boxes):
+            ifc_wall = add_box_obj(ifcmodel, body, 'IfcWall', f"{facade} wall {scnt}_{wcnt}", wall_mn, wall_mx, container=storey)
+            add_pset_val(ifcmodel, ifc_wall, 'Pset_OsmodThermalResistance', 'ThermalResistance', 2.0)
+            wall_len = wall_mx[axis] - wall_mn[axis]
+            thick_axis = 1 - axis
+            wall_mid = (wall_mn[thick_axis] + wall_mx[thick_axis])/2
+            for wincnt in range(nwins):
+                win_mid = wall_mn[axis] + wall_len*(wincnt + 0.5)/nwins
+                open_mn = list(wall_mn)
+                open_mx = list(wall_mx)
+                open_mn[axis] = win_mid - win_width/2
+                open_mx[axis] = win_mid + win_width/2
+                open_mn[2] = z0 + 0.9
+                open_mx[2] = z0 + 2.1
+                opening = add_box_obj(ifcmodel, body, 'IfcOpeningElement', f"opening {scnt}_{wcnt}_{wincnt}", open_mn, open_mx)
+                ifcopenshell.api.run('feature.add_feature', ifcmodel, feature=opening, element=ifc_wall)
+                # the window is a thin box in the middle of the opening
+                win_mn = list(open_mn)
+                win_mx = list(open_mx)
+                win_mn[thick_axis] = wall_mid - 0.025
+                win_mx[thick_axis] = wall_mid + 0.025
+                ifc_win = add_box_obj(ifcmodel, body, 'IfcWindow', f"window {scnt}_{wcnt}_{wincnt}", win_mn, win_mx, container=storey)
+                ifcopenshell.api.run('feature.add_filling', ifcmodel, opening=opening, element=ifc_win)
+                add_pset_val(ifcmodel, ifc_win, 'Pset_OsmodUfactor', 'UFactor', 2.0)
+    return ifcmodel
+
+def write_synth_bldg(res_path: str, nstoreys: int = 1, nzones_x: int = 2, nzones_y: int = 1, nwins: int = 2) -> str:
+    '''
+    Generate a synthetic building and write it to an ifc, see gen_synth_bldg.
+
+    Parameters
+    ----------
+    res_path: str
+        The path of the generated ifc.
+
+    nstoreys: int, optional
+        The number of storeys. Default = 1.
+
+    nzones_x: int, optional
+        The number of spatial zones along x of each storey. Default = 2.
+
+    nzones_y: int, optional
+        The number of spatial zones along y of each storey. Default = 1.
+
+    nwins: int, optional
+        The number of windows of each wall. Default = 2.
+
+    Returns
+    -------
+    str
+        the path of the generated ifc, None if it cannot be generated.
+    '''
+    ifcmodel = gen_synth_bldg(nstoreys=nstoreys, nzones_x=nzones_x, nzones_y=nzones_y, nwins=nwins)
+    if ifcmodel is None:
+        return None
+    Path(res_path).parent.mkdir(parents=True, exist_ok=True)
+    ifcmodel.write(res_path)
+    return res_path
+
+def main():
+    args = parse_args()
+    res_path = args.res
+    if args.process:
+        res_path = input()
+    res_path = write_synth_bldg(res_path, nstoreys=args.nstoreys, nzones_x=args.nzones_x, nzones_y=args.nzones_y, nwins=args.nwins)
+    if res_path is not None:
+        print(count_objs(args.nstoreys, args.nzones_x, args.nzones_y, args.nwins))
+        # make sure this output can be piped into another command on the cmd
+        print(res_path)
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
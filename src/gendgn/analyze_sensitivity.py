@@ -0,0 +1,279 @@
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from . import batch_eval
+from . import collect_results
+from . import variant_delta
+from . import pmtrc_utils
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Calculate the sensitivity of the results to the parameters from a morris or saltelli sample")
+
+    # defining arguments for parser object
+    parser.add_argument('-j', '--json', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the json parametric file sampled with the morris or saltelli method')
+
+    parser.add_argument('-r', '--res', type = str,
+                        metavar = 'DIR',
+                        help = 'The directory path of the results of the variants')
+
+    parser.add_argument('-o', '--outputs', type = str, nargs = '+', default = ['Total Site Energy:Total Energy'],
+                        metavar = 'NAME',
+                        help = 'The {row name}:{column name} of the Site and Source Energy table to analyze')
+
+    parser.add_argument('-b', '--bootstrap', type = int, default = 1000,
+                        metavar = 'NRESAMPLES',
+                        help = 'The number of bootstrap resamples for the confidence intervals')
+
+    parser.add_argument('-p', '--process', action = 'store_true', default=False,
+                        help = 'turn it on if piping in json filepath')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def read_outputs(res_dir: str, out_names: list[str], nvariants: int) -> np.ndarray:
+    '''
+    Read the outputs of the variants with valid results.
+
+    Parameters
+    ----------
+    res_dir: str
+        The directory path of the results generated by batch_eval or gen_eval.
+
+    out_names: list[str]
+        the {row name}:{column name} of the Site and Source Energy table, see collect_results.read_sql_scalars.
+
+    nvariants: int
+        number of variants in the sample.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nvariants, noutputs)] the outputs of each variant, nan for the variants without results.
+    '''
+    outputs = np.full((nvariants, len(out_names)), np.nan)
+    res_dir_pobj = Path(res_dir)
+    for var_dir in res_dir_pobj.iterdir():
+        if not var_dir.is_dir():
+            continue
+        filename = var_dir.name
+        var_indx = variant_delta.get_variant_indx(filename)
+        if var_indx is None or var_indx >= nvariants or not batch_eval.is_res_valid(res_dir, filename):
+            continue
+        sql_path = batch_eval.get_res_paths(res_dir, filename)['sql']
+        scalars = collect_results.read_sql_scalars(str(sql_path))
+        for ocnt, out_name in enumerate(out_names):
+            if out_name in scalars:
+                outputs[var_indx, ocnt] = scalars[out_name]['value']
+    return outputs
+
+def calc_morris(nmlz_pmtrs: np.ndarray, outputs: np.ndarray, nbootstrap: int = 1000, seed: int = None) -> dict:
+    '''
+    Calculate the elementary effects of a Morris sample. The effects are per change of the normalized parameter, i.e. over the whole range of the
+    parameter, so the parameters with different units can be compared. Trajectories with a missing output are skipped.
+
+    Parameters
+    ----------
+    nmlz_pmtrs: np.ndarray
+        np.ndarray[shape(ntrajs*(nparameters+1), nparameters)] the normalized samples from sample_variants.sample_morris.
+
+    outputs: np.ndarray
+        np.ndarray[shape(ntrajs*(nparameters+1))] the output of each sample.
+
+    nbootstrap: int, optional
+        The number of bootstrap resamples of the trajectories for the confidence interval of mu_star. Default = 1000.
+
+    seed: int, optional
+        the seed of the bootstrap.
+
+    Returns
+    -------
+    dict
+        - n: the number of trajectories used
+        - mu: np.ndarray[shape(nparameters)] the mean of the elementary effects
+        - mu_star: np.ndarray[shape(nparameters)] the mean of the absolute elementary effects, the overall importance
+        - mu_star_conf: np.ndarray[shape(nparameters)] the half width of the 95% confidence interval of mu_star
+        - sigma: np.ndarray[shape(nparameters)] the standard deviation of the elementary effects, the interactions and non linearity
+    '''
+    npmtrs = nmlz_pmtrs.shape[1]
+    ntrajs = len(nmlz_pmtrs) // (npmtrs + 1)
+    trajs = nmlz_pmtrs[:ntrajs*(npmtrs+1)].reshape(ntrajs, npmtrs+1, npmtrs)
+    traj_outs = outputs[:ntrajs*(npmtrs+1)].reshape(ntrajs, npmtrs+1)
+    trajs = trajs[~np.any(np.isnan(traj_outs), axis=1)]
+    traj_outs = traj_outs[~np.any(np.isnan(traj_outs), axis=1)]
+    ntrajs = len(trajs)
+
+    # each step of a trajectory changes one parameter
+    steps = np.diff(trajs, axis=1)
+    step_pmtrs = np.argmax(np.abs(steps), axis=2)
+    step_sizes = np.take_along_axis(steps, step_pmtrs[:, :, None], axis=2)[:, :, 0]
+    effects = np.full((ntrajs, npmtrs), np.nan)
+    np.put_along_axis(effects, step_pmtrs, np.diff(traj_outs, axis=1) / step_sizes, axis=1)
+
+    res = {'n': ntrajs, 'mu': np.full(npmtrs, np.nan), 'mu_star': np.full(npmtrs, np.nan), 'mu_star_conf': np.full(npmtrs, np.nan),
+           'sigma': np.full(npmtrs, np.nan)}
+    if ntrajs == 0:
+        return res
+    res['mu'] = np.mean(effects, axis=0)
+    res['mu_star'] = np.mean(np.abs(effects), axis=0)
+    if ntrajs > 1:
+        res['sigma'] = np.std(effects, axis=0, ddof=1)
+        rng = np.random.default_rng(seed)
+        resamples = rng.integers(ntrajs, size=(nbootstrap, ntrajs))
+        boot_mu_stars = np.mean(np.abs(effects)[resamples], axis=1)
+        res['mu_star_conf'] = 1.96 * np.std(boot_mu_stars, axis=0, ddof=1)
+    return res
+
+def calc_sobol_indices(nmlz_pmtrs: np.ndarray, outputs: np.ndarray, nbootstrap: int = 1000, seed: int = None) -> dict:
+    '''
+    Calculate the first order and total Sobol indices of a Saltelli sample, with the estimators of Saltelli et al. (2010) for the first order
+    and Jansen (1999) for the total indices. Base samples with a missing output are skipped.
+
+    Parameters
+    ----------
+    nmlz_pmtrs: np.ndarray
+        np.ndarray[shape(nbase*(nparameters+2), nparameters)] the normalized samples from sample_variants.sample_saltelli.
+
+    outputs: np.ndarray
+        np.ndarray[shape(nbase*(nparameters+2))] the output of each sample.
+
+    nbootstrap: int, optional
+        The number of bootstrap resamples of the base samples for the confidence intervals. Default = 1000.
+
+    seed: int, optional
+        the seed of the bootstrap.
+
+    Returns
+    -------
+    dict
+        - n: the number of base samples used
+        - s1, s1_conf: np.ndarray[shape(nparameters)] the first order indices and the half width of their 95% confidence intervals
+        - st, st_conf: np.ndarray[shape(nparameters)] the total indices and the half width of their 95% confidence intervals
+    '''
+    npmtrs = nmlz_pmtrs.shape[1]
+    nbase = len(outputs) // (npmtrs + 2)
+    blocks = outputs[:nbase*(npmtrs+2)].reshape(nbase, npmtrs+2)
+    blocks = blocks[~np.any(np.isnan(blocks), axis=1)]
+    nbase = len(blocks)
+
+    def estimate(blocks):
+        out_a = blocks[:, 0]
+        out_b = blocks[:, -1]
+        out_ab = blocks[:, 1:-1]
+        var = np.var(np.concatenate([out_a, out_b]))
+        if var == 0:
+            return np.zeros(npmtrs), np.zeros(npmtrs)
+        s1 = np.mean(out_b[:, None] * (out_ab - out_a[:, None]), axis=0) / var
+        st = 0.5 * np.mean((out_a[:, None] - out_ab)**2, axis=0) / var
+        return s1, st
+
+    res = {'n': nbase, 's1': np.full(npmtrs, np.nan), 's1_conf': np.full(npmtrs, np.nan), 'st': np.full(npmtrs, np.nan),
+           'st_conf': np.full(npmtrs, np.nan)}
+    if nbase < 2:
+        return res
+    res['s1'], res['st'] = estimate(blocks)
+    rng = np.random.default_rng(seed)
+    boot_s1s = np.zeros((nbootstrap, npmtrs))
+    boot_sts = np.zeros((nbootstrap, npmtrs))
+    for bcnt in range(nbootstrap):
+        boot_s1s[bcnt], boot_sts[bcnt] = estimate(blocks[rng.integers(nbase, size=nbase)])
+    res['s1_conf'] = 1.96 * np.std(boot_s1s, axis=0, ddof=1)
+    res['st_conf'] = 1.96 * np.std(boot_sts, axis=0, ddof=1)
+    return res
+
+def analyze_sensitivity(pmtrc_path: str, res_dir: str, out_names: list[str] = None, nbootstrap: int = 1000) -> dict:
+    '''
+    Calculate the sensitivity of the outputs to the parameters from the results of a morris or saltelli sample of sample_variants. The result is
+    written to sensitivity.json in the results directory.
+
+    Parameters
+    ----------
+    pmtrc_path: str
+        The file path of the json parametric model sampled with the morris or saltelli method.
+
+    res_dir: str
+        The directory path of the results of the variants.
+
+    out_names: list[str], optional
+        the {row name}:{column name} of the Site and Source Energy table to analyze. Default = ['Total Site Energy:Total Energy'].
+
+    nbootstrap: int, optional
+        The number of bootstrap resamples for the confidence intervals. Default = 1000.
+
+    Returns
+    -------
+    dict
+        - method: 'morris' or 'saltelli'
+        - parameters: the names of the parameters
+        - outputs: dictionary of each output to the result of calc_morris or calc_sobol_indices, as lists
+        None if the parametric model is not a morris or saltelli sample.
+    '''
+    if out_names is None:
+        out_names = ['Total Site Energy:Total Energy']
+    pmtrc_mod = pmtrc_utils.read_pmtrc_json(pmtrc_path, validate=False)
+    method = pmtrc_mod.get('sampling', {}).get('method')
+    if method not in ['morris', 'saltelli']:
+        print('The parametric model is not sampled with the morris or saltelli method')
+        return None
+
+    pmtr_names = list(pmtrc_mod['parameters'].keys())
+    nmlz_pmtrs = np.array(pmtrc_mod['parameter_normalized_values'], dtype=float)
+    outputs = read_outputs(res_dir, out_names, len(nmlz_pmtrs))
+    sensitivity = {'method': method, 'parameters': pmtr_names, 'outputs': {}}
+    for ocnt, out_name in enumerate(out_names):
+        if method == 'morris':
+            res = calc_morris(nmlz_pmtrs, outputs[:, ocnt], nbootstrap=nbootstrap, seed=0)
+            rank_key = 'mu_star'
+        else:
+            res = calc_sobol_indices(nmlz_pmtrs, outputs[:, ocnt], nbootstrap=nbootstrap, seed=0)
+            rank_key = 'st'
+        sensitivity['outputs'][out_name] = {key: val.tolist() if isinstance(val, np.ndarray) else val for key, val in res.items()}
+
+        print(f"{out_name} ({res['n']} {'trajectories' if method == 'morris' else 'base samples'})")
+        stat_keys = [key for key in res.keys() if key != 'n']
+        print(f"{'parameter':<24}" + ''.join(f"{key:>14}" for key in stat_keys))
+        # the most important parameters first
+        for pcnt in np.argsort(-np.nan_to_num(res[rank_key], nan=-np.inf)):
+            print(f"{pmtr_names[pcnt]:<24}" + ''.join(f"{res[key][pcnt]:>14.4g}" for key in stat_keys))
+
+    pretty_json_data = json.dumps(sensitivity, indent=4)
+    with open(Path(res_dir).joinpath('sensitivity.json'), 'w') as f:
+        f.write(pretty_json_data)
+    return sensitivity
+
+def main():
+    args = parse_args()
+    pipe_input = args.process
+    if pipe_input == False:
+        pmtrc_path = args.json
+    else:
+        lines = list(sys.stdin)
+        pmtrc_path = lines[0].strip()
+
+    pmtrc_path = str(Path(pmtrc_path).resolve())
+    res_dir = str(Path(args.res).resolve())
+    sensitivity = analyze_sensitivity(pmtrc_path, res_dir, out_names=args.outputs, nbootstrap=args.bootstrap)
+    if sensitivity is not None:
+        # make sure this output can be piped into another command on the cmd
+        print(str(Path(res_dir).joinpath('sensitivity.json')))
+        sys.stdout.flush()
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
@@ -1,9 +1,26 @@
+import os
 import sys
+import json
+import time
+import shutil
+import signal
+import hashlib
+import threading
+import traceback
 import subprocess
 import argparse
 from time import perf_counter
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from importlib.metadata import version, PackageNotFoundError
 
+from . import variant_delta
+from . import work_queue
+from . import profiler
+
+# the stages being evaluated by the threads, each in its own process group. They are killed when batch_eval stops, as the stages do not
+# receive the SIGINT of the terminal
+STAGE_STATE = {'procs': set(), 'stopped': False, 'lock': threading.Lock()}
 #===================================================================================================
 # region: FUNCTIONS
 #===================================================================================================
@@ -32,6 +49,40 @@ def parse_args():
                         metavar = 'FILE',
                         help = 'The file path of the json measures file that specify which measures to apply to the model')
     
+    parser.add_argument('-w', '--jobs', type = int, default = 1,
+                        metavar = 'NJOBS',
+                        help = 'The number of variants to evaluate at the same time')
+    
+    parser.add_argument('-t', '--timeout', type = float, default = None,
+                        metavar = 'SECONDS',
+                        help = 'The maximum number of seconds to evaluate each variant')
+    
+    parser.add_argument('-f', '--force', action = 'store_true', default=False,
+                        help = 'turn it on to evaluate all the variants even if they have valid results')
+    
+    parser.add_argument('--start', type = int, default = None,
+                        metavar = 'INDEX',
+                        help = 'The index of the first variant to evaluate')
+    
+    parser.add_argument('--stop', type = int, default = None,
+                        metavar = 'INDEX',
+                        help = 'The index of the variant to stop before')
+    
+    parser.add_argument('--shard', type = work_queue.parse_shard, default = None,
+                        metavar = 'i/N',
+                        help = 'Only evaluate the i-th of N shards of the variants, counting from 0, variant k is in shard k %% N')
+    
+    parser.add_argument('--claim', action = 'store_true', default=False,
+                        help = 'turn it on to claim each variant in the results directory before evaluating it, so that several machines sharing the results directory can evaluate the same variants without duplicate work')
+    
+    parser.add_argument('--stale', type = float, default = None,
+                        metavar = 'SECONDS',
+                        help = 'The age after which the claims of other machines are taken over, it needs to be longer than the evaluation of a variant')
+    
+    parser.add_argument('--profile', type = str, default = None,
+                        metavar = 'FILE',
+                        help = 'The file path to record the wall time, cpu time and peak memory of each stage of each variant (.jsonl), see summarize_profile')
+    
     parser.add_argument('-p', '--process', action = 'store_true', default=False,
                         help = 'turn it on if piping in json filepath')
     
@@ -39,9 +90,567 @@ def parse_args():
     args = parser.parse_args()
     return args
 
-def batch_eval_variants(var_dir: str, res_dir: str, epw_path: str, ddy_path: str, measure_path: str):
+def calc_file_hash(file_path: str) -> str:
+    '''
+    Calculate the sha256 hash of a file.
+
+    Parameters
+    ----------
+    file_path: str
+        The file path.
+
+    Returns
+    -------
+    str
+        the hex digest of the file. None if the file path is None.
+    '''
+    if file_path is None:
+        return None
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def calc_ifc_hash(ifc_path: str) -> str:
+    '''
+    Calculate the sha256 hash of the data section of an ifc file. The header is skipped as it records the time the file is written.
+
+    Parameters
+    ----------
+    ifc_path: str
+        The file path of the ifc.
+
+    Returns
+    -------
+    str
+        the hex digest of the data section of the ifc.
+    '''
+    sha = hashlib.sha256()
+    with open(ifc_path, 'rb') as f:
+        head = f.read(1024*1024)
+        data_indx = head.find(b'DATA;')
+        if data_indx == -1:
+            data_indx = 0
+        sha.update(head[data_indx:])
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def calc_ifc_str_hash(ifc_str: str) -> str:
+    '''
+    Calculate the sha256 hash of the data section of an ifc model in memory. Same as calc_ifc_hash of the model written to a file.
+
+    Parameters
+    ----------
+    ifc_str: str
+        the STEP text of the ifc model from ifcopenshell.file.to_string.
+
+    Returns
+    -------
+    str
+        the hex digest of the data section.
+    '''
+    data_indx = ifc_str.find('DATA;')
+    if data_indx == -1:
+        data_indx = 0
+    return hashlib.sha256(ifc_str[data_indx:].encode()).hexdigest()
+
+def get_tool_versions() -> dict:
+    '''
+    Get the versions of the tools used to evaluate the variants.
+
+    Returns
+    -------
+    dict
+        the version of each package, None if the package is not installed.
+    '''
+    versions = {}
+    for pkg_name in ['gendgn', 'ifc2osmod', 'ifc_utils', 'ifcopenshell', 'openstudio']:
+        try:
+            versions[pkg_name] = version(pkg_name)
+        except PackageNotFoundError:
+            versions[pkg_name] = None
+    return versions
+
+def get_res_paths(res_dir: str, filename: str) -> dict:
+    '''
+    Get the paths of the results of a variant.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+
+    Returns
+    -------
+    dict
+        the paths with keys res_dir, log_dir, osm, sql, csv_dir and manifest.
+    '''
+    this_res_dir = Path(res_dir).joinpath(filename)
+    res_paths = {'res_dir': this_res_dir,
+                 'log_dir': this_res_dir.joinpath('logs'),
+                 'osm': this_res_dir.joinpath(f"{filename}.osm"),
+                 'sql': this_res_dir.joinpath(f"{filename}_wrkflw", 'run', 'eplusout.sql'),
+                 'csv_dir': this_res_dir.joinpath('csv'),
+                 'manifest': this_res_dir.joinpath('manifest.json')}
+    return res_paths
+
+def create_manifest(ifc_path: str, input_hashes: dict, versions: dict, ifc_hash: str = None) -> dict:
+    '''
+    Create the manifest of a variant that records everything that affects its results.
+
+    Parameters
+    ----------
+    ifc_path: str
+        The file path of the design variant, an ifc or a delta encoded variant (.ifcdelta.json).
+
+    input_hashes: dict
+        the hashes of the epw, ddy and measure files that are shared by all the variants.
+
+    versions: dict
+        dictionary generated from get_tool_versions.
+
+    ifc_hash: str, optional
+        the hash of the variant from calc_ifc_str_hash, for variants that are not written to a file. If specified ifc_path is not read.
+
+    Returns
+    -------
+    dict
+        - inputs: the hashes of the input files and the evaluation options
+        - versions: the versions of the tools
+        - key: the hash of the inputs and versions, variants with the same key have the same results
+    '''
+    if ifc_hash is None:
+        if ifc_path.endswith(variant_delta.DELTA_SUFFIX):
+            try:
+                ifc_hash = variant_delta.calc_delta_hash(ifc_path)
+            except Exception:
+                # the delta cannot be materialized and eval_variant fails it, key it on the delta file so its manifest can still be written
+                ifc_hash = calc_file_hash(ifc_path)
+        else:
+            ifc_hash = calc_ifc_hash(ifc_path)
+    inputs = {'ifc': ifc_hash}
+    inputs.update(input_hashes)
+    inputs['btype'] = 'Small Office'
+    inputs['climate'] = '1A'
+    key_str = json.dumps({'inputs': inputs, 'versions': versions}, sort_keys=True)
+    key = hashlib.sha256(key_str.encode()).hexdigest()
+    manifest = {'inputs': inputs, 'versions': versions, 'key': key}
+    return manifest
+
+def is_res_valid(res_dir: str, filename: str, manifest: dict = None) -> bool:
+    '''
+    Check if the variant has valid results.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+
+    manifest: dict, optional
+        dictionary generated from create_manifest. If specified the stored manifest needs to have the same key.
+
+    Returns
+    -------
+    bool
+        True if the stored manifest succeeded, the sql and csv exist.
+    '''
+    res_paths = get_res_paths(res_dir, filename)
+    if not res_paths['manifest'].exists():
+        return False
+    try:
+        with open(res_paths['manifest']) as f:
+            stored_manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return False
+    if stored_manifest.get('status') != 'succeeded':
+        return False
+    if manifest is not None and stored_manifest.get('key') != manifest['key']:
+        return False
+    if not res_paths['sql'].exists():
+        return False
+    csv_dir = res_paths['csv_dir']
+    if not csv_dir.exists() or not any(csv_dir.glob('*.csv')):
+        return False
+    return True
+
+def write_manifest(res_dir: str, filename: str, manifest: dict, status: str, source: str = None):
+    '''
+    Write the manifest of the variant into its results directory.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+
+    manifest: dict
+        dictionary generated from create_manifest.
+
+    status: str
+        the status of the evaluation.
+
+    source: str, optional
+        the name of the variant the results are copied from.
+    '''
+    res_paths = get_res_paths(res_dir, filename)
+    res_paths['res_dir'].mkdir(parents=True, exist_ok=True)
+    manifest = dict(manifest)
+    manifest['status'] = status
+    if source is not None:
+        manifest['source'] = source
+    pretty_json_data = json.dumps(manifest, indent=4)
+    with open(res_paths['manifest'], 'w') as f:
+        f.write(pretty_json_data)
+
+def copy_res(res_dir: str, src_name: str, dst_name: str):
+    '''
+    Copy the results of a variant to another byte-identical variant.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    src_name: str
+        The name of the evaluated variant.
+
+    dst_name: str
+        The name of the variant to copy the results to.
     '''
-    Execute a parameteric model and generate a variant.
+    src_paths = get_res_paths(res_dir, src_name)
+    dst_paths = get_res_paths(res_dir, dst_name)
+    dst_paths['sql'].parent.mkdir(parents=True, exist_ok=True)
+    dst_paths['csv_dir'].mkdir(parents=True, exist_ok=True)
+    shutil.copy2(src_paths['sql'], dst_paths['sql'])
+    # the csv are named after the workflow of the variant
+    src_prefix = f"{src_name}_wrkflw"
+    dst_prefix = f"{dst_name}_wrkflw"
+    for src_csv in src_paths['csv_dir'].glob('*.csv'):
+        dst_csv_name = src_csv.name.replace(src_prefix, dst_prefix, 1)
+        shutil.copy2(src_csv, dst_paths['csv_dir'].joinpath(dst_csv_name))
+
+def kill_procs(procs: list[subprocess.Popen]):
+    '''
+    Kill the processes and all their child processes.
+
+    Parameters
+    ----------
+    procs: list[subprocess.Popen]
+        The processes to kill. The processes need to be started with start_new_session=True, e.g. with start_stage.
+
+    '''
+    for proc in procs:
+        if proc.poll() is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        proc.wait()
+
+def start_stage(call_list: list[str], **kwargs) -> subprocess.Popen:
+    '''
+    Start a stage of the evaluation of a variant in its own process group, and register it so that stop_stages kills it.
+
+    Parameters
+    ----------
+    call_list: list[str]
+        the command of the stage.
+
+    **kwargs
+        the other arguments of subprocess.Popen, e.g. stdin, stdout and stderr.
+
+    Returns
+    -------
+    subprocess.Popen
+        the process of the stage.
+    '''
+    with STAGE_STATE['lock']:
+        if STAGE_STATE['stopped']:
+            raise InterruptedError(f"batch_eval is stopped, {call_list[0]} is not started")
+        proc = subprocess.Popen(call_list, start_new_session=True, **kwargs)
+        STAGE_STATE['procs'].add(proc)
+    return proc
+
+def release_stages(procs: list[subprocess.Popen]):
+    '''
+    Kill the stages that are still running and unregister them.
+
+    Parameters
+    ----------
+    procs: list[subprocess.Popen]
+        the processes started with start_stage.
+
+    '''
+    kill_procs(procs)
+    with STAGE_STATE['lock']:
+        STAGE_STATE['procs'].difference_update(procs)
+
+def stop_stages():
+    '''
+    Kill the process groups of all the stages being evaluated, and stop the threads from starting new stages.
+    '''
+    with STAGE_STATE['lock']:
+        STAGE_STATE['stopped'] = True
+        procs = list(STAGE_STATE['procs'])
+    kill_procs(procs)
+
+def eval_variant(ifc_path: str, res_dir: str, epw_path: str, ddy_path: str, measure_path: str, timeout: float = None) -> dict:
+    '''
+    Convert a variant to openstudio model, simulate it and export the results to csv. The stdout and stderr of each stage are written to the logs directory of the variant.
+    A delta encoded variant is materialized into the results directory for the conversion and removed afterwards, a variant that fails to materialize
+    is failed with the materialize returncode and log.
+
+    Parameters
+    ----------
+    ifc_path: str
+        The file path of the design variant, an ifc or a delta encoded variant (.ifcdelta.json).
+
+    res_dir : str
+        The path of the results directory.
+    
+    epw_path : str
+        The file path of the weather file.
+
+    ddy_path : str
+        The file path of the ddy design day file.
+
+    measure_path : str
+        The file path of the measures that will be applied to the model.
+
+    timeout : float, optional
+        The maximum number of seconds to evaluate the variant. Default = None, no timeout.
+
+    Returns
+    -------
+    dict
+        - name: the name of the variant
+        - status: 'succeeded', 'failed' or 'timeout'
+        - returncodes: the return code of each stage
+        - mins: the time taken in minutes
+    '''
+    t1 = perf_counter()
+    filename = variant_delta.get_variant_name(ifc_path)
+    res_paths = get_res_paths(res_dir, filename)
+    this_res_dir = res_paths['res_dir']
+    this_res_dir.mkdir(parents=True, exist_ok=True)
+    log_dir = res_paths['log_dir']
+    log_dir.mkdir(parents=True, exist_ok=True)
+    osm_path = res_paths['osm']
+    sql_path = res_paths['sql']
+    csv_dir = res_paths['csv_dir']
+    csv_dir.mkdir(parents=True, exist_ok=True)
+    # remove the results of the previous evaluation so that a crash cannot leave stale results behind
+    if res_paths['manifest'].exists():
+        res_paths['manifest'].unlink()
+    if sql_path.exists():
+        sql_path.unlink()
+
+    delta_path = None
+    if ifc_path.endswith(variant_delta.DELTA_SUFFIX):
+        delta_path = ifc_path
+        ifc_path = str(this_res_dir.joinpath(f"{filename}.ifc"))
+
+    call_list1 = ['ifcarch2osmod', '-i', ifc_path, '-o', str(osm_path)]
+    call_list2 = ['add_sch2osmod', '-p', '-b', 'Small Office', '-c', '1A']
+    call_list3 = ['execute_osmod', '-p', '-e', epw_path, '-d', ddy_path, '-m', measure_path, '-out', str(this_res_dir)]
+    call_list4 = ['epsql2csv', '-s', str(sql_path), '-r', str(csv_dir)]
+
+    status = 'succeeded'
+    returncodes = {}
+    procs = []
+    log_files = [open(log_dir.joinpath(f"{call_list[0]}.log"), 'w') for call_list in [call_list1, call_list2, call_list3, call_list4]]
+    try:
+        if delta_path is not None:
+            # a bad delta only fails this variant, e.g. it is generated from another base model, it is truncated or the disk is full
+            with open(log_dir.joinpath('materialize.log'), 'w') as log_file:
+                try:
+                    with profiler.profile_stage('materialize', variant=filename):
+                        variant_delta.materialize_variant(delta_path, ifc_path)
+                    returncodes['materialize'] = 0
+                except Exception:
+                    traceback.print_exc(file=log_file)
+                    returncodes['materialize'] = 1
+                    status = 'failed'
+
+        if status == 'succeeded':
+            # the stdout of the conversion stages is piped into the next stage, only the last stage writes its stdout to the log
+            procs_ts = time.time()
+            process1 = start_stage(call_list1, stdout=subprocess.PIPE, stderr=log_files[0])
+            procs.append(process1)
+            process2 = start_stage(call_list2, stdin=process1.stdout, stdout=subprocess.PIPE, stderr=log_files[1])
+            procs.append(process2)
+            process1.stdout.close()
+            process3 = start_stage(call_list3, stdin=process2.stdout, stdout=log_files[2], stderr=subprocess.STDOUT)
+            procs.append(process3)
+            process2.stdout.close()
+            try:
+                if profiler.is_enabled():
+                    # the stages run at the same time, each stage is recorded from the start of the pipe to its end
+                    usages = profiler.wait_procs(procs, timeout=timeout)
+                    profiler.record_procs(procs, usages, procs_ts, variant=filename)
+                else:
+                    process3.wait(timeout=timeout)
+                    for proc in procs:
+                        proc.wait()
+            except subprocess.TimeoutExpired:
+                kill_procs(procs)
+                status = 'timeout'
+
+        for proc, call_list in zip(procs, [call_list1, call_list2, call_list3]):
+            returncodes[call_list[0]] = proc.returncode
+
+        if status == 'succeeded':
+            remaining = None
+            if timeout is not None:
+                remaining = max(timeout - (perf_counter() - t1), 0)
+            procs_ts = time.time()
+            process4 = start_stage(call_list4, stdout=log_files[3], stderr=subprocess.STDOUT)
+            procs.append(process4)
+            try:
+                if profiler.is_enabled():
+                    usages = profiler.wait_procs([process4], timeout=remaining)
+                    profiler.record_procs([process4], usages, procs_ts, variant=filename)
+                else:
+                    process4.wait(timeout=remaining)
+            except subprocess.TimeoutExpired:
+                kill_procs([process4])
+                status = 'timeout'
+            returncodes[call_list4[0]] = process4.returncode
+
+        if status == 'succeeded':
+            rc_vals = returncodes.values()
+            if any(rc != 0 for rc in rc_vals) or not sql_path.exists():
+                status = 'failed'
+    except OSError as e:
+        log_files[0].write(f"An error occurred: {e}\n")
+        status = 'failed'
+    finally:
+        release_stages(procs)
+        for log_file in log_files:
+            log_file.close()
+        if delta_path is not None and os.path.exists(ifc_path):
+            os.remove(ifc_path)
+
+    t2 = perf_counter()
+    t21 = round((t2-t1)/60, 1)
+    return {'name': filename, 'status': status, 'returncodes': returncodes, 'mins': t21}
+
+def get_stored_status(res_dir: str, filename: str, manifest: dict = None, since: float = None) -> str:
+    '''
+    Get the status of the stored manifest of the variant if it is written since a time, e.g. the variant is evaluated by another machine during this run.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+
+    manifest: dict, optional
+        dictionary generated from create_manifest, the stored manifest needs to have the same key. Default to any key.
+
+    since: float, optional
+        the time in seconds since the epoch. Default to any time.
+
+    Returns
+    -------
+    str
+        the status of the stored manifest, None if there is no manifest with the same key written since.
+    '''
+    manifest_path = get_res_paths(res_dir, filename)['manifest']
+    try:
+        with open(manifest_path) as f:
+            stored_manifest = json.load(f)
+        mtime = manifest_path.stat().st_mtime
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest is not None and stored_manifest.get('key') != manifest['key']:
+        return None
+    if since is not None and mtime < since:
+        return None
+    return stored_manifest.get('status')
+
+def claim_eval_variant(ifc_path: str, res_dir: str, epw_path: str, ddy_path: str, measure_path: str, manifest: dict, timeout: float = None,
+                       force: bool = False, stale_secs: float = None, since: float = None) -> dict:
+    '''
+    Claim a variant in the results directory, evaluate it and write its manifest before releasing the claim. The variant is skipped if another
+    process has claimed it or has evaluated it since the start of this run.
+
+    Parameters
+    ----------
+    ifc_path: str
+        The file path of the design variant, an ifc or a delta encoded variant (.ifcdelta.json).
+
+    res_dir : str
+        The path of the results directory.
+
+    epw_path : str
+        The file path of the weather file.
+
+    ddy_path : str
+        The file path of the ddy design day file.
+
+    measure_path : str
+        The file path of the measures that will be applied to the model.
+
+    manifest: dict
+        dictionary generated from create_manifest.
+
+    timeout : float, optional
+        The maximum number of seconds to evaluate the variant. Default = None, no timeout.
+
+    force : bool, optional
+        If True evaluate the variant even if it has valid results from before this run. Default = False.
+
+    stale_secs: float, optional
+        the age in seconds after which the claims of the other machines are taken over, see work_queue.claim_variant. Default to never.
+
+    since: float, optional
+        the start time of this run in seconds since the epoch. Default to evaluate the variant again if it failed on another machine.
+
+    Returns
+    -------
+    dict
+        the result of eval_variant, with the status 'claimed' if another process has claimed the variant and 'cached' if it is evaluated.
+    '''
+    filename = variant_delta.get_variant_name(ifc_path)
+    if not work_queue.claim_variant(res_dir, filename, stale_secs=stale_secs):
+        return {'name': filename, 'status': 'claimed', 'returncodes': {}, 'mins': 0.0}
+    try:
+        # another process may have evaluated the variant before it is claimed
+        if not force and is_res_valid(res_dir, filename, manifest=manifest):
+            return {'name': filename, 'status': 'cached', 'returncodes': {}, 'mins': 0.0}
+        if since is not None:
+            stored_status = get_stored_status(res_dir, filename, manifest, since)
+            if stored_status is not None:
+                # the failed variants are not evaluated again by each machine
+                status = 'cached' if stored_status == 'succeeded' else stored_status
+                return {'name': filename, 'status': status, 'returncodes': {}, 'mins': 0.0}
+        print(f"executing openstudio model ... {filename}")
+        var_res = eval_variant(ifc_path, res_dir, epw_path, ddy_path, measure_path, timeout=timeout)
+        write_manifest(res_dir, filename, manifest, var_res['status'])
+    finally:
+        work_queue.release_variant(res_dir, filename)
+    return var_res
+
+def batch_eval_variants(var_dir: str, res_dir: str, epw_path: str, ddy_path: str, measure_path: str, njobs: int = 1, 
+                        timeout: float = None, force: bool = False, start: int = None, stop: int = None, shard: tuple[int, int] = None,
+                        claim: bool = False, stale_secs: float = None, profile_path: str = None) -> dict:
+    '''
+    Execute a parameteric model and generate a variant. Variants with valid results from a previous evaluation are skipped and 
+    byte-identical variants are only evaluated once. Several machines sharing the results directory can evaluate the variants together,
+    either each its own start, stop or shard of the variants, or all the variants with claim so that each variant is evaluated by one machine.
 
     Parameters
     ----------
@@ -59,53 +668,155 @@ def batch_eval_variants(var_dir: str, res_dir: str, epw_path: str, ddy_path: str
 
     measure_path : str
         The file path of the measures that will be applied to the model.
-    
+
+    njobs : int, optional
+        The number of variants evaluated at the same time. Default = 1.
+
+    timeout : float, optional
+        The maximum number of seconds to evaluate each variant. Default = None, no timeout.
+
+    force : bool, optional
+        If True evaluate all the variants even if they have valid results. Default = False.
+
+    start : int, optional
+        The index of the first variant to evaluate, see work_queue.select_indices. Default to the first variant.
+
+    stop : int, optional
+        The index of the variant to stop before. Default to after the last variant.
+
+    shard : tuple[int, int], optional
+        The index of the shard and the number of shards to evaluate, see work_queue.parse_shard. Default to all the variants.
+
+    claim : bool, optional
+        If True claim each variant in the results directory before evaluating it, see work_queue.claim_variant. Default = False.
+
+    stale_secs : float, optional
+        The age in seconds after which the claims of other machines are taken over. Default to never.
+
+    profile_path : str, optional
+        The file path to record the wall time, cpu time and peak memory of each stage of each variant, see profiler.enable_profile.
+        Default to not record.
+
+    Returns
+    -------
+    dict
+        - succeeded: the names of the variants that have valid results
+        - failed: the names of the variants that failed or timeout
+        - claimed: the names of the variants claimed by other processes
+        - variants: the result of each variant, with the status 'succeeded', 'cached', 'duplicate', 'claimed', 'failed' or 'timeout'
+        The summary is written to batch_eval_summary.json, or batch_eval_summary_{host}_{pid}.json when the variants are shared with other machines.
     '''
-    filesx = Path(var_dir).glob('*.ifc')
+    filesx = list(Path(var_dir).glob('*.ifc')) + list(Path(var_dir).glob(f"*{variant_delta.DELTA_SUFFIX}"))
     filesx = sorted(filesx)
+    prev_profile_path = profiler.PROFILE_STATE['path']
+    if profile_path is not None:
+        prev_profile_path = profiler.enable_profile(profile_path)
+    is_shared = claim or start is not None or stop is not None or shard is not None
+    if start is not None or stop is not None or shard is not None:
+        # select by the index of the variant so that the same variants are selected as by exe_wwr_constr, other files keep their position
+        var_indices = []
+        for fcnt, filex in enumerate(filesx):
+            var_indx = variant_delta.get_variant_indx(variant_delta.get_variant_name(filex))
+            var_indices.append(fcnt if var_indx is None else var_indx)
+        selected = set(work_queue.select_indices(var_indices, start=start, stop=stop, shard=shard))
+        filesx = [filex for filex, var_indx in zip(filesx, var_indices) if var_indx in selected]
     res_dir_pobj = Path(res_dir)
-    call_list1 = ['ifcarch2osmod', '-i', '', '-o', '' ]
-    call_list2 = ['add_sch2osmod', '-p', '-b', 'Small Office', '-c', '1A' ]
-    call_list3 = ['execute_osmod', '-p', '-e', epw_path, '-d', ddy_path, '-m', measure_path, '-out', '']
-    call_list4 = ['epsql2csv', '-s', '', '-r', '']
+    res_dir_pobj.mkdir(parents=True, exist_ok=True)
 
     t1 = perf_counter()
-    for filex in filesx:
-        t2 = perf_counter()
-        filename = filex.stem
-        this_res_dir = res_dir_pobj.joinpath(filename)
-        this_res_dir.mkdir(parents=True, exist_ok=True)
-        path_str = str(filex)
-        call_list1[2] = path_str
-        osm_path = this_res_dir.joinpath(f"{filename}.osm")
-        call_list1[4] = str(osm_path)
-        call_list3[9] = str(this_res_dir)
-        
-        sql_path = this_res_dir.joinpath(f"{filename}_wrkflw", 'run', 'eplusout.sql')
-        csv_dir = this_res_dir.joinpath('csv')
-        csv_dir.mkdir(parents=True, exist_ok=True)
-        call_list4[2] = str(sql_path)
-        call_list4[4] = str(csv_dir)
-        print(f"executing openstudio model ... {filename}")
+    since = time.time()
+    input_hashes = {'epw': calc_file_hash(epw_path), 'ddy': calc_file_hash(ddy_path), 'measure': calc_file_hash(measure_path)}
+    versions = get_tool_versions()
+    var_res_ls = []
+    with STAGE_STATE['lock']:
+        STAGE_STATE['stopped'] = False
+    with ThreadPoolExecutor(max_workers=max(njobs, 1)) as executor:
         try:
-            process1 = subprocess.Popen(call_list1, stdout=subprocess.PIPE)
-            process2 = subprocess.Popen(call_list2, stdin=process1.stdout, stdout=subprocess.PIPE)
-            process3 = subprocess.Popen(call_list3, stdin=process2.stdout, stdout=subprocess.PIPE)
-            output = process3.communicate()[0]
-            print(output.decode())
-        except subprocess.CalledProcessError as e:
-            print("An error occurred:", e)
-
-        res = subprocess.run(call_list4, capture_output=True, text=True)
-        print(res.stdout)
-        print(res.stderr)
-        t3 = perf_counter()
-        t32 = round((t3-t2)/60, 1)
-        print(f"{t32} mins")
-
-    t4 = perf_counter()
-    t41 = round((t4 - t1)/60, 1)
-    print(f"{t41} mins")
+            with profiler.profile_stage('create_manifests'):
+                manifests = list(executor.map(lambda filex: create_manifest(str(filex), input_hashes, versions), filesx))
+            # index the valid results of the previous evaluations
+            key2name = {}
+            if not force:
+                for manifest_path in sorted(res_dir_pobj.glob('*/manifest.json')):
+                    name = manifest_path.parent.name
+                    try:
+                        with open(manifest_path) as f:
+                            stored_key = json.load(f).get('key')
+                    except (OSError, json.JSONDecodeError):
+                        continue
+                    if stored_key not in key2name and is_res_valid(res_dir, name):
+                        key2name[stored_key] = name
+
+            futures = {}
+            duplicates = []
+            for filex, manifest in zip(filesx, manifests):
+                filename = variant_delta.get_variant_name(filex)
+                key = manifest['key']
+                if not force and is_res_valid(res_dir, filename, manifest=manifest):
+                    var_res_ls.append({'name': filename, 'status': 'cached', 'returncodes': {}, 'mins': 0.0})
+                elif key in key2name:
+                    # a byte-identical variant is already evaluated or scheduled
+                    duplicates.append((filename, key2name[key], manifest))
+                elif claim:
+                    # the variant is claimed when a thread is free to evaluate it, so the other machines can take the rest
+                    future = executor.submit(claim_eval_variant, str(filex), res_dir, epw_path, ddy_path, measure_path, manifest, timeout=timeout,
+                                             force=force, stale_secs=stale_secs, since=since)
+                    futures[future] = manifest
+                    key2name[key] = filename
+                else:
+                    print(f"executing openstudio model ... {filename}")
+                    future = executor.submit(eval_variant, str(filex), res_dir, epw_path, ddy_path, measure_path, timeout=timeout)
+                    futures[future] = manifest
+                    key2name[key] = filename
+
+            name2status = {}
+            for future in as_completed(futures):
+                var_res = future.result()
+                if not claim:
+                    write_manifest(res_dir, var_res['name'], futures[future], var_res['status'])
+                print(f"{var_res['name']} {var_res['status']} {var_res['mins']} mins")
+                name2status[var_res['name']] = var_res['status']
+                var_res_ls.append(var_res)
+        finally:
+            # also on Ctrl-C, the stages run in their own sessions and would keep running after batch_eval exits
+            executor.shutdown(wait=False, cancel_futures=True)
+            stop_stages()
+
+    for filename, src_name, manifest in duplicates:
+        status = name2status.get(src_name, 'succeeded')
+        if status in ['succeeded', 'cached']:
+            if claim and not work_queue.claim_variant(res_dir, filename, stale_secs=stale_secs):
+                status = 'claimed'
+            else:
+                copy_res(res_dir, src_name, filename)
+                write_manifest(res_dir, filename, manifest, 'succeeded', source=src_name)
+                status = 'duplicate'
+                if claim:
+                    work_queue.release_variant(res_dir, filename)
+        var_res_ls.append({'name': filename, 'status': status, 'returncodes': {}, 'mins': 0.0, 'source': src_name})
+
+    var_res_ls = sorted(var_res_ls, key=lambda var_res: var_res['name'])
+    succeeded = [var_res['name'] for var_res in var_res_ls if var_res['status'] in ['succeeded', 'cached', 'duplicate']]
+    claimed = [var_res['name'] for var_res in var_res_ls if var_res['status'] == 'claimed']
+    failed = [var_res['name'] for var_res in var_res_ls if var_res['name'] not in succeeded and var_res['name'] not in claimed]
+    summary = {'succeeded': succeeded, 'failed': failed, 'claimed': claimed, 'variants': var_res_ls}
+    summary_name = 'batch_eval_summary.json'
+    if is_shared:
+        # each machine writes its own summary
+        summary_name = f"batch_eval_summary_{work_queue.get_worker_id()}.json"
+    pretty_json_data = json.dumps(summary, indent=4)
+    with open(res_dir_pobj.joinpath(summary_name), 'w') as f:
+        f.write(pretty_json_data)
+
+    t2 = perf_counter()
+    t21 = round((t2 - t1)/60, 1)
+    ncached = len([var_res for var_res in var_res_ls if var_res['status'] in ['cached', 'duplicate']])
+    print(f"{len(succeeded)} succeeded ({ncached} from cache), {len(failed)} failed, {len(claimed)} claimed by other processes")
+    for name in failed:
+        print(f"failed: {name}, see {res_dir_pobj.joinpath(name, 'logs')}")
+    print(f"{t21} mins")
+    profiler.enable_profile(prev_profile_path)
+    return summary
     
 def main():
     args = parse_args()
@@ -122,7 +833,20 @@ def main():
     epw_path = str(Path(args.epw).resolve())
     ddy_path = str(Path(args.ddy).resolve())
     mea_path = str(Path(args.measure).resolve())
-    batch_eval_variants(var_dir, res_dir, epw_path, ddy_path, mea_path)
+    njobs = args.jobs
+    timeout = args.timeout
+    force = args.force
+    profile_path = args.profile
+    if profile_path is not None:
+        profile_path = str(Path(profile_path).resolve())
+    try:
+        batch_eval_variants(var_dir, res_dir, epw_path, ddy_path, mea_path, njobs=njobs, timeout=timeout, force=force, start=args.start,
+                            stop=args.stop, shard=args.shard, claim=args.claim, stale_secs=args.stale,
+                            profile_path=profile_path)
+    except KeyboardInterrupt:
+        # the running stages are killed by batch_eval_variants, the variants evaluated so far keep their results
+        print("batch_eval is interrupted, the running simulations are stopped", file=sys.stderr)
+        sys.exit(130)
     # make sure this output can be piped into another command on the cmd
     print(res_dir)
     sys.stdout.flush()
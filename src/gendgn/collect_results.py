@@ -0,0 +1,313 @@
+import sys
+import json
+import sqlite3
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from . import batch_eval
+from . import pmtrc_utils
+from . import variant_delta
+
+# kept for the callers of collect_results.get_variant_indx, moved to variant_delta so that batch_eval does not import collect_results
+get_variant_indx = variant_delta.get_variant_indx
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Collect the simulation results of all the variants into a columnar results store")
+
+    # defining arguments for parser object
+    parser.add_argument('-r', '--res', type = str,
+                        metavar = 'DIR',
+                        help = 'The directory path of the results generated by batch_eval')
+
+    parser.add_argument('-j', '--json', type = str, default = None,
+                        metavar = 'FILE',
+                        help = 'The file path of the json parametric file with the parameter values of the variants')
+
+    parser.add_argument('-o', '--out', type = str, default = None,
+                        metavar = 'DIR',
+                        help = 'The directory path of the results store. Default is the results_store directory in the results directory')
+
+    parser.add_argument('-p', '--process', action = 'store_true', default=False,
+                        help = 'turn it on if piping in the results directory')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def read_sql_scalars(sql_path: str) -> dict:
+    '''
+    Read the annual building performance summary from the EP+ sql file.
+
+    Parameters
+    ----------
+    sql_path: str
+        The file path of the eplusout.sql.
+
+    Returns
+    -------
+    dict
+        dictionary with keys '{row name}:{column name}' of the Site and Source Energy table, each with keys value and units.
+    '''
+    query = '''SELECT RowName, ColumnName, Units, Value FROM TabularDataWithStrings
+               WHERE ReportName = 'AnnualBuildingUtilityPerformanceSummary' AND TableName = 'Site and Source Energy' '''
+    scalars = {}
+    with sqlite3.connect(f"file:{sql_path}?mode=ro", uri=True) as conn:
+        for row_name, col_name, units, val in conn.execute(query):
+            try:
+                val = float(val)
+            except (TypeError, ValueError):
+                continue
+            scalars[f"{row_name.strip()}:{col_name.strip()}"] = {'value': val, 'units': units}
+    return scalars
+
+def read_sql_timeseries(sql_path: str) -> dict:
+    '''
+    Read the time series reported for the weather file run period from the EP+ sql file.
+
+    Parameters
+    ----------
+    sql_path: str
+        The file path of the eplusout.sql.
+
+    Returns
+    -------
+    dict
+        dictionary with keys '{key value}:{name}:{reporting frequency}', each with keys values np.ndarray[shape(ntimesteps)] and units.
+    '''
+    dict_query = '''SELECT ReportDataDictionaryIndex, KeyValue, Name, ReportingFrequency, Units FROM ReportDataDictionary'''
+    data_query = '''SELECT ReportData.ReportDataDictionaryIndex, ReportData.Value FROM ReportData
+                    JOIN Time ON ReportData.TimeIndex = Time.TimeIndex
+                    JOIN EnvironmentPeriods ON Time.EnvironmentPeriodIndex = EnvironmentPeriods.EnvironmentPeriodIndex
+                    WHERE EnvironmentPeriods.EnvironmentType = 3 AND (Time.WarmupFlag IS NULL OR Time.WarmupFlag = 0)
+                    ORDER BY ReportData.ReportDataDictionaryIndex, ReportData.TimeIndex'''
+    timeseries = {}
+    with sqlite3.connect(f"file:{sql_path}?mode=ro", uri=True) as conn:
+        dict_rows = conn.execute(dict_query).fetchall()
+        rd_dicts = {}
+        for rdd_indx, key_val, name, freq, units in dict_rows:
+            # meters do not have a key value
+            if key_val:
+                ts_name = f"{key_val}:{name}:{freq}"
+            else:
+                ts_name = f"{name}:{freq}"
+            rd_dicts[rdd_indx] = {'name': ts_name, 'units': units}
+        data = np.array(conn.execute(data_query).fetchall(), dtype=float)
+
+    if data.size == 0:
+        return timeseries
+    rdd_indxs = data[:,0].astype(int)
+    vals = data[:,1]
+    # the rows are ordered by the dictionary index, split them into each time series
+    uniq_indxs, starts = np.unique(rdd_indxs, return_index=True)
+    ends = np.append(starts[1:], len(rdd_indxs))
+    for rdd_indx, start, end in zip(uniq_indxs, starts, ends):
+        rd_dict = rd_dicts[int(rdd_indx)]
+        timeseries[rd_dict['name']] = {'values': vals[start:end], 'units': rd_dict['units']}
+    return timeseries
+
+def collect_results(res_dir: str, store_dir: str, pmtrc_path: str = None) -> dict:
+    '''
+    Stream the eplusout.sql of each variant with valid results into a columnar results store. Each column is a .npy file with one row per variant
+    that can be loaded with memory mapping. The parameter values of the variants are stored with the same row order.
+
+    Parameters
+    ----------
+    res_dir: str
+        The directory path of the results generated by batch_eval.
+
+    store_dir: str
+        The directory path of the results store.
+
+    pmtrc_path: str, optional
+        The file path of the json parametric model with the parameter values of the variants.
+
+    Returns
+    -------
+    dict
+        the index of the results store, also written to index.json in the store directory.
+    '''
+    res_dir_pobj = Path(res_dir)
+    store_dir_pobj = Path(store_dir)
+    store_dir_pobj.mkdir(parents=True, exist_ok=True)
+    # find all the variants with valid simulation results, the sql of a failed, timed out or stale evaluation is left out
+    variants = []
+    for var_dir in res_dir_pobj.iterdir():
+        if var_dir.is_dir():
+            filename = var_dir.name
+            var_indx = variant_delta.get_variant_indx(filename)
+            if var_indx is not None and batch_eval.is_res_valid(res_dir, filename):
+                sql_path = batch_eval.get_res_paths(res_dir, filename)['sql']
+                variants.append((var_indx, filename, sql_path))
+    variants = sorted(variants)
+    nvariants = len(variants)
+    var_indxs = np.array([variant[0] for variant in variants], dtype=int)
+    np.save(store_dir_pobj.joinpath('variant_index.npy'), var_indxs)
+
+    scalar_names = []
+    scalar_units = []
+    scalar_rows = []
+    ts_cols = {}
+    for vcnt, (var_indx, filename, sql_path) in enumerate(variants):
+        scalars = read_sql_scalars(str(sql_path))
+        scalar_row = np.full(len(scalar_names), np.nan)
+        for name, scalar in scalars.items():
+            if name not in scalar_names:
+                scalar_names.append(name)
+                scalar_units.append(scalar['units'])
+                scalar_row = np.append(scalar_row, np.nan)
+            scalar_row[scalar_names.index(name)] = scalar['value']
+        scalar_rows.append(scalar_row)
+
+        timeseries = read_sql_timeseries(str(sql_path))
+        for name, ts in timeseries.items():
+            if name not in ts_cols:
+                ts_file = f"ts_{len(ts_cols)}.npy"
+                # write the column straight into a memory mapped file so that only one variant is kept in memory
+                ts_arr = np.lib.format.open_memmap(store_dir_pobj.joinpath(ts_file), mode='w+', dtype=float,
+                                                   shape=(nvariants, len(ts['values'])))
+                ts_arr[:] = np.nan
+                ts_cols[name] = {'file': ts_file, 'units': ts['units'], 'array': ts_arr}
+            ts_arr = ts_cols[name]['array']
+            if ts_arr.shape[1] == len(ts['values']):
+                ts_arr[vcnt] = ts['values']
+            else:
+                print(f"{filename} {name} has {len(ts['values'])} timesteps instead of {ts_arr.shape[1]}, skipped")
+
+    for ts_col in ts_cols.values():
+        ts_col['array'].flush()
+        del ts_col['array']
+
+    scalar_arr = np.full((nvariants, len(scalar_names)), np.nan)
+    for vcnt, scalar_row in enumerate(scalar_rows):
+        scalar_arr[vcnt, :len(scalar_row)] = scalar_row
+    np.save(store_dir_pobj.joinpath('scalars.npy'), scalar_arr)
+
+    # join the parameters of the variants
+    pmtr_names = []
+    if pmtrc_path is not None:
+        pmtrc_mod = pmtrc_utils.read_pmtrc_json(pmtrc_path, validate=False)
+        pmtr_names = list(pmtrc_mod['parameters'].keys())
+        for key in ['parameter_values', 'parameter_normalized_values']:
+            if key in pmtrc_mod:
+                # the sidecars are memory mapped, only the rows of the variants are read
+                pmtr_vals = np.asarray(pmtrc_mod[key], dtype=float)
+                pmtr_arr = np.full((nvariants, len(pmtr_names)), np.nan)
+                is_valid = var_indxs < len(pmtr_vals)
+                pmtr_arr[is_valid] = pmtr_vals[var_indxs[is_valid]]
+                np.save(store_dir_pobj.joinpath(f"{key}.npy"), pmtr_arr)
+
+    store_index = {'variants': [variant[1] for variant in variants],
+                   'parameters': pmtr_names,
+                   'scalars': [{'name': name, 'units': units} for name, units in zip(scalar_names, scalar_units)],
+                   'timeseries': [{'name': name, 'units': ts_col['units'], 'file': ts_col['file']} for name, ts_col in ts_cols.items()]}
+    pretty_json_data = json.dumps(store_index, indent=4)
+    with open(store_dir_pobj.joinpath('index.json'), 'w') as f:
+        f.write(pretty_json_data)
+
+    write_parquet(store_dir, store_index)
+    return store_index
+
+def write_parquet(store_dir: str, store_index: dict) -> bool:
+    '''
+    Write the scalars and parameters of the results store into a parquet table if pyarrow is available.
+
+    Parameters
+    ----------
+    store_dir: str
+        The directory path of the results store.
+
+    store_index: dict
+        dictionary generated from collect_results.
+
+    Returns
+    -------
+    bool
+        True if the parquet file is written.
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return False
+    store_dir_pobj = Path(store_dir)
+    cols = {'variant_index': np.load(store_dir_pobj.joinpath('variant_index.npy'))}
+    scalar_arr = np.load(store_dir_pobj.joinpath('scalars.npy'))
+    for scnt, scalar in enumerate(store_index['scalars']):
+        cols[scalar['name']] = scalar_arr[:, scnt]
+    pmtr_val_path = store_dir_pobj.joinpath('parameter_values.npy')
+    if pmtr_val_path.exists():
+        pmtr_arr = np.load(pmtr_val_path)
+        for pcnt, pmtr_name in enumerate(store_index['parameters']):
+            cols[pmtr_name] = pmtr_arr[:, pcnt]
+    pq.write_table(pa.table(cols), store_dir_pobj.joinpath('results.parquet'))
+    return True
+
+def load_results_store(store_dir: str) -> dict:
+    '''
+    Load the results store with memory mapping.
+
+    Parameters
+    ----------
+    store_dir: str
+        The directory path of the results store.
+
+    Returns
+    -------
+    dict
+        - index: the index of the results store
+        - variant_index: np.ndarray[shape(nvariants)] the index of each variant
+        - scalars: dictionary of np.ndarray[shape(nvariants)] with the scalar names as keys
+        - timeseries: dictionary of np.ndarray[shape(nvariants, ntimesteps)] with the time series names as keys
+        - parameter_values, parameter_normalized_values: np.ndarray[shape(nvariants, nparameters)] if available
+    '''
+    store_dir_pobj = Path(store_dir)
+    with open(store_dir_pobj.joinpath('index.json')) as f:
+        store_index = json.load(f)
+    scalar_arr = np.load(store_dir_pobj.joinpath('scalars.npy'), mmap_mode='r')
+    store = {'index': store_index,
+             'variant_index': np.load(store_dir_pobj.joinpath('variant_index.npy'), mmap_mode='r'),
+             'scalars': {scalar['name']: scalar_arr[:, scnt] for scnt, scalar in enumerate(store_index['scalars'])},
+             'timeseries': {ts['name']: np.load(store_dir_pobj.joinpath(ts['file']), mmap_mode='r') for ts in store_index['timeseries']}}
+    for key in ['parameter_values', 'parameter_normalized_values']:
+        pmtr_path = store_dir_pobj.joinpath(f"{key}.npy")
+        if pmtr_path.exists():
+            store[key] = np.load(pmtr_path, mmap_mode='r')
+    return store
+
+def main():
+    args = parse_args()
+    pipe_input = args.process
+    if pipe_input == False:
+        res_dir = args.res
+    else:
+        lines = list(sys.stdin)
+        res_dir = lines[0].strip()
+
+    res_dir = str(Path(res_dir).resolve())
+    store_dir = args.out
+    if store_dir == None:
+        store_dir = str(Path(res_dir).joinpath('results_store'))
+    store_dir = str(Path(store_dir).resolve())
+    pmtrc_path = args.json
+    if pmtrc_path != None:
+        pmtrc_path = str(Path(pmtrc_path).resolve())
+    collect_results(res_dir, store_dir, pmtrc_path=pmtrc_path)
+    # make sure this output can be piped into another command on the cmd
+    print(store_dir)
+    sys.stdout.flush()
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
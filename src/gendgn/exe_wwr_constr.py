@@ -1,19 +1,37 @@
+from __future__ import annotations
+
 import sys
-import json
 import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
-from ifc_utils import ifcopenshell_utils
 import numpy as np
-import ifcopenshell
-import ifcopenshell.geom
-import geomie3d
-from geomie3d import geom
-import geomie3d.viz
-import ifc_utils
-import jsonschema
-
-from . import settings
+
+from . import lazy_import
+from . import pmtrc_utils
+from . import geom_utils
+from . import geom_cache
+from . import variant_delta
+from . import work_queue
+from . import profiler
+from . import pset_utils
+
+# imported on first use so that the arguments are parsed before the geometry stack is loaded, import geomie3d.viz to visualize the surfaces.
+# The geometry api is imported with ifcopenshell.open before the worker processes are forked, with its notes about blender kept out of stdout
+ifcopenshell = lazy_import.lazy_import('ifcopenshell', submodules=['geom', 'util.unit', 'util.element', 'api.geometry'], quiet=True)
+geomie3d = lazy_import.lazy_import('geomie3d')
+ifc_utils = lazy_import.lazy_import('ifc_utils', submodules=['ifcopenshell_utils'])
+
+# the variant template of the process, shared by all the variants generated by the process
+WORKER_STATE = {}
+# the azimuth of the named wwr parameters in degrees, measured clockwise from north [0,1,0]. Parameters named wwr_az<degrees> e.g. wwr_az45 
+# are also wwr parameters
+WWR_AZIMUTHS = {'north_wwr': 0, 'east_wwr': 90, 'south_wwr': 180, 'west_wwr': 270}
+# the pset edited by each thermal parameter, the keys of the template with the guids of the objects it is edited for and the type of its value
+PSET_PMTRS = {'wall_thermal_resistance': ('Pset_OsmodThermalResistance', ['wall_guids'], 'IfcThermalResistanceMeasure'),
+              'roof_thermal_resistance': ('Pset_OsmodThermalResistance', ['roof_guids'], 'IfcThermalResistanceMeasure'),
+              'floor_thermal_resistance': ('Pset_OsmodThermalResistance', ['slab_guids'], 'IfcThermalResistanceMeasure'),
+              'glazing_uvalue': ('Pset_OsmodUfactor', ['win_guids', 'gls_door_guids'], 'IfcThermalTransmittanceMeasure')}
 #===================================================================================================
 # region: FUNCTIONS
 #===================================================================================================
@@ -34,6 +52,32 @@ def parse_args():
                         metavar = 'DIR', 
                         help = 'The directory path for the results')
     
+    parser.add_argument('-w', '--jobs', type = int, default = 1,
+                        metavar = 'NJOBS', 
+                        help = 'The number of processes used to generate the variants')
+    
+    parser.add_argument('-c', '--cache', action = 'store_true', default=False,
+                        help = 'turn it on to save the tessellated geometry next to the original IFC and reuse it in later runs')
+    
+    parser.add_argument('-d', '--delta', action = 'store_true', default=False,
+                        help = 'turn it on to write the variants as the changes from the original IFC (.ifcdelta.json) instead of full IFC files')
+    
+    parser.add_argument('--start', type = int, default = None,
+                        metavar = 'INDEX',
+                        help = 'The index of the first variant to generate')
+    
+    parser.add_argument('--stop', type = int, default = None,
+                        metavar = 'INDEX',
+                        help = 'The index of the variant to stop before')
+    
+    parser.add_argument('--shard', type = work_queue.parse_shard, default = None,
+                        metavar = 'i/N',
+                        help = 'Only generate the i-th of N shards of the variants, counting from 0, variant k is in shard k %% N')
+    
+    parser.add_argument('--profile', type = str, default = None,
+                        metavar = 'FILE',
+                        help = 'The file path to record the wall time, cpu time and peak memory of each stage (.jsonl), see summarize_profile')
+    
     parser.add_argument('-p', '--process', action = 'store_true', default=False,
                         help = 'turn it on if piping in json filepath')
     
@@ -57,6 +101,24 @@ def open_ifc_file(ifc_path: str):
 
     '''
     ifcmodel = ifcopenshell.open(ifc_path)
+    ifc_wall_ls, ifc_roof_ls, ifc_slab_ls, ifc_win_ls, ifc_gls_door_ls = get_ifc_objs(ifcmodel)
+    return ifcmodel, ifc_wall_ls, ifc_roof_ls, ifc_slab_ls, ifc_win_ls, ifc_gls_door_ls
+
+def get_ifc_objs(ifcmodel: ifcopenshell.file):
+    '''
+    Extract all the objects that are modified by the parametric model.
+
+    Parameters
+    ----------
+    ifcmodel : ifcopenshell.file
+        The ifc model.
+
+    Returns
+    -------
+    tuple
+        the lists of ifc walls, roofs, slabs, windows and glazed doors.
+
+    '''
     ifc_wall_ls = ifcmodel.by_type('IfcWall')
     ifc_roof_ls = ifcmodel.by_type('IfcRoof')
     ifc_slab_ls = ifcmodel.by_type('IfcSlab')
@@ -69,7 +131,55 @@ def open_ifc_file(ifc_path: str):
         if 'Pset_OsmodUfactor' in pset_names:
             ifc_gls_door_ls.append(ifc_door)
 
-    return ifcmodel, ifc_wall_ls, ifc_roof_ls, ifc_slab_ls, ifc_win_ls, ifc_gls_door_ls
+    return ifc_wall_ls, ifc_roof_ls, ifc_slab_ls, ifc_win_ls, ifc_gls_door_ls
+
+def get_body_context(ifcmodel: ifcopenshell.file) -> ifcopenshell.entity_instance:
+    '''
+    Get the body context of the ifc model.
+
+    Parameters
+    ----------
+    ifcmodel : ifcopenshell.file
+        The ifc model.
+
+    Returns
+    -------
+    ifcopenshell.entity_instance
+        the IFCGEOMETRICREPRESENTATIONSUBCONTEXT of the ifcmodel with the 'Body' identifier.
+
+    '''
+    bodies = ifcmodel.by_type('IfcGeometricRepresentationSubContext')
+    chosen_body = None
+    for body in bodies:
+        body_info = body.get_info()
+        body_name = body_info['ContextIdentifier']
+        if body_name == 'Body':    
+            chosen_body = body
+    return chosen_body
+
+def get_envlp_srfs(ifc_envlps: list[ifcopenshell.entity_instance]) -> list[geomie3d.topobj.Face]:
+    '''
+    Get the surfaces of the envelope objects through the geometry cache. Same as ifc_utils.ifcopenshell_utils.get_ifc_envlp_info followed by 
+    extract_srfs_frm_envlp_dicts.
+
+    Parameters
+    ----------
+    ifc_envlps: list[ifcopenshell.entity_instance]
+        ifc envelope objects.
+    
+    Returns
+    --------
+    list[geomie3d.topobj.Face]
+        the surfaces, each surface has the attribute 'id' of the guid of its envelope object.
+    '''
+    envlp_srf_ls = []
+    for ifc_envlp in ifc_envlps:
+        envlp_id = ifc_envlp.GlobalId
+        envlp_faces = geom_cache.ifcopenshell_entity_geom2g3d(ifc_envlp)
+        for envlp_face in envlp_faces:
+            envlp_face.attributes = {'id': envlp_id}
+        envlp_srf_ls.extend(envlp_faces)
+    return envlp_srf_ls
 
 def extract_srfs_frm_envlp_dicts(envlp_dicts: dict) -> list[geomie3d.topobj.Face]:
     '''
@@ -144,16 +254,16 @@ def find_host_of_win(ifc_wins: list[ifcopenshell.entity_instance], spacezn_srfs:
         The surfaces with the ifc wall guid attribute. 
     
     '''
+    spacezn_index = geom_utils.build_srf_index(spacezn_srfs)
     for win in ifc_wins:
         win_info = win.get_info()
         win_guid = win_info['GlobalId']
         # find the center point of the window
-        verts3d, face_idx3d = ifc_utils.ifcopenshell_utils.get_ifc_facegeom(win)
+        verts3d, face_idx3d = geom_cache.get_ifc_facegeom(win)
         bbox = geomie3d.calculate.bbox_frm_xyzs(verts3d)
         center_xyz = geomie3d.calculate.bboxes_centre([bbox])[0]
-        center_vert = geomie3d.create.vertex(center_xyz)
         # find the closest surface to the center pont of this window
-        closest_srf, closest_ptxyz = ifc_utils.ifcopenshell_utils.find_srf_closest2this_pt(center_vert, spacezn_srfs, intx_pt=True)
+        closest_srf, closest_ptxyz = geom_utils.find_srf_closest2pt(center_xyz, spacezn_index, intx_pt=True)
         clse_attr = closest_srf.attributes
         if 'wins' in clse_attr.keys():
             clse_attr['wins'].append(win_guid)
@@ -178,17 +288,18 @@ def map_spzn_srfs2ifcwall(ifcmodel:ifcopenshell.file, wall_srf_ls: list[geomie3d
         list of face with the 'id' attribute = guid of ifc wall
     '''
     up_vec = [0,0,1]
+    wall_srf_index = geom_utils.build_srf_index(wall_srf_ls)
     ifc_spacezones = ifcmodel.by_type('IfcSpatialZone')
     spacezn_srfs = []
     for spacez in ifc_spacezones:
         space_info = spacez.get_info()
         if space_info['Representation'] != None:
-            srfs = ifc_utils.ifcopenshell_utils.ifcopenshell_entity_geom2g3d(spacez)
+            srfs = geom_cache.ifcopenshell_entity_geom2g3d(spacez)
             for srf in srfs:
                 nrml = geomie3d.get.face_normal(srf)
                 angle = geomie3d.calculate.angle_btw_2vectors(up_vec, nrml)
                 if 180 > angle >= 90:
-                    closest_wall_srf = ifc_utils.ifcopenshell_utils.find_srf_closest2this_srf(srf, wall_srf_ls)
+                    closest_wall_srf = geom_utils.find_srf_closest2srf(srf, wall_srf_index)
                     ifcwall_guid = closest_wall_srf.attributes['id']
                     geomie3d.modify.update_topo_att(srf, {'id': ifcwall_guid})
                     # region: for viz
@@ -202,28 +313,119 @@ def map_spzn_srfs2ifcwall(ifcmodel:ifcopenshell.file, wall_srf_ls: list[geomie3d
             spacezn_srfs.extend(srfs)
     return spacezn_srfs
 
-def create_open_win_geom(ifc_obj: ifcopenshell.entity_instance, wall_srf: geomie3d.topobj.Face, height: float, width: float, wall_height: float, 
-                         nrml: list[float], y_dir: list[float], extrusion: float, movement: float, ifcmodel:ifcopenshell.file, 
-                         body: ifcopenshell.entity_instance, ray_mid: bool = False):
+def calc_wall_dims(srf_with_wins: list[geomie3d.topobj.Face], ifcmodel: ifcopenshell.file):
+    '''
+    Calculate the dimensions of the walls and windows that are needed to change the wwr. This function will add the attributes 'nrml', 'area', 
+    'wall_height', 'wall_width', 'win_widths', 'win_midpts', 'win_opens' and 'open_midpts' to the srf_with_wins.
+
+    Parameters
+    ----------
+    srf_with_wins: list[geomie3d.topobj.Face]
+        the spatial zone surfaces from map_spzn_srfs2ifcwall and find_host_of_win. Need to have attributes 'id' and 'wins'
+
+    ifcmodel: ifcopenshell.file
+        The ifc model.
+
     '''
-    Change the wwr of the wall.
+    y_dir = [0,0,1]
+    for srf in srf_with_wins:
+        nrml = geomie3d.get.face_normal(srf)
+        # for calc height and width of vertical obj
+        z_dir = geomie3d.calculate.cross_product(nrml, y_dir)
+        farea = geomie3d.calculate.face_area(srf)
+        fverts = geomie3d.get.bdry_vertices_frm_face(srf)
+        fxyzs = np.array([v.point.xyz for v in fverts])
+        wall_height, wall_width = ifc_utils.ifcopenshell_utils.calc_vobj_height_width(fxyzs, z_dir, y_dir)
+        # print(f"wallheight = {wall_height}, wallwidth={wall_width}")
+        attr = srf.attributes
+        win_guids = attr['wins']
+        widths = []
+        win_midpts = []
+        for win_guid in win_guids:
+            ifc_win = ifcmodel.by_guid(win_guid)
+            ifc_win_geom = geom_cache.ifcopenshell_entity_geom2g3d(ifc_win)
+            win_cmp = geomie3d.create.composite(ifc_win_geom)
+            win_verts = geomie3d.get.vertices_frm_composite(win_cmp)
+            win_verts = geomie3d.modify.fuse_vertices(win_verts)
+            win_xyzs = np.array([v.point.xyz for v in win_verts])
+            # calc the win width and height
+            height, width = ifc_utils.ifcopenshell_utils.calc_vobj_height_width(win_xyzs, z_dir, y_dir)
+            widths.append(width)
+            # the new window is centered on the wall srf
+            win_midpts.append(calc_obj_midpt(ifc_win, wall_srf=srf, nrml=nrml))
+
+        # the openings of the windows hosted by the wall
+        wall_guid = attr['id']
+        ifc_wall = ifcmodel.by_guid(wall_guid)
+        ifcopenings = ifc_utils.ifcopenshell_utils.find_objs_in_relvoidselement(ifcmodel, ifc_wall)
+        # the order of the inverse relationships is not guaranteed, sort them so that every process generates the same variant
+        ifcopenings = sorted(ifcopenings, key=lambda ifcopen: ifcopen.id())
+        win_opens = []
+        open_midpts = []
+        for ifcopen in ifcopenings:
+            open_info = ifcopen.get_info()
+            open_name = open_info['Name']
+            open_name = open_name.lower()
+            if 'window' in open_name:
+                win_opens.append(open_info['GlobalId'])
+                open_midpts.append(calc_obj_midpt(ifcopen))
+
+        geomie3d.modify.update_topo_att(srf, {'nrml': nrml, 'area': farea, 'wall_height': wall_height, 'wall_width': wall_width, 
+                                              'win_widths': widths, 'win_midpts': win_midpts, 'win_opens': win_opens, 
+                                              'open_midpts': open_midpts})
+
+def calc_obj_midpt(ifc_obj: ifcopenshell.entity_instance, wall_srf: geomie3d.topobj.Face = None, nrml: list[float] = None) -> list[float]:
+    '''
+    Calculate the mid point of the ifc object.
 
     Parameters
     ----------
     ifc_obj: ifcopenshell.entity_instance
         ifcopening or ifcwindow.
     
-    wall_srf: geomie3d.topobj.Face
-        the srf of the hosting wall.
+    wall_srf: geomie3d.topobj.Face, optional
+        the srf of the hosting wall. If specified, the mid point is projected onto the wall srf.
+
+    nrml: list[float], optional
+        nrml of the wall. Need to be specified with wall_srf.
+
+    Returns
+    -------
+    list[float]
+        list[shape(3)] the mid point.
+    '''
+    ifc_geom = geom_cache.ifcopenshell_entity_geom2g3d(ifc_obj)
+    cmp = geomie3d.create.composite(ifc_geom)
+    bbox = geomie3d.calculate.bbox_frm_topo(cmp)
+    mid_pt = geomie3d.calculate.bboxes_centre([bbox])[0]
+    if wall_srf is not None:
+        rev_nrml = geomie3d.calculate.reverse_vectorxyz(nrml)
+        mv_midpt = geomie3d.calculate.move_xyzs([mid_pt], [nrml], [1])[0]
+        ray = geomie3d.utility.Ray(mv_midpt, rev_nrml)
+        ray_res = geomie3d.calculate.rays_faces_intersection([ray], [wall_srf])
+        hit_ray = ray_res[0][0]
+        ray_attr = hit_ray.attributes
+        mid_pt = ray_attr['rays_faces_intersection']['intersection'][0]
+    return list(mid_pt)
+
+def calc_open_win_meshes(mid_pts: np.ndarray, heights: np.ndarray, widths: np.ndarray, wall_height: float, nrml: list[float], 
+                         y_dir: list[float], extrusion: float, movement: float) -> tuple[np.ndarray, list[list[int]]]:
+    '''
+    Calculate the box meshes of the new openings or windows of a wall in one pass.
+
+    Parameters
+    ----------
+    mid_pts: np.ndarray
+        np.ndarray[shape(nobjs, 3)] the mid points of the objects.
         
-    height: float
-        height of the new object
+    heights: np.ndarray
+        np.ndarray[shape(nobjs)] heights of the new objects.
 
-    width: float
-        width of the new object.
+    widths: np.ndarray
+        np.ndarray[shape(nobjs)] widths of the new objects.
 
     wall_height: float
-        the height of the wall the object is hosted.
+        the height of the wall the objects are hosted.
 
     nrml: list[float]
         nrml of the wall.
@@ -237,45 +439,206 @@ def create_open_win_geom(ifc_obj: ifcopenshell.entity_instance, wall_srf: geomie
     movement: float
         move back before extrusion.
 
+    Returns
+    -------
+    tuple[np.ndarray, list[list[int]]]
+        - np.ndarray[shape(nobjs, 8, 3)] the vertices of each box
+        - the faces of the boxes, the same for all the boxes
+    '''
+    buffered_wall_height = wall_height-0.5
+    heights = np.minimum(heights, buffered_wall_height)
+    nrml = np.array(nrml, dtype=float)
+    y_dir = np.array(y_dir, dtype=float)
+    x_dir = -np.cross(nrml, y_dir)
+    mid_pts = np.array(mid_pts, dtype=float)
+    half_ws = np.reshape(widths/2, (-1,1,1))
+    half_hs = np.reshape(heights/2, (-1,1,1))
+    # the corners are counter clockwise when viewed from the nrml direction
+    signs = np.array([[-1,-1], [1,-1], [1,1], [-1,1]], dtype=float)
+    corners = mid_pts[:,np.newaxis,:] + signs[np.newaxis,:,0:1]*half_ws*x_dir + signs[np.newaxis,:,1:2]*half_hs*y_dir
+    backs = corners - nrml*movement
+    fronts = backs + nrml*extrusion
+    verts = np.concatenate([backs, fronts], axis=1)
+    # same precision as the vertices of geomie3d
+    verts = np.round(verts, decimals=6)
+    faces = [[3,2,1,0], [4,5,6,7], [0,1,5,4], [1,2,6,5], [2,3,7,6], [3,0,4,7]]
+    return verts, faces
+
+def add_mesh_reprs(verts: np.ndarray, faces: list[list[int]], ifcmodel: ifcopenshell.file, body: ifcopenshell.entity_instance, 
+                   unit_scale: float) -> list[ifcopenshell.entity_instance]:
+    '''
+    Add a mesh representation for each of the meshes.
+
+    Parameters
+    ----------
+    verts: np.ndarray
+        np.ndarray[shape(nmeshes, nverts, 3)] the vertices of each mesh.
+
+    faces: list[list[int]]
+        the faces of the meshes, the same for all the meshes.
+
     ifcmodel: ifcopenshell.file
         The ifc model.
 
     body: ifcopenshell.file
         the IFCGEOMETRICREPRESENTATIONSUBCONTEXT of the ifcmodel
 
+    unit_scale: float
+        the unit scale of the ifc model, calculated with ifcopenshell.util.unit.calculate_unit_scale.
+
+    Returns
+    -------
+    list[ifcopenshell.entity_instance]
+        the representations.
     '''
-    buffered_wall_height = wall_height-0.5
-    if height >= buffered_wall_height:
-        height = buffered_wall_height
-    ifc_geom = ifc_utils.ifcopenshell_utils.ifcopenshell_entity_geom2g3d(ifc_obj)
-    cmp = geomie3d.create.composite(ifc_geom)
-    bbox = geomie3d.calculate.bbox_frm_topo(cmp)
-    mid_pt = geomie3d.calculate.bboxes_centre([bbox])[0]
-    if ray_mid == True:
-        rev_nrml = geomie3d.calculate.reverse_vectorxyz(nrml)
-        mv_midpt = geomie3d.calculate.move_xyzs([mid_pt], [nrml], [1])[0]
-        ray = geomie3d.utility.Ray(mv_midpt, rev_nrml)
-        ray_res = geomie3d.calculate.rays_faces_intersection([ray], [wall_srf])
-        hit_ray = ray_res[0][0]
-        ray_attr = hit_ray.attributes
-        mid_pt = ray_attr['rays_faces_intersection']['intersection'][0]
+    reprs = []
+    for mesh_verts in verts.tolist():
+        repr = ifcopenshell.api.run("geometry.add_mesh_representation", ifcmodel, context=body, vertices=[mesh_verts], faces=[faces], 
+                                    unit_scale=unit_scale)
+        reprs.append(repr)
+    return reprs
 
-    face = geomie3d.create.polygon_face_frm_midpt(mid_pt, width, height)
-    orig_xdir = geomie3d.get.face_normal(face)
-    orig_ydir = [0,1,0]
-    orig_cs = geomie3d.utility.CoordinateSystem(mid_pt, orig_xdir, orig_ydir)
-    dest_cs = geomie3d.utility.CoordinateSystem(mid_pt, nrml, y_dir)
-    face = geomie3d.modify.trsf_topo_based_on_cs(face, orig_cs, dest_cs)
-    verts = geomie3d.get.bdry_vertices_frm_face(face)
-    xyzs = np.array([v.point.xyz for v in verts])
-    mesh = ifcopenshell_utils.mv_extrude_srf(xyzs, extrusion, movement)
-    repr = ifcopenshell.api.run("geometry.add_mesh_representation", ifcmodel, context=body, 
-                                vertices=[mesh['vertices'].tolist()], faces=[mesh['indices']])
-    return repr #face, ifc_geom
-    
-def change_wwr(wwr: float, srf_with_wins: list[geomie3d.topobj.Face], ref_vec: list[float], ifcmodel: ifcopenshell.file, body: ifcopenshell.file):
+def get_wwr_azimuth(pmtr_name: str) -> float | None:
     '''
-    Change the wwr of the wall.
+    Get the azimuth of a wwr parameter.
+
+    Parameters
+    ----------
+    pmtr_name: str
+        the name of the parameter, e.g. north_wwr or wwr_az45.
+
+    Returns
+    -------
+    float | None
+        the azimuth in degrees measured clockwise from north. None if it is not a wwr parameter.
+    '''
+    if pmtr_name in WWR_AZIMUTHS:
+        return float(WWR_AZIMUTHS[pmtr_name])
+    elif pmtr_name.startswith('wwr_az'):
+        try:
+            return float(pmtr_name[len('wwr_az'):]) % 360
+        except ValueError:
+            return None
+    return None
+
+def azimuth2vec(azimuth: float) -> list[float]:
+    '''
+    Convert an azimuth into a horizontal vector.
+
+    Parameters
+    ----------
+    azimuth: float
+        the azimuth in degrees measured clockwise from north [0,1,0].
+
+    Returns
+    -------
+    list[float]
+        list[shape(3)] the vector.
+    '''
+    rad = np.radians(azimuth)
+    # round off so that the cardinal directions are exact e.g. [0,-1,0] for south
+    vec = np.round([np.sin(rad), np.cos(rad), 0], decimals=6) + 0.0
+    return vec.tolist()
+
+def calc_bin_half_width(azimuths: list[float]) -> float:
+    '''
+    Calculate the half width of the orientation bins of the azimuths, half the angle to the closest neighbouring bin, at most 90 degrees.
+
+    Parameters
+    ----------
+    azimuths: list[float]
+        the azimuth of each bin in degrees measured clockwise from north.
+
+    Returns
+    -------
+    float
+        the half width in degrees, 45 degrees if there are less than 2 distinct azimuths.
+    '''
+    uniq_azs = np.unique(np.array(azimuths, dtype=float) % 360)
+    if len(uniq_azs) < 2:
+        return 45
+    gaps = np.diff(np.append(uniq_azs, uniq_azs[0] + 360))
+    return min(np.min(gaps)/2, 90)
+
+def classify_srfs_by_azimuth(srf_nrmls: np.ndarray, azimuths: list[float], half_widths: list[float] = None) -> list[np.ndarray]:
+    '''
+    Classify the surfaces into the orientation bins of the azimuths in one pass. A surface exactly on the boundary of a bin belongs to it.
+
+    Parameters
+    ----------
+    srf_nrmls: np.ndarray
+        np.ndarray[shape(nsrfs, 3)] the normals of the surfaces.
+
+    azimuths: list[float]
+        the azimuth of each bin in degrees measured clockwise from north.
+
+    half_widths: list[float], optional
+        the half width of each bin in degrees. Default to calc_bin_half_width of the azimuths for every bin.
+
+    Returns
+    -------
+    list[np.ndarray]
+        the indices of the surfaces in each bin.
+    '''
+    nbins = len(azimuths)
+    if nbins == 0:
+        return []
+    if half_widths is None:
+        half_widths = [calc_bin_half_width(azimuths)] * nbins
+
+    nsrfs = len(srf_nrmls)
+    if nsrfs == 0:
+        return [np.array([], dtype=int) for _ in range(nbins)]
+    ref_vecs = np.array([azimuth2vec(azimuth) for azimuth in azimuths])
+    srf_nrmls = np.array(srf_nrmls, dtype=float)
+    # angles between every bin and every surface, shape(nbins*nsrfs)
+    angles = geomie3d.calculate.angle_btw_2vectors(np.repeat(ref_vecs, nsrfs, axis=0), np.tile(srf_nrmls, (nbins, 1)))
+    angles = np.reshape(angles, (nbins, nsrfs))
+    bins = [np.where(bin_angles <= half_width)[0] for bin_angles, half_width in zip(angles, half_widths)]
+    return bins
+
+def classify_wwr_pmtrs(tmpl: dict, pmtr_metakeys: list[str]) -> dict:
+    '''
+    Classify the surfaces of the template into the orientation bins of the wwr parameters. The result is cached in the template as it only
+    depends on the names of the parameters.
+
+    Parameters
+    ----------
+    tmpl: dict
+        dictionary generated from create_variant_template.
+
+    pmtr_metakeys: list[str]
+        the names of the parameters.
+
+    Returns
+    -------
+    dict
+        the index of the wwr parameter mapped to the surfaces facing its direction.
+    '''
+    cache_key = tuple(pmtr_metakeys)
+    wwr_bins = tmpl.setdefault('wwr_bins', {})
+    if cache_key not in wwr_bins:
+        wwr_idxs = []
+        azimuths = []
+        is_named = []
+        for cnt, pmtr_name in enumerate(pmtr_metakeys):
+            azimuth = get_wwr_azimuth(pmtr_name)
+            if azimuth is not None:
+                wwr_idxs.append(cnt)
+                azimuths.append(azimuth)
+                is_named.append(pmtr_name in WWR_AZIMUTHS)
+        # the named parameters span 45 degrees each side like before, the wwr_az<degrees> bins span half the gap between them
+        az_half_width = calc_bin_half_width([azimuth for azimuth, named in zip(azimuths, is_named) if not named])
+        half_widths = [45 if named else az_half_width for named in is_named]
+        srf_with_wins = tmpl['srf_with_wins']
+        bins = classify_srfs_by_azimuth(tmpl['srf_nrmls'], azimuths, half_widths=half_widths)
+        wwr_bins[cache_key] = {wwr_idx: [srf_with_wins[srf_idx] for srf_idx in srf_idxs] for wwr_idx, srf_idxs in zip(wwr_idxs, bins)}
+    return wwr_bins[cache_key]
+
+def change_wwr(wwr: float, srf_with_wins: list[geomie3d.topobj.Face], ref_vec: list[float], ifcmodel: ifcopenshell.file, 
+               body: ifcopenshell.file, unit_scale: float = None):
+    '''
+    Change the wwr of the walls.
 
     Parameters
     ----------
@@ -283,10 +646,12 @@ def change_wwr(wwr: float, srf_with_wins: list[geomie3d.topobj.Face], ref_vec: l
         the desired wwr.
     
     srf_with_wins: list[geomie3d.topobj.Face]
-        the spatial zone surfaces from map_spzn_srfs2ifcwall and find_host_of_win. Need to have attributes 'id' and 'wins'
+        the spatial zone surfaces facing the direction of the wwr, from classify_wwr_pmtrs. The dimensions are from calc_wall_dims. 
+        Need to have attributes 'id', 'wins', 'nrml', 'area', 'wall_height', 'win_widths', 'win_midpts', 'win_opens' and 'open_midpts'
 
     ref_vec: list[float]
-        list[shape(3)] specifying the direction of the surface to look for.
+        list[shape(3)] the direction of the surfaces to change, kept for the callers from before classify_wwr_pmtrs. If specified only the
+        surfaces within 45 degrees of it are changed. None to change all the surfaces, as they are already classified.
 
     ifcmodel: ifcopenshell.file
         The file path of the json parametric model.
@@ -294,99 +659,338 @@ def change_wwr(wwr: float, srf_with_wins: list[geomie3d.topobj.Face], ref_vec: l
     body: ifcopenshell.file
         the IFCGEOMETRICREPRESENTATIONSUBCONTEXT of the ifcmodel
 
-    wall_srf_ls: list[geomie3d.topobj.Face]
-        list generated from extract_srfs_frm_envlp_dicts
-    
-    Returns
-    --------
-    list[geomie3d.topobj.Face]
-        list of face with the 'id' attribute = guid of ifc wall
+    unit_scale: float, optional
+        the unit scale of the ifc model. Calculated from the ifcmodel if not specified.
+
     '''
+    if unit_scale is None:
+        unit_scale = ifcopenshell.util.unit.calculate_unit_scale(ifcmodel)
+    # for calc height and width of vertical obj
+    y_dir = [0,0,1]
+    if ref_vec is not None:
+        srf_with_wins = [srf for srf in srf_with_wins if geomie3d.calculate.angle_btw_2vectors(ref_vec, srf.attributes['nrml']) <= 45]
     for srf in srf_with_wins:
-        nrml = geomie3d.get.face_normal(srf)
-        angle = geomie3d.calculate.angle_btw_2vectors(ref_vec, nrml)
-        # for calc height and width of vertical obj
-        y_dir = [0,0,1]
-        z_dir = geomie3d.calculate.cross_product(nrml, y_dir)
-        if angle <= 45: # it is facing the specified direction
-            farea = geomie3d.calculate.face_area(srf)
-            fverts = geomie3d.get.bdry_vertices_frm_face(srf)
-            fxyzs = np.array([v.point.xyz for v in fverts])
-            wall_height, wall_width = ifc_utils.ifcopenshell_utils.calc_vobj_height_width(fxyzs, z_dir, y_dir)
-            # print(f"wallheight = {wall_height}, wallwidth={wall_width}")
+        attr = srf.attributes
+        nrml = attr['nrml']
+        farea = attr['area']
+        wall_height = attr['wall_height']
+        win_guids = attr['wins']
+        # calc the change in window dimensions
+        nwins = len(win_guids)
+        req_win_area = farea*wwr
+        req_win_area_each = req_win_area/nwins
+        widths = np.array(attr['win_widths'])
+        widths = widths + 0.5
+        req_height = req_win_area_each/widths
+        # print(f"req_height = {req_height}")
+        open_guids = attr['win_opens']
+        nopens = len(open_guids)
+        if nopens != 0:
+            open_verts, open_faces = calc_open_win_meshes(attr['open_midpts'], req_height[:nopens], widths[:nopens], wall_height, nrml, y_dir, 0.8, 0.4)
+            open_reprs = add_mesh_reprs(open_verts, open_faces, ifcmodel, body, unit_scale)
+            for open_guid, open_repr in zip(open_guids, open_reprs):
+                ifcopen = ifcmodel.by_guid(open_guid)
+                # ifcopenshell.api.run("geometry.assign_representation", ifcmodel, product=ifcopen, representation=open_repr)
+                pdt_def = ifcopen.Representation
+                pdt_def.Representations = [open_repr]
+
+        win_verts, win_faces = calc_open_win_meshes(attr['win_midpts'], req_height, widths, wall_height, nrml, y_dir, 0.01, 0.005)
+        win_reprs = add_mesh_reprs(win_verts, win_faces, ifcmodel, body, unit_scale)
+        for win_guid, win_repr in zip(win_guids, win_reprs):
+            ifc_win = ifcmodel.by_guid(win_guid)
+            pdt_def = ifc_win.Representation
+            pdt_def.Representations = [win_repr]
+
+def create_variant_template(ifcmodel: ifcopenshell.file, nthreads: int = None) -> dict:
+    '''
+    Analyze the base ifc model once so that it can be reused for every variant. The geometry analysis only depends on the base model and not on the parameter values.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        The base ifc model.
+
+    nthreads: int, optional
+        The number of threads used to tessellate the model. Default to the number of cpus.
+
+    Returns
+    -------
+    dict
+        - ifc_str: the STEP text of the base model, used to create a copy of the base model for each variant
+        - body_id: the id of the body context
+        - wall_guids, roof_guids, slab_guids, win_guids, gls_door_guids: the guids of the objects modified by the parametric model
+        - srf_with_wins: the spatial zone surfaces hosting windows from calc_wall_dims
+        - srf_nrmls: np.ndarray[shape(nsrfs, 3)] the normals of srf_with_wins
+        - pset_prop_ids: the ids of the properties edited by each thermal parameter, see pset_utils.index_pset_props
+    '''
+    with profiler.profile_stage('get_ifc_objs'):
+        ifc_wall_ls, ifc_roof_ls, ifc_slab_ls, ifc_win_ls, ifc_gls_door_ls = get_ifc_objs(ifcmodel)
+        chosen_body = get_body_context(ifcmodel)
+    # tessellate all the objects in one pass, the analysis below reads the tessellations from the geometry cache
+    ifc_spacezones = ifcmodel.by_type('IfcSpatialZone')
+    ifc_openings = ifcmodel.by_type('IfcOpeningElement')
+    # the geometries are kept in the cache until the analysis is done
+    with geom_cache.pin_geom_cache():
+        with profiler.profile_stage('tessellate'):
+            geom_cache.load_ifc_geoms(ifcmodel, ifc_wall_ls + ifc_win_ls + ifc_gls_door_ls + ifc_slab_ls + ifc_roof_ls + ifc_spacezones + ifc_openings,
+                                      nthreads=nthreads)
+        with profiler.profile_stage('envelope_extraction'):
+            wall_srf_ls = get_envlp_srfs(ifc_wall_ls)
+        with profiler.profile_stage('map_spzn_srfs2ifcwall'):
+            spacezn_srfs = map_spzn_srfs2ifcwall(ifcmodel, wall_srf_ls)
+        with profiler.profile_stage('find_host_of_win'):
+            find_host_of_win(ifc_win_ls, spacezn_srfs)
+        # get all the surfs with windows
+        srf_with_wins = []
+        for srf in spacezn_srfs:
+            if 'wins' in srf.attributes.keys():
+                srf_with_wins.append(srf)
+        with profiler.profile_stage('calc_wall_dims'):
+            calc_wall_dims(srf_with_wins, ifcmodel)
+    srf_nrmls = np.array([srf.attributes['nrml'] for srf in srf_with_wins])
+
+    tmpl = {'body_id': chosen_body.id(),
+            'wall_guids': [ifc_wall.GlobalId for ifc_wall in ifc_wall_ls],
+            'roof_guids': [ifc_roof.GlobalId for ifc_roof in ifc_roof_ls],
+            'slab_guids': [ifc_slab.GlobalId for ifc_slab in ifc_slab_ls],
+            'win_guids': [ifc_win.GlobalId for ifc_win in ifc_win_ls],
+            'gls_door_guids': [ifc_gls_door.GlobalId for ifc_gls_door in ifc_gls_door_ls],
+            'srf_with_wins': srf_with_wins, 'srf_nrmls': srf_nrmls}
+    # the ids of the properties are the same in the copies of the model made from ifc_str
+    with profiler.profile_stage('index_psets'):
+        pset_groups = {}
+        for pmtr_name, (pset_name, guid_keys, _) in PSET_PMTRS.items():
+            pset_groups[pmtr_name] = (pset_name, [guid for guid_key in guid_keys for guid in tmpl[guid_key]])
+        tmpl['pset_prop_ids'] = pset_utils.index_pset_props(ifcmodel, pset_groups)
+    with profiler.profile_stage('to_string'):
+        tmpl['ifc_str'] = ifcmodel.to_string()
+    return tmpl
+
+def exe_variant(tmpl: dict, pmtr_metakeys: list[str], pmtr_vals: list[float]) -> ifcopenshell.file:
+    '''
+    Generate a variant by applying the parameter values onto a copy of the base model.
+
+    Parameters
+    ----------
+    tmpl: dict
+        dictionary generated from create_variant_template.
+
+    pmtr_metakeys: list[str]
+        the names of the parameters.
+
+    pmtr_vals: list[float]
+        the actual value of each parameter.
+
+    Returns
+    -------
+    ifcopenshell.file
+        the ifc model of the variant.
+    '''
+    with profiler.profile_stage('from_string'):
+        ifcmodel = ifcopenshell.file.from_string(tmpl['ifc_str'])
+    chosen_body = ifcmodel.by_id(tmpl['body_id'])
+    unit_scale = ifcopenshell.util.unit.calculate_unit_scale(ifcmodel)
+    wwr_bins = classify_wwr_pmtrs(tmpl, pmtr_metakeys)
+    for wwr_idx, wwr_srfs in wwr_bins.items():
+        with profiler.profile_stage('change_wwr', parameter=pmtr_metakeys[wwr_idx]):
+            change_wwr(pmtr_vals[wwr_idx], wwr_srfs, None, ifcmodel, chosen_body, unit_scale=unit_scale)
+
+    with profiler.profile_stage('pset_edits'):
+        edit_psets(tmpl, ifcmodel, pmtr_metakeys, pmtr_vals)
+    return ifcmodel
+
+def edit_psets(tmpl: dict, ifcmodel: ifcopenshell.file, pmtr_metakeys: list[str], pmtr_vals: list[float]):
+    '''
+    Edit the thermal properties of the objects of a variant.
+
+    Parameters
+    ----------
+    tmpl: dict
+        dictionary generated from create_variant_template.
+
+    ifcmodel: ifcopenshell.file
+        the ifc model of the variant.
+
+    pmtr_metakeys: list[str]
+        the names of the parameters.
+
+    pmtr_vals: list[float]
+        the actual value of each parameter.
+
+    '''
+    for pmtr_name, pmtr_val in zip(pmtr_metakeys, pmtr_vals):
+        if pmtr_name in PSET_PMTRS:
+            # all the properties of the parameter share one value
+            nominal_val = ifcmodel.create_entity(PSET_PMTRS[pmtr_name][2], pmtr_val)
+            pset_utils.edit_props(ifcmodel, tmpl['pset_prop_ids'][pmtr_name], nominal_val)
+
+def find_edited_ids(tmpl: dict, ifcmodel: ifcopenshell.file, pmtr_metakeys: list[str]) -> list[int]:
+    '''
+    Find the entities of the base model edited by exe_variant, the product definition shapes of the windows and openings of the wwr parameters
+    and the properties of the pset parameters. The variant is written by patching these entities into the base model, see
+    variant_delta.write_variant_patch.
+
+    Parameters
+    ----------
+    tmpl: dict
+        dictionary generated from create_variant_template.
+
+    ifcmodel: ifcopenshell.file
+        the ifc model of the variant.
+
+    pmtr_metakeys: list[str]
+        the names of the parameters.
+
+    Returns
+    -------
+    list[int]
+        the ids of the edited entities.
+    '''
+    edited_ids = []
+    for wwr_srfs in classify_wwr_pmtrs(tmpl, pmtr_metakeys).values():
+        for srf in wwr_srfs:
             attr = srf.attributes
-            win_guids = attr['wins']
-            ifc_wins = []
-            win_geoms = []
-            win_midpts = []
-            widths = []
-            ttl_win_area = 0
-            for win_guid in win_guids:
-                ifc_win = ifcmodel.by_guid(win_guid)
-                ifc_win_geom = ifc_utils.ifcopenshell_utils.ifcopenshell_entity_geom2g3d(ifc_win)
-                win_cmp = geomie3d.create.composite(ifc_win_geom)
-                win_verts = geomie3d.get.vertices_frm_composite(win_cmp)
-                win_verts = geomie3d.modify.fuse_vertices(win_verts)
-                win_xyzs = np.array([v.point.xyz for v in win_verts])
-                win_midpt = geomie3d.calculate.xyzs_mean(win_xyzs)
-                # calc the win width and height
-                height, width = ifc_utils.ifcopenshell_utils.calc_vobj_height_width(win_xyzs, z_dir, y_dir)
-                win_area = height*width
-                ttl_win_area+=win_area
-                # get all the dimensions and geometry info
-                ifc_wins.append(ifc_win)
-                win_geoms.append(ifc_win_geom)
-                win_midpts.append(win_midpt)
-                widths.append(width)
-            
-            # calc the change in window dimensions
-            nwins = len(win_guids)
-            req_win_area = farea*wwr
-            req_win_area_each = req_win_area/nwins
-            widths = np.array(widths)
-            widths = widths + 0.5
-            req_height = req_win_area_each/widths
-            # curr_wwr = ttl_win_area/farea
-            # print(f"req_height = {req_height}")
-            # print(f"curr_wwr = {curr_wwr}, wwr = {wwr}")
-            wall_guid = attr['id']
-            ifc_wall = ifcmodel.by_guid(wall_guid)
-            ifcopenings = ifc_utils.ifcopenshell_utils.find_objs_in_relvoidselement(ifcmodel, ifc_wall)
-            opencnt = 0
-            for ifcopen in ifcopenings:
-                open_info = ifcopen.get_info()
-                open_name = open_info['Name']
-                open_name = open_name.lower()
-                if 'window' in open_name:
-                    open_height = req_height[opencnt]
-                    open_width = widths[opencnt]
-                    open_extrude = 0.8
-                    open_mve = 0.4
-                    open_repr = create_open_win_geom(ifcopen, srf, open_height, open_width, wall_height, nrml, y_dir, open_extrude, open_mve, ifcmodel, body)
-                    # ifcopenshell.api.run("geometry.assign_representation", ifcmodel, product=ifcopen, representation=open_repr)
-                    pdt_def = open_info['Representation']
-                    pdt_def.Representations = [open_repr]
-                    opencnt+=1
-
-            win_faces = []
-            win_geoms = []
-            for wcnt,ifc_win in enumerate(ifc_wins):
-                win_height = req_height[wcnt]
-                win_width = widths[wcnt]
-                win_extrude = 0.01
-                win_mve = 0.005
-                win_repr = create_open_win_geom(ifc_win, srf, win_height, win_width, wall_height, nrml, y_dir, win_extrude, win_mve, ifcmodel, body, 
-                                                ray_mid=True)
-                winfo = ifc_win.get_info()
-                pdt_def = winfo['Representation']
-                pdt_def.Representations = [win_repr]
-                # win_faces.append(win_face)
-                # win_geoms.extend(ifcgeoms)
-            
-            # geomie3d.viz.viz([{'topo_list': win_faces, 'colour': 'blue'},
-            #                   {'topo_list': win_geoms, 'colour': 'red'}])
-
-def exe_pmtrc_wwr_constr(pmtrc_path: str, ifc_path: str, res_dir: str):
+            for guid in attr['wins'] + attr['win_opens']:
+                edited_ids.append(ifcmodel.by_guid(guid).Representation.id())
+    for pmtr_name in pmtr_metakeys:
+        if pmtr_name in PSET_PMTRS:
+            edited_ids.extend(tmpl['pset_prop_ids'][pmtr_name])
+    return edited_ids
+
+def init_variant_worker(ifc_path: str, geom_cache_path: str = None, profile_path: str = None):
+    '''
+    Initialize a worker process of the process pool. Each worker loads the base ifc and analyze it once.
+
+    Parameters
+    ----------
+    ifc_path : str
+        The file path of ifc.
+
+    geom_cache_path : str, optional
+        The file path of the persisted geometry cache. If specified, the tessellated geometry is loaded from it.
+
+    profile_path : str, optional
+        The file path of the profile. If specified, the stages of the worker are recorded, see profiler.enable_profile.
+
+    '''
+    if profile_path is not None:
+        profiler.enable_profile(profile_path)
+    with geom_cache.pin_geom_cache():
+        if geom_cache_path is not None:
+            geom_cache.load_geom_cache(geom_cache_path)
+        with profiler.profile_stage('ifc_open'):
+            ifcmodel = ifcopenshell.open(ifc_path)
+        # the processes already run in parallel
+        WORKER_STATE['tmpl'] = create_variant_template(ifcmodel, nthreads=1)
+
+def write_variants(pmtr_metakeys: list[str], pmtr_val_ls: list[list[float]], res_paths: list[str], delta_base_path: str = None) -> list[str]:
+    '''
+    Generate and write a shard of variants with the template of the worker process.
+
+    Parameters
+    ----------
+    pmtr_metakeys: list[str]
+        the names of the parameters.
+
+    pmtr_val_ls: list[list[float]]
+        the actual parameter values of each variant in the shard.
+
+    res_paths: list[str]
+        the file path of each variant in the shard.
+
+    delta_base_path: str, optional
+        The file path of the base ifc. If specified, the variants are written as deltas of the base ifc with variant_delta.
+
+    Returns
+    -------
+    list[str]
+        the file paths of the written variants.
+    '''
+    tmpl = WORKER_STATE['tmpl']
+    for cnt, pmtr_vals in enumerate(pmtr_val_ls):
+        with profiler.profile_variant(variant_delta.get_variant_name(res_paths[cnt])):
+            var_ifcmodel = exe_variant(tmpl, pmtr_metakeys, pmtr_vals)
+            with profiler.profile_stage('write'):
+                # only the edited and new entities are serialized, the rest is copied from the text of the template
+                edited_ids = find_edited_ids(tmpl, var_ifcmodel, pmtr_metakeys)
+                if delta_base_path is None:
+                    variant_delta.write_variant_patch(var_ifcmodel, tmpl, edited_ids, res_paths[cnt])
+                else:
+                    variant_delta.write_variant_delta(var_ifcmodel, tmpl, delta_base_path, res_paths[cnt], edited_ids=edited_ids)
+    return res_paths
+
+def read_pmtrc_mod(pmtrc_path: str) -> dict | None:
+    '''
+    Read the json parametric model and validate it.
+
+    Parameters
+    ----------
+    pmtrc_path: str
+        The file path of the json parametric model.
+
+    Returns
+    -------
+    dict | None
+        the parametric model, None if it is not valid for this execution script.
+    '''
+    pmtrc_mod = pmtrc_utils.read_pmtrc_json(pmtrc_path)
+    if pmtrc_mod is None:
+        return None
+
+    if pmtrc_mod['exe_script'] != 'exe_wwr_constr':
+        print('This is not the right parametric model json for this execution script')
+        return None
+    return pmtrc_mod
+
+def get_variant_indices(pmtrc_mod: dict) -> list[int]:
+    '''
+    Get the indices of the variants to generate, the rows in selected_indices of the parametric model, e.g. written by screen_variants, or all the rows.
+
+    Parameters
+    ----------
+    pmtrc_mod: dict
+        the parametric model.
+
+    Returns
+    -------
+    list[int]
+        the indices of the rows of parameter_normalized_values to generate.
+    '''
+    nvariants = len(pmtrc_mod['parameter_normalized_values'])
+    if 'selected_indices' in pmtrc_mod:
+        return [indx for indx in pmtrc_mod['selected_indices'] if indx < nvariants]
+    return list(range(nvariants))
+
+def create_cached_variant_template(ifcmodel: ifcopenshell.file, ifc_path: str) -> tuple[dict, str]:
+    '''
+    Create the variant template with the geometry cache persisted next to the ifc. The cache is loaded before and saved after if anything new 
+    is tessellated.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        The base ifc model.
+
+    ifc_path : str
+        The file path of ifc.
+
+    Returns
+    -------
+    tuple[dict, str]
+        - dictionary generated from create_variant_template
+        - the file path of the persisted geometry cache
+    '''
+    geom_cache_path = geom_cache.get_geom_cache_path(ifc_path)
+    # all the geometries of the model are persisted, not only the ones that fit into the cache
+    with geom_cache.pin_geom_cache():
+        geom_cache.load_geom_cache(geom_cache_path)
+        tmpl = create_variant_template(ifcmodel)
+        if geom_cache.GEOM_CACHE['misses'] != 0:
+            geom_cache.save_geom_cache(geom_cache_path)
+    return tmpl, geom_cache_path
+
+def exe_pmtrc_wwr_constr(pmtrc_path: str, ifc_path: str, res_dir: str, njobs: int = 1, use_geom_cache: bool = False, delta: bool = False,
+                         start: int = None, stop: int = None, shard: tuple[int, int] = None, profile_path: str = None):
     '''
     Execute a parameteric model and generate a variant.
 
@@ -401,32 +1005,45 @@ def exe_pmtrc_wwr_constr(pmtrc_path: str, ifc_path: str, res_dir: str):
     res_dir : str
         The path of the directory.
     
-    '''
-    with open(pmtrc_path) as pmtrc_file:
-        pmtrc_mod = json.load(pmtrc_file)
-    
-    # validate the file and make sure it is compliant
-    json_data_dir = settings.JSON_DATA_DIR
-    pmtrc_mod_schema_path = Path(json_data_dir).joinpath('pmtrc_mod_schema.json')
-    with open(pmtrc_mod_schema_path) as schema_file:
-        pmtrc_schema = json.load(schema_file)
+    njobs : int, optional
+        The number of processes used to generate the variants. Default = 1.
 
-    if pmtrc_mod['exe_script'] != 'exe_wwr_constr':
-        print('This is not the right parametric model json for this execution script')
-        return False
+    use_geom_cache : bool, optional
+        If True, the tessellated geometry is saved next to the ifc and reused in later runs. Default = False.
+
+    delta : bool, optional
+        If True, the variants are written as deltas of the ifc (.ifcdelta.json) instead of full ifc files. Default = False.
+
+    start : int, optional
+        The index of the first variant to generate, see work_queue.select_indices. Default to the first variant.
+
+    stop : int, optional
+        The index of the variant to stop before. Default to after the last variant.
+
+    shard : tuple[int, int], optional
+        The index of the shard and the number of shards to generate, see work_queue.parse_shard. Default to all the variants.
 
-    try:
-        jsonschema.validate(instance=pmtrc_mod, schema=pmtrc_schema)
-    except jsonschema.ValidationError as e:
-        print(e.schema.get("error_msg", e.message))
-        return False 
+    profile_path : str, optional
+        The file path to record the wall time, cpu time and peak memory of each stage of each process, see profiler.enable_profile.
+        Default to not record.
+
+    '''
+    prev_profile_path = profiler.PROFILE_STATE['path']
+    if profile_path is not None:
+        prev_profile_path = profiler.enable_profile(profile_path)
+    with profiler.profile_stage('read_pmtrc'):
+        pmtrc_mod = read_pmtrc_mod(pmtrc_path)
+    if pmtrc_mod is None:
+        profiler.enable_profile(prev_profile_path)
+        return False
     
     pmtr_metas = pmtrc_mod['parameters']
     nmlz_pmtrs = pmtrc_mod['parameter_normalized_values']
     actl_pmtr_val_ls = map_nrmlz_vals(pmtr_metas, nmlz_pmtrs)
 
     # generate ifc variants
-    ifcmodel = ifcopenshell.open(ifc_path)
+    with profiler.profile_stage('ifc_open'):
+        ifcmodel = ifcopenshell.open(ifc_path)
     ifc_bldgs = ifcmodel.by_type('IfcBuilding')
     nbldgs = len(ifc_bldgs)
     if nbldgs == 1:
@@ -436,75 +1053,51 @@ def exe_pmtrc_wwr_constr(pmtrc_path: str, ifc_path: str, res_dir: str):
             res_dir.mkdir(parents=True)
 
         pmtr_metakeys = list(pmtr_metas.keys())
-        for acnt,pmtr_vals in enumerate(actl_pmtr_val_ls):
-            ifcmodel, ifc_wall_ls, ifc_roof_ls, ifc_slab_ls, ifc_win_ls, ifc_gls_door_ls = open_ifc_file(ifc_path)
-            # get the body context 
-            bodies = ifcmodel.by_type('IfcGeometricRepresentationSubContext')
-            chosen_body = None
-            for body in bodies:
-                body_info = body.get_info()
-                body_name = body_info['ContextIdentifier']
-                if body_name == 'Body':    
-                    chosen_body = body
-            wall_dicts = ifc_utils.ifcopenshell_utils.get_ifc_envlp_info(ifc_wall_ls)
-            wall_srf_ls = extract_srfs_frm_envlp_dicts(wall_dicts)
-            spacezn_srfs = map_spzn_srfs2ifcwall(ifcmodel, wall_srf_ls)
-            find_host_of_win(ifc_win_ls, spacezn_srfs)
-            # get all the surfs with windows
-            srf_with_wins = []
-            for srf in spacezn_srfs:
-                if 'wins' in srf.attributes.keys():
-                    srf_with_wins.append(srf)
-            
-            for cnt,pmtr_val in enumerate(pmtr_vals):
-                pmtr_name = pmtr_metakeys[cnt]
-                if pmtr_name == 'north_wwr':
-                    vec = [0,1,0]
-                    change_wwr(pmtr_val, srf_with_wins, vec, ifcmodel, chosen_body)
-                elif pmtr_name == 'south_wwr':
-                    vec = [0,-1,0]
-                    change_wwr(pmtr_val, srf_with_wins, vec, ifcmodel, chosen_body)
-                elif pmtr_name == 'east_wwr':
-                    vec = [1,0,0]
-                    change_wwr(pmtr_val, srf_with_wins, vec, ifcmodel, chosen_body)
-                elif pmtr_name == 'west_wwr':
-                    vec = [-1,0,0]
-                    change_wwr(pmtr_val, srf_with_wins, vec, ifcmodel, chosen_body)
-
-            for cnt,pmtr_val in enumerate(pmtr_vals):
-                pmtr_name = pmtr_metakeys[cnt]
-                if pmtr_name == 'wall_thermal_resistance':
-                    for ifc_wall in ifc_wall_ls:
-                        rval = ifcmodel.createIfcThermalResistanceMeasure(pmtr_val)
-                        ifc_utils.ifcopenshell_utils.edit_pset_val(rval, ifcmodel, ifc_wall, 'Pset_OsmodThermalResistance')
-                elif pmtr_name == 'roof_thermal_resistance':
-                    for ifc_roof in ifc_roof_ls:
-                        rval = ifcmodel.createIfcThermalResistanceMeasure(pmtr_val)
-                        ifc_utils.ifcopenshell_utils.edit_pset_val(rval, ifcmodel, ifc_roof, 'Pset_OsmodThermalResistance')
-                elif pmtr_name == 'floor_thermal_resistance':
-                    for ifc_slab in ifc_slab_ls:
-                        rval = ifcmodel.createIfcThermalResistanceMeasure(pmtr_val)
-                        ifc_utils.ifcopenshell_utils.edit_pset_val(rval, ifcmodel, ifc_slab, 'Pset_OsmodThermalResistance')
-                elif pmtr_name == 'glazing_uvalue':
-                    for ifc_win in ifc_win_ls:
-                        uval = ifcmodel.createIfcThermalTransmittanceMeasure(pmtr_val)
-                        ifc_utils.ifcopenshell_utils.edit_pset_val(uval, ifcmodel, ifc_win, 'Pset_OsmodUfactor')
-                    for ifc_gls_door in ifc_gls_door_ls:
-                        uval = ifcmodel.createIfcThermalTransmittanceMeasure(pmtr_val)
-                        ifc_utils.ifcopenshell_utils.edit_pset_val(uval, ifcmodel, ifc_gls_door, 'Pset_OsmodUfactor')
-                
-            res_path = str(res_dir.joinpath(f"{ifc_filename}_{acnt}.ifc"))
-            # print(res_path)
-            ifcmodel.write(res_path)
-
-        pmtrc_mod['parameter_values'] = actl_pmtr_val_ls.tolist()
-        pretty_json_data = json.dumps(pmtrc_mod, indent=4)
-        with open(pmtrc_path, 'w') as f:
-            f.write(pretty_json_data)
+        # the variants keep the index of their row so that the results can be joined with the parameters
+        var_indices = get_variant_indices(pmtrc_mod)
+        var_indices = work_queue.select_indices(var_indices, start=start, stop=stop, shard=shard)
+        pmtr_val_ls = actl_pmtr_val_ls[var_indices].tolist()
+        nvariants = len(pmtr_val_ls)
+        var_suffix = '.ifc'
+        delta_base_path = None
+        if delta:
+            var_suffix = variant_delta.DELTA_SUFFIX
+            delta_base_path = ifc_path
+        res_paths = [str(res_dir.joinpath(f"{ifc_filename}_{acnt}{var_suffix}")) for acnt in var_indices]
+        tmpl = None
+        geom_cache_path = None
+        if use_geom_cache:
+            # tessellate the base model once in this process, the processes of the pool then load the tessellation from the file
+            tmpl, geom_cache_path = create_cached_variant_template(ifcmodel, ifc_path)
+
+        if njobs <= 1:
+            # analyze the base model once and reuse it for all the variants
+            if tmpl is None:
+                tmpl = create_variant_template(ifcmodel)
+            WORKER_STATE['tmpl'] = tmpl
+            write_variants(pmtr_metakeys, pmtr_val_ls, res_paths, delta_base_path=delta_base_path)
+        else:
+            # shard the variants across the processes, each process analyze the base model once
+            nshards = max(min(nvariants, njobs*4), 1)
+            shard_idxs = np.array_split(np.arange(nvariants), nshards)
+            with ProcessPoolExecutor(max_workers=njobs, initializer=init_variant_worker,
+                                     initargs=(ifc_path, geom_cache_path, profile_path)) as executor:
+                futures = []
+                for shard_idx in shard_idxs:
+                    shard_vals = [pmtr_val_ls[idx] for idx in shard_idx]
+                    shard_paths = [res_paths[idx] for idx in shard_idx]
+                    futures.append(executor.submit(write_variants, pmtr_metakeys, shard_vals, shard_paths, delta_base_path=delta_base_path))
+                for future in futures:
+                    future.result()
+
+        pmtrc_mod['parameter_values'] = actl_pmtr_val_ls
+        with profiler.profile_stage('write_pmtrc'):
+            pmtrc_utils.write_pmtrc_json(pmtrc_mod, pmtrc_path)
 
     else:
         raise Exception("Unexpected number of buildings", nbldgs, "only 1 building allowed")
     
+    profiler.enable_profile(prev_profile_path)
     return True
     
 def main():
@@ -521,7 +1114,12 @@ def main():
 
     ifc_path = str(Path(ifc_path).resolve())
     res_dir = str(Path(res_dir).resolve())
-    is_executed = exe_pmtrc_wwr_constr(pmtrc_path, ifc_path, res_dir)
+    njobs = args.jobs
+    profile_path = args.profile
+    if profile_path is not None:
+        profile_path = str(Path(profile_path).resolve())
+    is_executed = exe_pmtrc_wwr_constr(pmtrc_path, ifc_path, res_dir, njobs=njobs, use_geom_cache=args.cache, delta=args.delta, start=args.start,
+                                       stop=args.stop, shard=args.shard, profile_path=profile_path)
     # print(is_executed)
     # make sure this output can be piped into another command on the cmd
     print(res_dir)
@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import sys
+import json
+import argparse
+import traceback
+from time import perf_counter
+from pathlib import Path
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import exe_wwr_constr
+from . import batch_eval
+from . import pmtrc_utils
+from . import variant_delta
+from . import lazy_import
+
+ifcopenshell = lazy_import.lazy_import('ifcopenshell')
+# openstudio is imported on first use, only the evaluation of the variants needs it
+ifc2osmod = lazy_import.lazy_import('ifc2osmod', submodules=['ifcarch2osmod', 'add_sch2osmod', 'execute_osmod', 'epsql2csv', 'settings'])
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Generate the variants of a parametric model and evaluate them in the same processes")
+
+    # defining arguments for parser object
+    parser.add_argument('-j', '--json', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the json parametric file')
+
+    parser.add_argument('-i', '--ifc', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the original IFC')
+
+    parser.add_argument('-r', '--res', type = str,
+                        metavar = 'DIR',
+                        help = 'The directory path for the results')
+
+    parser.add_argument('-e', '--epw', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the weather file')
+
+    parser.add_argument('-d', '--ddy', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the ddy design day file')
+
+    parser.add_argument('-m', '--measure', type = str, default=None,
+                        metavar = 'FILE',
+                        help = 'The file path of the json measures file that specify which measures to apply to the model')
+
+    parser.add_argument('-k', '--keep', type = str, default=None,
+                        metavar = 'DIR',
+                        help = 'The directory path to archive the IFC of the variants, the IFC are not written if not specified')
+
+    parser.add_argument('-w', '--jobs', type = int, default = 1,
+                        metavar = 'NJOBS',
+                        help = 'The number of variants to generate and evaluate at the same time')
+
+    parser.add_argument('-c', '--cache', action = 'store_true', default=False,
+                        help = 'turn it on to save the tessellated geometry next to the original IFC and reuse it in later runs')
+
+    parser.add_argument('-f', '--force', action = 'store_true', default=False,
+                        help = 'turn it on to evaluate all the variants even if they have valid results')
+
+    parser.add_argument('-p', '--process', action = 'store_true', default=False,
+                        help = 'turn it on if piping in json filepath')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def gen_eval_variant(pmtr_metakeys: list[str], pmtr_vals: list[float], filename: str, res_dir: str, epw_path: str, ddy_path: str,
+                     measure_path: str, input_hashes: dict, versions: dict, ifc_dir: str = None, force: bool = False) -> dict:
+    '''
+    Generate a variant with the variant template of the process and evaluate it. All the stages run in this process. The variant is written
+    for the conversion by patching the text of the template, see variant_delta.write_variant_patch, and removed afterwards unless it is
+    archived. The stdout and stderr of each stage are written to the logs directory of the variant.
+
+    Parameters
+    ----------
+    pmtr_metakeys: list[str]
+        the names of the parameters.
+
+    pmtr_vals: list[float]
+        the actual value of each parameter.
+
+    filename: str
+        The name of the variant.
+
+    res_dir : str
+        The path of the results directory.
+
+    epw_path : str
+        The file path of the weather file.
+
+    ddy_path : str
+        The file path of the ddy design day file.
+
+    measure_path : str
+        The file path of the measures that will be applied to the model.
+
+    input_hashes: dict
+        the hashes of the epw, ddy and measure files that are shared by all the variants.
+
+    versions: dict
+        dictionary generated from batch_eval.get_tool_versions.
+
+    ifc_dir : str, optional
+        The directory path to archive the ifc of the variant. The ifc is not written if not specified.
+
+    force : bool, optional
+        If True evaluate the variant even if it has valid results. Default = False.
+
+    Returns
+    -------
+    dict
+        - name: the name of the variant
+        - status: 'succeeded', 'cached' or 'failed'
+        - returncodes: 0 for each stage that succeeded, 1 for the stage that failed
+        - mins: the time taken in minutes
+    '''
+    t1 = perf_counter()
+    tmpl = exe_wwr_constr.WORKER_STATE['tmpl']
+    ifcmodel = exe_wwr_constr.exe_variant(tmpl, pmtr_metakeys, pmtr_vals)
+    res_paths = batch_eval.get_res_paths(res_dir, filename)
+    this_res_dir = res_paths['res_dir']
+    this_res_dir.mkdir(parents=True, exist_ok=True)
+    # ifcarch2osmod reads the variant from a file, it is written next to its results if it is not archived
+    tmp_ifc_path = None
+    if ifc_dir is not None:
+        ifc_path = str(Path(ifc_dir).joinpath(f"{filename}.ifc"))
+    else:
+        ifc_path = str(this_res_dir.joinpath(f"{filename}.ifc"))
+        tmp_ifc_path = Path(ifc_path)
+    edited_ids = exe_wwr_constr.find_edited_ids(tmpl, ifcmodel, pmtr_metakeys)
+    variant_delta.write_variant_patch(ifcmodel, tmpl, edited_ids, ifc_path)
+    manifest = batch_eval.create_manifest(ifc_path, input_hashes, versions)
+
+    if not force and batch_eval.is_res_valid(res_dir, filename, manifest=manifest):
+        if tmp_ifc_path is not None:
+            tmp_ifc_path.unlink()
+        return {'name': filename, 'status': 'cached', 'returncodes': {}, 'mins': 0.0}
+
+    log_dir = res_paths['log_dir']
+    log_dir.mkdir(parents=True, exist_ok=True)
+    osm_path = str(res_paths['osm'])
+    sql_path = res_paths['sql']
+    csv_dir = res_paths['csv_dir']
+    csv_dir.mkdir(parents=True, exist_ok=True)
+    # remove the results of the previous evaluation so that a crash cannot leave stale results behind
+    if res_paths['manifest'].exists():
+        res_paths['manifest'].unlink()
+    if sql_path.exists():
+        sql_path.unlink()
+
+    stages = [('ifcarch2osmod', lambda: ifc2osmod.ifcarch2osmod.ifcarch2osmod(ifc_path, osm_path, False, ifc2osmod.settings.OSMOD_OPQ_CONSTR_PATH,
+                                                                             ifc2osmod.settings.OSMOD_SMPL_GLZ_CONSTR_PATH)),
+              ('add_sch2osmod', lambda: ifc2osmod.add_sch2osmod.add_sch2osmod(osm_path, 'Small Office', '1A')),
+              ('execute_osmod', lambda: ifc2osmod.execute_osmod.execute(osm_path, str(this_res_dir), epw_path, ddy_path, measure_path)),
+              ('epsql2csv', lambda: ifc2osmod.epsql2csv.extract_sql_info(str(sql_path), str(csv_dir)))]
+
+    status = 'succeeded'
+    returncodes = {}
+    try:
+        for stage_name, stage in stages:
+            with open(log_dir.joinpath(f"{stage_name}.log"), 'w') as log_file, redirect_stdout(log_file), redirect_stderr(log_file):
+                try:
+                    stage()
+                    returncodes[stage_name] = 0
+                except Exception:
+                    traceback.print_exc()
+                    returncodes[stage_name] = 1
+                    status = 'failed'
+            if status == 'failed':
+                break
+            if stage_name == 'execute_osmod' and not sql_path.exists():
+                status = 'failed'
+                break
+    finally:
+        if tmp_ifc_path is not None and tmp_ifc_path.exists():
+            tmp_ifc_path.unlink()
+
+    batch_eval.write_manifest(res_dir, filename, manifest, status)
+    t2 = perf_counter()
+    t21 = round((t2-t1)/60, 1)
+    return {'name': filename, 'status': status, 'returncodes': returncodes, 'mins': t21}
+
+def gen_eval_variants(pmtrc_path: str, ifc_path: str, res_dir: str, epw_path: str, ddy_path: str, measure_path: str, njobs: int = 1,
+                      ifc_dir: str = None, use_geom_cache: bool = False, force: bool = False) -> dict:
+    '''
+    Generate the variants of a parametric model and evaluate them in the same processes, without starting a process for each stage. The results
+    are written in the same layout as batch_eval.
+
+    Parameters
+    ----------
+    pmtrc_path: str
+        The file path of the json parametric model.
+
+    ifc_path : str
+        The file path of ifc.
+
+    res_dir : str
+        The path of the results directory.
+
+    epw_path : str
+        The file path of the weather file.
+
+    ddy_path : str
+        The file path of the ddy design day file.
+
+    measure_path : str
+        The file path of the measures that will be applied to the model.
+
+    njobs : int, optional
+        The number of variants generated and evaluated at the same time. Default = 1.
+
+    ifc_dir : str, optional
+        The directory path to archive the ifc of the variants. The ifc are not written if not specified.
+
+    use_geom_cache : bool, optional
+        If True, the tessellated geometry is saved next to the ifc and reused in later runs. Default = False.
+
+    force : bool, optional
+        If True evaluate all the variants even if they have valid results. Default = False.
+
+    Returns
+    -------
+    dict
+        - succeeded: the names of the variants that have valid results
+        - failed: the names of the variants that failed
+        - variants: the result of each variant, with the status 'succeeded', 'cached' or 'failed'
+    '''
+    pmtrc_mod = exe_wwr_constr.read_pmtrc_mod(pmtrc_path)
+    if pmtrc_mod is None:
+        return None
+
+    pmtr_metas = pmtrc_mod['parameters']
+    nmlz_pmtrs = pmtrc_mod['parameter_normalized_values']
+    actl_pmtr_val_ls = exe_wwr_constr.map_nrmlz_vals(pmtr_metas, nmlz_pmtrs)
+    ifcmodel = ifcopenshell.open(ifc_path)
+    nbldgs = len(ifcmodel.by_type('IfcBuilding'))
+    if nbldgs != 1:
+        raise Exception("Unexpected number of buildings", nbldgs, "only 1 building allowed")
+
+    t1 = perf_counter()
+    res_dir_pobj = Path(res_dir)
+    res_dir_pobj.mkdir(parents=True, exist_ok=True)
+    if ifc_dir is not None:
+        Path(ifc_dir).mkdir(parents=True, exist_ok=True)
+
+    ifc_filename = Path(ifc_path).stem
+    pmtr_metakeys = list(pmtr_metas.keys())
+    # the variants keep the index of their row so that the results can be joined with the parameters
+    var_indices = exe_wwr_constr.get_variant_indices(pmtrc_mod)
+    pmtr_val_ls = actl_pmtr_val_ls[var_indices].tolist()
+    filenames = [f"{ifc_filename}_{acnt}" for acnt in var_indices]
+    input_hashes = {'epw': batch_eval.calc_file_hash(epw_path), 'ddy': batch_eval.calc_file_hash(ddy_path),
+                    'measure': batch_eval.calc_file_hash(measure_path)}
+    versions = batch_eval.get_tool_versions()
+
+    tmpl = None
+    geom_cache_path = None
+    if use_geom_cache:
+        # tessellate the base model once in this process, the processes of the pool then load the tessellation from the file
+        tmpl, geom_cache_path = exe_wwr_constr.create_cached_variant_template(ifcmodel, ifc_path)
+
+    var_res_ls = []
+    if njobs <= 1:
+        if tmpl is None:
+            tmpl = exe_wwr_constr.create_variant_template(ifcmodel)
+        exe_wwr_constr.WORKER_STATE['tmpl'] = tmpl
+        for filename, pmtr_vals in zip(filenames, pmtr_val_ls):
+            print(f"executing openstudio model ... {filename}")
+            var_res = gen_eval_variant(pmtr_metakeys, pmtr_vals, filename, res_dir, epw_path, ddy_path, measure_path, input_hashes, versions,
+                                       ifc_dir=ifc_dir, force=force)
+            print(f"{var_res['name']} {var_res['status']} {var_res['mins']} mins")
+            var_res_ls.append(var_res)
+    else:
+        # each process analyze the base model once and generates and evaluates the variants one at a time
+        with ProcessPoolExecutor(max_workers=njobs, initializer=exe_wwr_constr.init_variant_worker,
+                                 initargs=(ifc_path, geom_cache_path)) as executor:
+            futures = []
+            for filename, pmtr_vals in zip(filenames, pmtr_val_ls):
+                futures.append(executor.submit(gen_eval_variant, pmtr_metakeys, pmtr_vals, filename, res_dir, epw_path, ddy_path, measure_path,
+                                               input_hashes, versions, ifc_dir=ifc_dir, force=force))
+            for future in as_completed(futures):
+                var_res = future.result()
+                print(f"{var_res['name']} {var_res['status']} {var_res['mins']} mins")
+                var_res_ls.append(var_res)
+
+    pmtrc_mod['parameter_values'] = actl_pmtr_val_ls
+    pmtrc_utils.write_pmtrc_json(pmtrc_mod, pmtrc_path)
+
+    var_res_ls = sorted(var_res_ls, key=lambda var_res: var_res['name'])
+    succeeded = [var_res['name'] for var_res in var_res_ls if var_res['status'] in ['succeeded', 'cached']]
+    failed = [var_res['name'] for var_res in var_res_ls if var_res['name'] not in succeeded]
+    summary = {'succeeded': succeeded, 'failed': failed, 'variants': var_res_ls}
+    pretty_json_data = json.dumps(summary, indent=4)
+    with open(res_dir_pobj.joinpath('gen_eval_summary.json'), 'w') as f:
+        f.write(pretty_json_data)
+
+    t2 = perf_counter()
+    t21 = round((t2 - t1)/60, 1)
+    ncached = len([var_res for var_res in var_res_ls if var_res['status'] == 'cached'])
+    print(f"{len(succeeded)} succeeded ({ncached} from cache), {len(failed)} failed")
+    for name in failed:
+        print(f"failed: {name}, see {res_dir_pobj.joinpath(name, 'logs')}")
+    print(f"{t21} mins")
+    return summary
+
+def main():
+    args = parse_args()
+    pipe_input = args.process
+    if pipe_input == False:
+        pmtrc_path = args.json
+    else:
+        lines = list(sys.stdin)
+        pmtrc_path = lines[0].strip()
+
+    pmtrc_path = str(Path(pmtrc_path).resolve())
+    ifc_path = str(Path(args.ifc).resolve())
+    res_dir = str(Path(args.res).resolve())
+    epw_path = str(Path(args.epw).resolve())
+    ddy_path = str(Path(args.ddy).resolve())
+    mea_path = None
+    if args.measure is not None:
+        mea_path = str(Path(args.measure).resolve())
+    ifc_dir = None
+    if args.keep is not None:
+        ifc_dir = str(Path(args.keep).resolve())
+    gen_eval_variants(pmtrc_path, ifc_path, res_dir, epw_path, ddy_path, mea_path, njobs=args.jobs, ifc_dir=ifc_dir,
+                      use_geom_cache=args.cache, force=args.force)
+    # make sure this output can be piped into another command on the cmd
+    print(res_dir)
+    sys.stdout.flush()
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
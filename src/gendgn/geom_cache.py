@@ -0,0 +1,441 @@
+from __future__ import annotations
+
+import copy
+import json
+import hashlib
+import zipfile
+from pathlib import Path
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import cpu_count
+
+import numpy as np
+
+from . import geom_utils
+from . import lazy_import
+
+ifcopenshell = lazy_import.lazy_import('ifcopenshell', submodules=['geom'])
+geomie3d = lazy_import.lazy_import('geomie3d')
+ifc_utils = lazy_import.lazy_import('ifc_utils', submodules=['ifcopenshell_utils'])
+
+# the tessellated geometry of the ifc entities, the least recently used geometry is evicted first when the cache is full
+GEOM_CACHE = {'entries': OrderedDict(), 'max_size': 4096, 'hits': 0, 'misses': 0}
+# increase when the format of the cached geometry or its keys changes, persisted caches with another version are ignored
+CACHE_VERSION = 3
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def calc_geom_key(ifc_object: ifcopenshell.entity_instance, geom_type: str) -> str:
+    '''
+    Calculate the key of the geometry of an ifc object. The key is the GlobalId and a hash of the representation and placement of the object
+    and of its openings, a changed representation or opening gives a different key.
+
+    Parameters
+    ----------
+    ifc_object: ifcopenshell.entity_instance
+        the ifc object.
+
+    geom_type: str
+        the type of geometry cached e.g. 'facegeom' or 'g3d'.
+
+    Returns
+    -------
+    str
+        the key.
+    '''
+    ifcmodel = ifc_object.file
+    hasher = hashlib.sha256()
+    # the openings are cut from the tessellation of the object, e.g. a wall with the openings of its windows
+    geom_objs = [ifc_object]
+    if hasattr(ifc_object, 'HasOpenings'):
+        geom_objs.extend([rel.RelatedOpeningElement for rel in ifc_object.HasOpenings])
+    for geom_obj in geom_objs:
+        for attr_name in ['Representation', 'ObjectPlacement']:
+            attr_val = getattr(geom_obj, attr_name)
+            if attr_val is not None:
+                for ent in ifcmodel.traverse(attr_val):
+                    hasher.update(ent.to_string().encode())
+    return f"{geom_type}:{ifc_object.GlobalId}:{hasher.hexdigest()}"
+
+def get_cached_geom(key: str):
+    '''
+    Get the geometry from the cache.
+
+    Parameters
+    ----------
+    key: str
+        the key from calc_geom_key.
+
+    Returns
+    -------
+    the cached geometry, None if it is not cached.
+    '''
+    entries = GEOM_CACHE['entries']
+    if key in entries:
+        entries.move_to_end(key)
+        GEOM_CACHE['hits'] += 1
+        return entries[key]
+    GEOM_CACHE['misses'] += 1
+    return None
+
+def put_cached_geom(key: str, geom):
+    '''
+    Put the geometry into the cache and evict the least recently used geometry if the cache is full.
+
+    Parameters
+    ----------
+    key: str
+        the key from calc_geom_key.
+
+    geom:
+        the geometry.
+    '''
+    entries = GEOM_CACHE['entries']
+    entries[key] = geom
+    entries.move_to_end(key)
+    while len(entries) > GEOM_CACHE['max_size']:
+        entries.popitem(last=False)
+
+def set_geom_cache_size(max_size: int):
+    '''
+    Set the maximum number of geometries kept in the cache.
+
+    Parameters
+    ----------
+    max_size: int
+        the maximum number of geometries.
+    '''
+    GEOM_CACHE['max_size'] = max_size
+    entries = GEOM_CACHE['entries']
+    while len(entries) > max_size:
+        entries.popitem(last=False)
+
+@contextmanager
+def pin_geom_cache():
+    '''
+    Keep all the geometries put into the cache for the duration of the with block, e.g. while the geometries of a model are loaded and analyzed.
+    The maximum size is restored and the least recently used geometries are evicted at the end of the block, also when it raises. Nested blocks
+    keep the geometries until the outermost block ends.
+    '''
+    prev_max_size = GEOM_CACHE['max_size']
+    GEOM_CACHE['max_size'] = float('inf')
+    try:
+        yield
+    finally:
+        set_geom_cache_size(prev_max_size)
+
+def clear_geom_cache():
+    '''
+    Remove all the geometries from the cache.
+    '''
+    GEOM_CACHE['entries'].clear()
+    GEOM_CACHE['hits'] = 0
+    GEOM_CACHE['misses'] = 0
+
+def get_ifc_facegeom(ifc_object: ifcopenshell.entity_instance) -> tuple:
+    '''
+    Cached version of ifc_utils.ifcopenshell_utils.get_ifc_facegeom.
+
+    Parameters
+    ----------
+    ifc_object : ifcopenshell.entity_instance
+        ifcopenshell entity.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        tuple[np.ndarray[number_of_verts, 3], np.ndarray[number_of_faces, 3]]
+    '''
+    key = calc_geom_key(ifc_object, 'facegeom')
+    facegeom = get_cached_geom(key)
+    if facegeom is None:
+        facegeom = ifc_utils.ifcopenshell_utils.get_ifc_facegeom(ifc_object)
+        put_cached_geom(key, facegeom)
+    verts3d, face_idx3d = facegeom
+    return verts3d.copy(), face_idx3d.copy()
+
+def ifcopenshell_entity_geom2g3d(ifc_object: ifcopenshell.entity_instance) -> list[geomie3d.topobj.Face]:
+    '''
+    Cached version of ifc_utils.ifcopenshell_utils.ifcopenshell_entity_geom2g3d. A copy of the cached faces is returned, so the attributes of
+    the faces can be changed.
+
+    Parameters
+    ----------
+    ifc_object: ifcopenshell.entity_instance
+        the ifc_object to retrieve geometry from.
+
+    Returns
+    -------
+    list[geomie3d.topobj.Face]
+        list of geomie3d faces.
+    '''
+    key = calc_geom_key(ifc_object, 'g3d')
+    faces = get_cached_geom(key)
+    if faces is None:
+        verts3d, face_idx3d = get_ifc_facegeom(ifc_object)
+        faces = geom_utils.triangles2g3d_faces(verts3d, face_idx3d)
+        put_cached_geom(key, copy.deepcopy(faces))
+        return faces
+    return copy.deepcopy(faces)
+
+def load_ifc_geoms(ifcmodel: ifcopenshell.file, ifc_objects: list[ifcopenshell.entity_instance], nthreads: int = None) -> dict:
+    '''
+    Tessellate the ifc objects in one pass with the multithreaded geometry iterator of ifcopenshell. The tessellations are also put into the
+    cache, objects already in the cache are not tessellated again.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        The ifc model.
+
+    ifc_objects: list[ifcopenshell.entity_instance]
+        the ifc objects to tessellate, objects without representation are skipped.
+
+    nthreads: int, optional
+        the number of threads used by the iterator. Default to the number of cpus.
+
+    Returns
+    -------
+    dict
+        - guids: the guids of the tessellated objects
+        - guid_indx: dictionary of the guid to the index of the object
+        - verts: np.ndarray[shape(nverts, 3)] the vertices of all the objects
+        - tris: np.ndarray[shape(ntriangles, 3)] the vertex indices of the triangles of all the objects, local to each object
+        - vert_offsets, tri_offsets: np.ndarray[shape(nobjs+1)] the vertices and triangles of object i are from offsets[i] to offsets[i+1]
+    '''
+    if nthreads is None:
+        nthreads = cpu_count()
+    keys = {}
+    # the geometries of this call are kept here, the cache may evict them while the rest is loaded
+    facegeoms = {}
+    to_tessellate = []
+    for ifc_object in ifc_objects:
+        if ifc_object.Representation is None:
+            continue
+        key = calc_geom_key(ifc_object, 'facegeom')
+        keys[ifc_object.GlobalId] = key
+        facegeom = get_cached_geom(key)
+        if facegeom is None:
+            to_tessellate.append(ifc_object)
+        else:
+            facegeoms[key] = facegeom
+
+    if len(to_tessellate) != 0:
+        settings = ifcopenshell.geom.settings()
+        iterator = ifcopenshell.geom.iterator(settings, ifcmodel, nthreads, include=to_tessellate)
+        if iterator.initialize():
+            while True:
+                shape = iterator.get()
+                verts3d = np.reshape(shape.geometry.verts, (-1, 3))
+                face_idx3d = np.reshape(shape.geometry.faces, (-1, 3))
+                facegeoms[keys[shape.guid]] = (verts3d, face_idx3d)
+                put_cached_geom(keys[shape.guid], (verts3d, face_idx3d))
+                if not iterator.next():
+                    break
+
+    guids = []
+    verts = []
+    tris = []
+    vert_offsets = [0]
+    tri_offsets = [0]
+    for guid, key in keys.items():
+        facegeom = facegeoms.get(key)
+        if facegeom is None:
+            # the iterator could not tessellate it
+            continue
+        verts3d, face_idx3d = facegeom
+        guids.append(guid)
+        verts.append(verts3d)
+        tris.append(face_idx3d)
+        vert_offsets.append(vert_offsets[-1] + len(verts3d))
+        tri_offsets.append(tri_offsets[-1] + len(face_idx3d))
+
+    ifc_geoms = {'guids': guids, 'guid_indx': {guid: cnt for cnt, guid in enumerate(guids)},
+                 'verts': np.concatenate(verts) if verts else np.zeros((0, 3)),
+                 'tris': np.concatenate(tris) if tris else np.zeros((0, 3), dtype=int),
+                 'vert_offsets': np.array(vert_offsets), 'tri_offsets': np.array(tri_offsets)}
+    return ifc_geoms
+
+def get_ifc_geom(ifc_geoms: dict, guid: str) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Get the tessellation of an object from the result of load_ifc_geoms.
+
+    Parameters
+    ----------
+    ifc_geoms: dict
+        dictionary generated from load_ifc_geoms.
+
+    guid: str
+        the guid of the object.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        tuple[np.ndarray[number_of_verts, 3], np.ndarray[number_of_faces, 3]]
+    '''
+    indx = ifc_geoms['guid_indx'][guid]
+    vert_offsets = ifc_geoms['vert_offsets']
+    tri_offsets = ifc_geoms['tri_offsets']
+    verts3d = ifc_geoms['verts'][vert_offsets[indx]:vert_offsets[indx+1]]
+    face_idx3d = ifc_geoms['tris'][tri_offsets[indx]:tri_offsets[indx+1]]
+    return verts3d, face_idx3d
+
+def get_geom_cache_path(ifc_path: str) -> str:
+    '''
+    Get the path of the persisted cache of an ifc file, it is next to the ifc file.
+
+    Parameters
+    ----------
+    ifc_path: str
+        The file path of ifc.
+
+    Returns
+    -------
+    str
+        the path of the cache file.
+    '''
+    ifc_path = Path(ifc_path)
+    return str(ifc_path.with_name(f"{ifc_path.stem}.geomcache"))
+
+def g3d_faces2arrays(faces: list[geomie3d.topobj.Face]) -> tuple[list[np.ndarray], list[int]]:
+    '''
+    Convert geomie3d faces into the points of their loops, the boundary of each face followed by its holes.
+
+    Parameters
+    ----------
+    faces: list[geomie3d.topobj.Face]
+        the faces.
+
+    Returns
+    -------
+    tuple[list[np.ndarray], list[int]]
+        - the points of each loop, np.ndarray[shape(npts, 3)]
+        - the number of loops of each face
+    '''
+    loops = []
+    nloops = []
+    for face in faces:
+        face_loops = [geomie3d.get.bdry_vertices_frm_face(face)]
+        if face.hole_wire_list:
+            face_loops.extend([geomie3d.get.vertices_frm_wire(hole_wire) for hole_wire in face.hole_wire_list])
+        loops.extend([np.array([vert.point.xyz for vert in loop], dtype=float).reshape(-1, 3) for loop in face_loops])
+        nloops.append(len(face_loops))
+    return loops, nloops
+
+def arrays2g3d_faces(loops: list[np.ndarray], nloops: list[int]) -> list[geomie3d.topobj.Face]:
+    '''
+    Convert the points of the loops from g3d_faces2arrays back into geomie3d faces.
+
+    Parameters
+    ----------
+    loops: list[np.ndarray]
+        the points of each loop, np.ndarray[shape(npts, 3)].
+
+    nloops: list[int]
+        the number of loops of each face.
+
+    Returns
+    -------
+    list[geomie3d.topobj.Face]
+        the faces.
+    '''
+    faces = []
+    loop_indx = 0
+    for face_nloops in nloops:
+        face_loops = [geomie3d.create.vertex_list(loop) for loop in loops[loop_indx:loop_indx+face_nloops]]
+        faces.append(geomie3d.create.polygon_face_frm_verts(face_loops[0], hole_vertex_list=face_loops[1:]))
+        loop_indx += face_nloops
+    return faces
+
+def load_geom_cache(cache_path: str) -> int:
+    '''
+    Load a persisted cache into the cache. The cache only holds arrays and json, it is read without pickle so loading a cache file cannot
+    execute code.
+
+    Parameters
+    ----------
+    cache_path: str
+        the path of the cache file.
+
+    Returns
+    -------
+    int
+        the number of geometries loaded.
+    '''
+    cache_path = Path(cache_path)
+    if not cache_path.exists():
+        return 0
+    try:
+        with np.load(cache_path, allow_pickle=False) as persisted:
+            meta = json.loads(str(persisted['meta']))
+            if meta.get('version') != CACHE_VERSION:
+                return 0
+            arrays = {name: persisted[name] for name in persisted.files if name != 'meta'}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return 0
+
+    vert_offsets = arrays['facegeom_vert_offsets']
+    tri_offsets = arrays['facegeom_tri_offsets']
+    for cnt, key in enumerate(meta['facegeom_keys']):
+        verts3d = arrays['facegeom_verts'][vert_offsets[cnt]:vert_offsets[cnt+1]]
+        face_idx3d = arrays['facegeom_tris'][tri_offsets[cnt]:tri_offsets[cnt+1]]
+        put_cached_geom(key, (verts3d, face_idx3d))
+
+    pt_offsets = arrays['g3d_pt_offsets']
+    loops = [arrays['g3d_pts'][pt_offsets[cnt]:pt_offsets[cnt+1]] for cnt in range(len(pt_offsets) - 1)]
+    nloops = arrays['g3d_nloops'].tolist()
+    face_offsets = arrays['g3d_face_offsets']
+    loop_offsets = np.concatenate([[0], np.cumsum(nloops)]).astype(int)
+    for cnt, key in enumerate(meta['g3d_keys']):
+        face_nloops = nloops[face_offsets[cnt]:face_offsets[cnt+1]]
+        face_loops = loops[loop_offsets[face_offsets[cnt]]:loop_offsets[face_offsets[cnt+1]]]
+        put_cached_geom(key, arrays2g3d_faces(face_loops, face_nloops))
+    return len(meta['facegeom_keys']) + len(meta['g3d_keys'])
+
+def save_geom_cache(cache_path: str):
+    '''
+    Persist the cache to a file. The arrays are stored with np.savez and the keys as json, without pickle.
+
+    Parameters
+    ----------
+    cache_path: str
+        the path of the cache file.
+    '''
+    facegeom_keys = []
+    verts = []
+    tris = []
+    g3d_keys = []
+    loops = []
+    nloops = []
+    face_offsets = [0]
+    for key, geom in GEOM_CACHE['entries'].items():
+        if key.startswith('facegeom:'):
+            facegeom_keys.append(key)
+            verts.append(np.asarray(geom[0], dtype=float).reshape(-1, 3))
+            tris.append(np.asarray(geom[1], dtype=int).reshape(-1, 3))
+        elif key.startswith('g3d:'):
+            g3d_keys.append(key)
+            face_loops, face_nloops = g3d_faces2arrays(geom)
+            loops.extend(face_loops)
+            nloops.extend(face_nloops)
+            face_offsets.append(face_offsets[-1] + len(face_nloops))
+
+    meta = {'version': CACHE_VERSION, 'facegeom_keys': facegeom_keys, 'g3d_keys': g3d_keys}
+    arrays = {'meta': np.array(json.dumps(meta)),
+              'facegeom_verts': np.concatenate(verts) if verts else np.zeros((0, 3)),
+              'facegeom_tris': np.concatenate(tris) if tris else np.zeros((0, 3), dtype=int),
+              'facegeom_vert_offsets': np.concatenate([[0], np.cumsum([len(vert) for vert in verts])]).astype(int),
+              'facegeom_tri_offsets': np.concatenate([[0], np.cumsum([len(tri) for tri in tris])]).astype(int),
+              'g3d_pts': np.concatenate(loops) if loops else np.zeros((0, 3)),
+              'g3d_pt_offsets': np.concatenate([[0], np.cumsum([len(loop) for loop in loops])]).astype(int),
+              'g3d_nloops': np.array(nloops, dtype=int),
+              'g3d_face_offsets': np.array(face_offsets, dtype=int)}
+    cache_path = Path(cache_path)
+    # write to a temporary file first so that a concurrent reader never sees a partial file
+    tmp_path = cache_path.with_name(f"{cache_path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    tmp_path.replace(cache_path)
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import copy
+
+import numpy as np
+
+from . import lazy_import
+
+geomie3d = lazy_import.lazy_import('geomie3d')
+ifc_utils = lazy_import.lazy_import('ifc_utils', submodules=['ifcopenshell_utils'])
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def build_srf_index(srf_ls: list[geomie3d.topobj.Face]) -> dict:
+    '''
+    Build a bounding box index over the surfaces for closest surface queries. The boundary points and normals of the surfaces are extracted once.
+
+    Parameters
+    ----------
+    srf_ls: list[geomie3d.topobj.Face]
+        the surfaces to index.
+
+    Returns
+    -------
+    dict
+        - srfs: the indexed surfaces
+        - polyxyzs: the boundary points of each surface
+        - nrmls: np.ndarray[shape(nsrfs, 3)] the normal of each surface
+        - bbox_mins, bbox_maxs: np.ndarray[shape(nsrfs, 3)] the bounding box of each surface
+        - margin: the distance tolerance used to prune the surfaces
+    '''
+    polyxyzs = []
+    nrmls = []
+    bbox_mins = []
+    bbox_maxs = []
+    for srf in srf_ls:
+        fvs = geomie3d.get.bdry_vertices_frm_face(srf)
+        nrml = geomie3d.get.face_normal(srf)
+        xyzs = [v.point.xyz.tolist() for v in fvs]
+        polyxyzs.append(xyzs)
+        nrmls.append(nrml)
+        xyzs = np.array(xyzs)
+        bbox_mins.append(np.min(xyzs, axis=0))
+        bbox_maxs.append(np.max(xyzs, axis=0))
+
+    bbox_mins = np.array(bbox_mins)
+    bbox_maxs = np.array(bbox_maxs)
+    # the point in polygon test of geomie3d is done with tolerances, a point can be closer to a surface than its bounding box by the tolerances
+    if len(srf_ls) != 0:
+        max_coord = max(np.max(np.abs(bbox_mins)), np.max(np.abs(bbox_maxs)))
+    else:
+        max_coord = 0
+    margin = 1e-6 + geomie3d.settings.ATOL + geomie3d.settings.RTOL*max_coord
+    srf_index = {'srfs': srf_ls, 'polyxyzs': polyxyzs, 'nrmls': np.array(nrmls), 'bbox_mins': bbox_mins, 'bbox_maxs': bbox_maxs,
+                 'margin': margin}
+    return srf_index
+
+def find_srf_closest2pt(xyz: list[float], srf_index: dict, intx_pt: bool = False) -> geomie3d.topobj.Face | tuple[geomie3d.topobj.Face, list[float]]:
+    '''
+    Find the surface in the index that is closest to the point. Gives the same result as ifc_utils.ifcopenshell_utils.find_srf_closest2this_pt
+    but only measures the distance to the surfaces whose bounding box is close enough to the point.
+
+    Parameters
+    ----------
+    xyz: list[float]
+        list[shape(3)] the point.
+
+    srf_index: dict
+        dictionary generated from build_srf_index.
+
+    intx_pt: bool, optional
+        if set to True, returns the closest point between the point and the closest surface.
+
+    Returns
+    -------
+    geomie3d.topobj.Face | tuple[geomie3d.topobj.Face, list[float]]
+        - the face closest to the point
+        - the closest point on the surface to the point
+    '''
+    xyz = np.array(xyz)
+    # the distance to the bounding box is a lower bound of the distance to the surface
+    box_dists = np.maximum(np.maximum(srf_index['bbox_mins'] - xyz, xyz - srf_index['bbox_maxs']), 0)
+    lbs = np.linalg.norm(box_dists, axis=1)
+    order = np.argsort(lbs, kind='stable')
+    nsrfs = len(order)
+    margin = srf_index['margin']
+    polyxyzs = srf_index['polyxyzs']
+    nrmls = srf_index['nrmls']
+
+    chosen_indxs = []
+    chosen_dists = []
+    chosen_intxs = []
+    min_dist = np.inf
+    start = 0
+    batch = 8
+    while start < nsrfs and lbs[order[start]] <= min_dist + margin:
+        end = min(start + batch, nsrfs)
+        batch_indxs = order[start:end]
+        batch_indxs = batch_indxs[lbs[batch_indxs] <= min_dist + margin]
+        xyz_rep = np.repeat([xyz], len(batch_indxs), axis=0)
+        dists, intxs = geomie3d.calculate.dist_pointxyzs2polyxyzs(xyz_rep, [polyxyzs[i] for i in batch_indxs], nrmls[batch_indxs],
+                                                                  int_pts=True)
+        dists = np.round(dists, decimals=6)
+        chosen_indxs.extend(batch_indxs.tolist())
+        chosen_dists.extend(dists.tolist())
+        chosen_intxs.extend(intxs)
+        min_dist = min(min_dist, np.min(dists))
+        start = end
+        batch *= 2
+
+    # same as the brute force search, choose the first surface with the minimum distance
+    chosen_dists = np.array(chosen_dists)
+    is_min = np.where(chosen_dists == min_dist)[0]
+    min_cnt = is_min[np.argmin(np.array(chosen_indxs)[is_min])]
+    closest_srf = srf_index['srfs'][chosen_indxs[min_cnt]]
+    if intx_pt:
+        # same precision as the vertices of geomie3d
+        intx = geomie3d.create.vertex(chosen_intxs[min_cnt])
+        intxyz = intx.point.xyz.tolist()
+        return closest_srf, intxyz
+    else:
+        return closest_srf
+
+def find_srf_closest2srf(srf: geomie3d.topobj.Face, srf_index: dict) -> geomie3d.topobj.Face:
+    '''
+    Find the surface in the index that is closest to srf. Gives the same result as ifc_utils.ifcopenshell_utils.find_srf_closest2this_srf.
+
+    Parameters
+    ----------
+    srf: geomie3d.topobj.Face
+        the surface.
+
+    srf_index: dict
+        dictionary generated from build_srf_index.
+
+    Returns
+    -------
+    geomie3d.topobj.Face
+        the face closest to this srf
+    '''
+    midxyz = geomie3d.calculate.face_midxyz(srf)
+    closest_srf = find_srf_closest2pt(midxyz, srf_index)
+    return closest_srf
+
+def triangles2g3d_faces(verts3d: np.ndarray, face_idx3d: np.ndarray) -> list[geomie3d.topobj.Face]:
+    '''
+    Merge the triangulated faces of an ifc object into geomie3d faces. This is a copy of the merging in
+    ifc_utils.ifcopenshell_utils.ifcopenshell_entity_geom2g3d of ifc_utils 0.0.5, which tessellates the ifc object itself, with the tessellation 
+    as input instead so that the tessellation can be done in bulk. Keep it in step with ifc_utils when the ifc_utils version is updated.
+
+    Parameters
+    ----------
+    verts3d: np.ndarray
+        np.ndarray[shape(nverts, 3)] the vertices of the tessellation.
+
+    face_idx3d: np.ndarray
+        np.ndarray[shape(ntriangles, 3)] the vertex indices of the triangles.
+
+    Returns
+    -------
+    list[geomie3d.topobj.Face]
+        list of geomie3d faces.
+    '''
+    g3d_verts = geomie3d.create.vertex_list(verts3d)
+    face_pts = np.take(g3d_verts, face_idx3d, axis=0)
+    flist = []
+    for fp in face_pts:
+        f = geomie3d.create.polygon_face_frm_verts(fp)
+        flist.append(f)
+
+    grp_faces = geomie3d.calculate.grp_faces_on_nrml(flist)
+    all_merged_faces = grp_faces[1]
+    for grp_f in grp_faces[0]:
+        grpf_merged = []
+        outline = geomie3d.calculate.find_faces_outline(grp_f)[0]
+        n_loose_edges = 3
+        loop_cnt = 0
+        while n_loose_edges >= 3:
+            # arrange the outline into connected path for creating a valid face
+            path_dict = geomie3d.calculate.a_connected_path_from_edges(outline)
+            outline = path_dict['connected']
+            bwire = geomie3d.create.wire_frm_edges(outline)
+            mf = geomie3d.create.polygon_face_frm_wires(bwire)
+            grpf_merged.append(mf)
+
+            outline = path_dict['loose']
+            if loop_cnt == 0:
+                n_loose_edges = len(path_dict['loose'])
+            else:
+                if n_loose_edges - len(path_dict['loose']) == 0:
+                    n_loose_edges = 0
+                else:        
+                    n_loose_edges = len(path_dict['loose'])
+            loop_cnt+=1
+
+        holes_dict = ifc_utils.ifcopenshell_utils.sepr_holes_faces(grpf_merged, grp_f)
+        grpf_merged_nh = holes_dict['non_holes']
+        n_merged = len(grpf_merged_nh)
+        holes = holes_dict['holes']
+        if holes:
+            # find the host surface the holes belong to
+            parent_dict = {}
+            for hole in holes:
+                hvs = geomie3d.get.bdry_vertices_frm_face(hole)
+                hvs = np.array([hvs])
+                hvs = np.repeat(hvs, n_merged, axis=0)
+                in_polys = geomie3d.calculate.are_verts_in_polygons(hvs, grpf_merged_nh)
+                host_indx = []
+                for cnt, in_poly in enumerate(in_polys):
+                    # look for the first one assumes one hole to one parent surface
+                    if False not in in_poly:
+                        host_indx.append(cnt)
+                        break
+                if len(host_indx) == 1:
+                    # add the hole onto the parent surface
+                    parent_srf = grpf_merged[host_indx[0]]
+                    p_nrml = geomie3d.get.face_normal(parent_srf)
+                    h_nrml = geomie3d.get.face_normal(hole)
+                    is_same_dir = np.isclose(p_nrml, h_nrml)
+                    if False not in is_same_dir:
+                        hole = geomie3d.modify.reverse_face_normal(hole)
+                    hole_wires = geomie3d.get.bdry_wires_frm_face(hole)
+                    if host_indx[0] not in parent_dict.keys():
+                        parent_dict[host_indx[0]] = [hole_wires]
+                    else:
+                        parent_dict[host_indx[0]].append(hole_wires)
+            for key, hole_wire_list in parent_dict.items():
+                parent_srf = copy.deepcopy(grpf_merged_nh[key])
+                parent_srf.hole_wire_list = hole_wire_list
+                parent_srf.update_polygon_surface()
+                grpf_merged_nh[key] = parent_srf
+
+        all_merged_faces.extend(grpf_merged_nh)
+    return all_merged_faces
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
@@ -0,0 +1,109 @@
+import io
+import sys
+import types
+import importlib
+from contextlib import redirect_stdout
+
+# the stdout printed while importing the modules imported quietly, e.g. the notes of the ifcopenshell apis that need blender
+IMPORT_NOTES = {}
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+class LazyModule(types.ModuleType):
+    '''
+    Placeholder of a module that imports the module and its submodules on the first attribute access, so that the command line tools only
+    import the heavy modules on the code paths that use them. Attributes are read from the imported module, set attributes on the
+    module itself, e.g. lazy_mod.load_module().attr = val.
+    '''
+    def __init__(self, name: str, submodules: list[str], quiet: bool):
+        super().__init__(name)
+        self.__dict__['_lazy_submodules'] = submodules
+        self.__dict__['_lazy_quiet'] = quiet
+        self.__dict__['_lazy_module'] = None
+
+    def __getattr__(self, attr: str):
+        module = self._lazy_module
+        if module is None:
+            module = self.load_module()
+        return getattr(module, attr)
+
+    def load_module(self) -> types.ModuleType:
+        '''
+        Import the module and its submodules.
+
+        Returns
+        -------
+        types.ModuleType
+            the imported module.
+        '''
+        name = self.__name__
+        if self._lazy_quiet:
+            module = import_quietly(name, submodules=self._lazy_submodules)
+        else:
+            module = importlib.import_module(name)
+            for sub in self._lazy_submodules:
+                importlib.import_module(f"{name}.{sub}")
+        self.__dict__['_lazy_module'] = module
+        return module
+
+def lazy_import(name: str, submodules: list[str] = None, quiet: bool = False) -> types.ModuleType:
+    '''
+    Import a module when it is first used. Use it instead of import for the modules that take long to import and are not needed by all the
+    code paths, e.g. ifcopenshell = lazy_import('ifcopenshell', submodules=['geom']).
+
+    Parameters
+    ----------
+    name: str
+        the name of the module.
+
+    submodules: list[str], optional
+        the submodules to import together with the module, e.g. ['geom', 'util.unit'] for ifcopenshell.geom and ifcopenshell.util.unit.
+        Default to none.
+
+    quiet: bool, optional
+        If True the stdout printed while importing is kept in IMPORT_NOTES instead, see import_quietly. Default = False.
+
+    Returns
+    -------
+    types.ModuleType
+        the module if it is already imported, otherwise a LazyModule.
+    '''
+    if submodules is None:
+        submodules = []
+    module = sys.modules.get(name)
+    if module is not None and all(f"{name}.{sub}" in sys.modules for sub in submodules):
+        return module
+    return LazyModule(name, submodules, quiet)
+
+def import_quietly(name: str, submodules: list[str] = None) -> types.ModuleType:
+    '''
+    Import a module and its submodules with their stdout kept in IMPORT_NOTES. ifcopenshell.api prints a note for each api that needs blender
+    (bpy) whenever it is imported, which would end up in the piped output of the command line tools. Importing it before the worker processes
+    are forked probes the apis once for all the processes.
+
+    Parameters
+    ----------
+    name: str
+        the name of the module.
+
+    submodules: list[str], optional
+        the submodules to import together with the module. Default to none.
+
+    Returns
+    -------
+    types.ModuleType
+        the imported module.
+    '''
+    if submodules is None:
+        submodules = []
+    notes = io.StringIO()
+    with redirect_stdout(notes):
+        module = importlib.import_module(name)
+        for sub in submodules:
+            importlib.import_module(f"{name}.{sub}")
+    if notes.getvalue():
+        IMPORT_NOTES[name] = IMPORT_NOTES.get(name, '') + notes.getvalue()
+    return module
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
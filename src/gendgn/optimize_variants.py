@@ -0,0 +1,431 @@
+import sys
+import argparse
+from time import perf_counter
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import exe_wwr_constr
+from . import batch_eval
+from . import gen_eval
+from . import collect_results
+from . import pmtrc_utils
+from . import lazy_import
+
+# imported on first use so that the arguments are parsed before the optimization and geometry stack is loaded
+ifcopenshell = lazy_import.lazy_import('ifcopenshell')
+pymoo = lazy_import.lazy_import('pymoo', submodules=['core.problem', 'core.evaluator', 'problems.static', 'algorithms.moo.nsga2',
+                                                     'algorithms.soo.nonconvex.ga', 'operators.sampling.lhs'])
+
+# the objective values given to the variants that failed, they are also marked infeasible so that they never dominate a variant that succeeded
+FAIL_PENALTY = 1e30
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Optimize the parameters of a parametric model by generating and evaluating the variants generation by generation")
+
+    # defining arguments for parser object
+    parser.add_argument('-j', '--json', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the json parametric file')
+
+    parser.add_argument('-i', '--ifc', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the original IFC')
+
+    parser.add_argument('-r', '--res', type = str,
+                        metavar = 'DIR',
+                        help = 'The directory path for the results')
+
+    parser.add_argument('-e', '--epw', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the weather file')
+
+    parser.add_argument('-d', '--ddy', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the ddy design day file')
+
+    parser.add_argument('-m', '--measure', type = str, default=None,
+                        metavar = 'FILE',
+                        help = 'The file path of the json measures file that specify which measures to apply to the model')
+
+    parser.add_argument('-a', '--algorithm', type = str, default = 'nsga2', choices = ['nsga2', 'ga'],
+                        help = 'The optimization algorithm, ga only takes a single objective')
+
+    parser.add_argument('-o', '--objectives', type = str, nargs = '+', default = ['Total Site Energy:Total Energy'],
+                        metavar = 'NAME',
+                        help = 'The {row name}:{column name} of the Site and Source Energy table to minimize')
+
+    parser.add_argument('-n', '--popsize', type = int, default = 20,
+                        metavar = 'POPSIZE',
+                        help = 'The number of variants in each generation')
+
+    parser.add_argument('-g', '--generations', type = int, default = 10,
+                        metavar = 'NGENS',
+                        help = 'The number of generations')
+
+    parser.add_argument('-s', '--seed', type = int, default = None,
+                        metavar = 'SEED',
+                        help = 'The seed of the algorithm, rerunning with the same seed reuses the results of the variants already evaluated')
+
+    parser.add_argument('-w', '--jobs', type = int, default = 1,
+                        metavar = 'NJOBS',
+                        help = 'The number of variants to generate and evaluate at the same time')
+
+    parser.add_argument('-c', '--cache', action = 'store_true', default=False,
+                        help = 'turn it on to save the tessellated geometry next to the original IFC and reuse it in later runs')
+
+    parser.add_argument('-p', '--process', action = 'store_true', default=False,
+                        help = 'turn it on if piping in json filepath')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def create_algorithm(algorithm: str, pop_size: int, nobjs: int):
+    '''
+    Create the pymoo algorithm.
+
+    Parameters
+    ----------
+    algorithm: str
+        'nsga2' or 'ga'.
+
+    pop_size: int
+        the number of variants in each generation.
+
+    nobjs: int
+        the number of objectives.
+
+    Returns
+    -------
+    pymoo.core.algorithm.Algorithm
+        the algorithm, None if the algorithm cannot take the number of objectives.
+    '''
+    # the first generation is sampled the same way as sample_variants
+    if algorithm == 'nsga2':
+        return pymoo.algorithms.moo.nsga2.NSGA2(pop_size=pop_size, sampling=pymoo.operators.sampling.lhs.LHS())
+    elif algorithm == 'ga':
+        if nobjs != 1:
+            print('ga only takes a single objective, use nsga2 for multiple objectives')
+            return None
+        return pymoo.algorithms.soo.nonconvex.ga.GA(pop_size=pop_size, sampling=pymoo.operators.sampling.lhs.LHS())
+    print(f"Unknown algorithm {algorithm}")
+    return None
+
+def read_objectives(res_dir: str, filename: str, obj_names: list[str]) -> list[float]:
+    '''
+    Read the objectives of a variant from its EP+ sql file.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+
+    obj_names: list[str]
+        the {row name}:{column name} of the Site and Source Energy table, see collect_results.read_sql_scalars.
+
+    Returns
+    -------
+    list[float]
+        the value of each objective, None if any of them is not in the sql file.
+    '''
+    sql_path = batch_eval.get_res_paths(res_dir, filename)['sql']
+    if not sql_path.exists():
+        return None
+    scalars = collect_results.read_sql_scalars(str(sql_path))
+    obj_vals = []
+    for obj_name in obj_names:
+        if obj_name not in scalars:
+            print(f"{obj_name} is not in the results of {filename}")
+            return None
+        obj_vals.append(scalars[obj_name]['value'])
+    return obj_vals
+
+def eval_generation(pmtr_metakeys: list[str], pmtr_val_ls: list[list[float]], filenames: list[str], res_dir: str, epw_path: str, ddy_path: str,
+                    measure_path: str, input_hashes: dict, versions: dict, obj_names: list[str], executor: ProcessPoolExecutor = None) -> list[dict]:
+    '''
+    Generate and evaluate the variants of a generation with gen_eval.gen_eval_variant and read their objectives.
+
+    Parameters
+    ----------
+    pmtr_metakeys: list[str]
+        the names of the parameters.
+
+    pmtr_val_ls: list[list[float]]
+        the actual parameter values of each variant.
+
+    filenames: list[str]
+        The name of each variant.
+
+    res_dir : str
+        The path of the results directory.
+
+    epw_path : str
+        The file path of the weather file.
+
+    ddy_path : str
+        The file path of the ddy design day file.
+
+    measure_path : str
+        The file path of the measures that will be applied to the model.
+
+    input_hashes: dict
+        the hashes of the epw, ddy and measure files that are shared by all the variants.
+
+    versions: dict
+        dictionary generated from batch_eval.get_tool_versions.
+
+    obj_names: list[str]
+        the names of the objectives.
+
+    executor: ProcessPoolExecutor, optional
+        the pool with the processes initialized with exe_wwr_constr.init_variant_worker. If not specified, the variants are generated and
+        evaluated in this process with the template in exe_wwr_constr.WORKER_STATE.
+
+    Returns
+    -------
+    list[dict]
+        the result of gen_eval.gen_eval_variant of each variant in the same order, with the additional key objectives. The status of a variant
+        without all the objectives is 'failed'.
+    '''
+    if executor is None:
+        var_res_ls = []
+        for filename, pmtr_vals in zip(filenames, pmtr_val_ls):
+            var_res_ls.append(gen_eval.gen_eval_variant(pmtr_metakeys, pmtr_vals, filename, res_dir, epw_path, ddy_path, measure_path,
+                                                        input_hashes, versions))
+    else:
+        futures = []
+        for filename, pmtr_vals in zip(filenames, pmtr_val_ls):
+            futures.append(executor.submit(gen_eval.gen_eval_variant, pmtr_metakeys, pmtr_vals, filename, res_dir, epw_path, ddy_path,
+                                           measure_path, input_hashes, versions))
+        var_res_ls = [future.result() for future in futures]
+
+    for var_res in var_res_ls:
+        var_res['objectives'] = None
+        if var_res['status'] in ['succeeded', 'cached']:
+            var_res['objectives'] = read_objectives(res_dir, var_res['name'], obj_names)
+            if var_res['objectives'] is None:
+                var_res['status'] = 'failed'
+        print(f"{var_res['name']} {var_res['status']} {var_res['mins']} mins {var_res['objectives']}")
+    return var_res_ls
+
+def find_optimal_indices(obj_val_ls: list[list[float]]) -> list[int]:
+    '''
+    Find the variants that are not dominated by any other variant, the best variant for a single objective.
+
+    Parameters
+    ----------
+    obj_val_ls: list[list[float]]
+        the objectives of each variant, None for the variants that failed.
+
+    Returns
+    -------
+    list[int]
+        the indices of the optimal variants.
+    '''
+    valid_indices = [cnt for cnt, obj_vals in enumerate(obj_val_ls) if obj_vals is not None]
+    if len(valid_indices) == 0:
+        return []
+    objs = np.array([obj_val_ls[cnt] for cnt in valid_indices])
+    # variant i is dominated if another variant is no worse in all the objectives and better in at least one
+    no_worse = np.all(objs[:, None, :] <= objs[None, :, :], axis=2)
+    better = np.any(objs[:, None, :] < objs[None, :, :], axis=2)
+    dominated = np.any(no_worse & better, axis=0)
+    return [valid_indices[cnt] for cnt in np.where(~dominated)[0]]
+
+def optimize_variants(pmtrc_path: str, ifc_path: str, res_dir: str, epw_path: str, ddy_path: str, measure_path: str, algorithm: str = 'nsga2',
+                      obj_names: list[str] = None, pop_size: int = 20, ngens: int = 10, seed: int = None, njobs: int = 1,
+                      use_geom_cache: bool = False) -> dict:
+    '''
+    Optimize the parameters of a parametric model. Each generation of the algorithm is generated and evaluated with gen_eval, the
+    objectives are read from the EP+ sql files. The results are written in the same layout as batch_eval, the variants are named
+    {ifc_filename}_{index} in the order they are evaluated.
+
+    Parameters
+    ----------
+    pmtrc_path: str
+        The file path of the json parametric model.
+
+    ifc_path : str
+        The file path of ifc.
+
+    res_dir : str
+        The path of the results directory.
+
+    epw_path : str
+        The file path of the weather file.
+
+    ddy_path : str
+        The file path of the ddy design day file.
+
+    measure_path : str
+        The file path of the measures that will be applied to the model.
+
+    algorithm : str, optional
+        'nsga2' or 'ga'. Default = 'nsga2'.
+
+    obj_names : list[str], optional
+        the {row name}:{column name} of the Site and Source Energy table to minimize. Default = ['Total Site Energy:Total Energy'].
+
+    pop_size : int, optional
+        The number of variants in each generation. Default = 20.
+
+    ngens : int, optional
+        The number of generations. Default = 10.
+
+    seed : int, optional
+        The seed of the algorithm. With the same seed a rerun proposes the same variants and reuses their results. Default = None.
+
+    njobs : int, optional
+        The number of variants generated and evaluated at the same time. Default = 1.
+
+    use_geom_cache : bool, optional
+        If True, the tessellated geometry is saved next to the ifc and reused in later runs. Default = False.
+
+    Returns
+    -------
+    dict
+        the parametric model with the additional keys, also written to optimize_history.json in the results directory
+        - parameter_normalized_values, parameter_values: the parameters of all the evaluated variants, in the order they are evaluated
+        - objectives: the names of the objectives
+        - objective_values: the objectives of each variant, None if it failed
+        - generations: the generation of each variant
+        - optimal: the names of the optimal variants, the pareto front for multiple objectives
+        - optimal_indices: the indices of the optimal variants
+    '''
+    if obj_names is None:
+        obj_names = ['Total Site Energy:Total Energy']
+
+    pmtrc_mod = exe_wwr_constr.read_pmtrc_mod(pmtrc_path)
+    if pmtrc_mod is None:
+        return None
+
+    nobjs = len(obj_names)
+    algorithm_obj = create_algorithm(algorithm, pop_size, nobjs)
+    if algorithm_obj is None:
+        return None
+
+    pmtr_metas = pmtrc_mod['parameters']
+    pmtr_metakeys = list(pmtr_metas.keys())
+    ifcmodel = ifcopenshell.open(ifc_path)
+    nbldgs = len(ifcmodel.by_type('IfcBuilding'))
+    if nbldgs != 1:
+        raise Exception("Unexpected number of buildings", nbldgs, "only 1 building allowed")
+
+    t1 = perf_counter()
+    res_dir_pobj = Path(res_dir)
+    res_dir_pobj.mkdir(parents=True, exist_ok=True)
+    history_path = res_dir_pobj.joinpath('optimize_history.json')
+    ifc_filename = Path(ifc_path).stem
+    input_hashes = {'epw': batch_eval.calc_file_hash(epw_path), 'ddy': batch_eval.calc_file_hash(ddy_path),
+                    'measure': batch_eval.calc_file_hash(measure_path)}
+    versions = batch_eval.get_tool_versions()
+
+    tmpl = None
+    geom_cache_path = None
+    if use_geom_cache:
+        tmpl, geom_cache_path = exe_wwr_constr.create_cached_variant_template(ifcmodel, ifc_path)
+
+    executor = None
+    if njobs <= 1:
+        if tmpl is None:
+            tmpl = exe_wwr_constr.create_variant_template(ifcmodel)
+        exe_wwr_constr.WORKER_STATE['tmpl'] = tmpl
+    else:
+        # the processes analyze the base model once and are reused by all the generations
+        executor = ProcessPoolExecutor(max_workers=njobs, initializer=exe_wwr_constr.init_variant_worker, initargs=(ifc_path, geom_cache_path))
+
+    # failed variants violate the constraint, the algorithm ranks them behind all the variants that succeeded
+    problem = pymoo.core.problem.Problem(n_var=len(pmtr_metakeys), n_obj=nobjs, n_ieq_constr=1, xl=0, xu=1)
+    algorithm_obj.setup(problem, termination=('n_gen', ngens), seed=seed)
+    history = {'parameter_normalized_values': [], 'parameter_values': [], 'objective_values': [], 'generations': [], 'status': []}
+    # no optimal variant until a generation is evaluated, e.g. with 0 generations or an interrupted first generation
+    pmtrc_mod['optimal_indices'] = []
+    pmtrc_mod['optimal'] = []
+    try:
+        # the termination of pymoo divides by the number of generations
+        while ngens > 0 and algorithm_obj.has_next():
+            gen_cnt = algorithm_obj.n_gen or 1
+            pop = algorithm_obj.ask()
+            nmlz_pmtrs = pop.get('X')
+            pmtr_val_ls = exe_wwr_constr.map_nrmlz_vals(pmtr_metas, nmlz_pmtrs).tolist()
+            nevals = len(history['parameter_values'])
+            filenames = [f"{ifc_filename}_{nevals + cnt}" for cnt in range(len(pmtr_val_ls))]
+            print(f"generation {gen_cnt}/{ngens} ... {len(filenames)} variants")
+            var_res_ls = eval_generation(pmtr_metakeys, pmtr_val_ls, filenames, res_dir, epw_path, ddy_path, measure_path, input_hashes,
+                                         versions, obj_names, executor=executor)
+
+            objs = np.full((len(var_res_ls), nobjs), FAIL_PENALTY)
+            cnstrs = np.ones((len(var_res_ls), 1))
+            for cnt, var_res in enumerate(var_res_ls):
+                if var_res['objectives'] is not None:
+                    objs[cnt] = var_res['objectives']
+                    cnstrs[cnt] = 0
+            pymoo.core.evaluator.Evaluator().eval(pymoo.problems.static.StaticProblem(problem, F=objs, G=cnstrs), pop)
+            algorithm_obj.tell(infills=pop)
+
+            history['parameter_normalized_values'].extend(nmlz_pmtrs.tolist())
+            history['parameter_values'].extend(pmtr_val_ls)
+            history['objective_values'].extend([var_res['objectives'] for var_res in var_res_ls])
+            history['generations'].extend([gen_cnt]*len(var_res_ls))
+            history['status'].extend([var_res['status'] for var_res in var_res_ls])
+            # write the history after every generation so that the evaluated variants are recorded even if the run is interrupted
+            optimal_indices = find_optimal_indices(history['objective_values'])
+            pmtrc_mod.update(history)
+            pmtrc_mod['objectives'] = obj_names
+            pmtrc_mod['optimal_indices'] = optimal_indices
+            pmtrc_mod['optimal'] = [f"{ifc_filename}_{indx}" for indx in optimal_indices]
+            pmtrc_utils.write_pmtrc_json(pmtrc_mod, history_path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    t2 = perf_counter()
+    t21 = round((t2 - t1)/60, 1)
+    nfailed = len([status for status in history['status'] if status == 'failed'])
+    print(f"{len(history['status'])} variants evaluated, {nfailed} failed")
+    for name, indx in zip(pmtrc_mod['optimal'], pmtrc_mod['optimal_indices']):
+        print(f"optimal: {name} {history['objective_values'][indx]}")
+    print(f"{t21} mins")
+    return pmtrc_mod
+
+def main():
+    args = parse_args()
+    pipe_input = args.process
+    if pipe_input == False:
+        pmtrc_path = args.json
+    else:
+        lines = list(sys.stdin)
+        pmtrc_path = lines[0].strip()
+
+    pmtrc_path = str(Path(pmtrc_path).resolve())
+    ifc_path = str(Path(args.ifc).resolve())
+    res_dir = str(Path(args.res).resolve())
+    epw_path = str(Path(args.epw).resolve())
+    ddy_path = str(Path(args.ddy).resolve())
+    mea_path = None
+    if args.measure is not None:
+        mea_path = str(Path(args.measure).resolve())
+    optimize_variants(pmtrc_path, ifc_path, res_dir, epw_path, ddy_path, mea_path, algorithm=args.algorithm, obj_names=args.objectives,
+                      pop_size=args.popsize, ngens=args.generations, seed=args.seed, njobs=args.jobs, use_geom_cache=args.cache)
+    # make sure this output can be piped into another command on the cmd
+    print(res_dir)
+    sys.stdout.flush()
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import os
+import json
+from pathlib import Path
+from functools import lru_cache
+
+import numpy as np
+
+from . import settings
+from . import work_queue
+from . import lazy_import
+
+# only validation needs jsonschema, which takes longer to import than the rest of the module
+jsonschema = lazy_import.lazy_import('jsonschema', submodules=['validators', 'exceptions', 'protocols'])
+
+# the matrices of the parametric model that can be stored in a .npy sidecar instead of the json
+MATRIX_KEYS = ['parameter_normalized_values', 'parameter_values']
+# matrices with at least this many values are stored in a sidecar, smaller matrices stay in the json
+SIDECAR_MIN_VALUES = 10000
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def get_sidecar_path(pmtrc_path: str, key: str) -> str:
+    '''
+    Get the path of the sidecar of a matrix of the parametric model, it is next to the json, e.g. sample_variants.parameter_values.npy.
+
+    Parameters
+    ----------
+    pmtrc_path: str
+        The file path of the json parametric model.
+
+    key: str
+        the key of the matrix.
+
+    Returns
+    -------
+    str
+        the path of the sidecar.
+    '''
+    pmtrc_path = Path(pmtrc_path)
+    return str(pmtrc_path.with_name(f"{pmtrc_path.stem}.{key}.npy"))
+
+@lru_cache(maxsize=None)
+def get_pmtrc_validator() -> jsonschema.protocols.Validator:
+    '''
+    Get the validator of pmtrc_mod_schema.json. The schema is read and checked once per process and the validator is reused.
+
+    Returns
+    -------
+    jsonschema.protocols.Validator
+        the validator of the parametric model.
+    '''
+    json_data_dir = settings.JSON_DATA_DIR
+    pmtrc_mod_schema_path = Path(json_data_dir).joinpath('pmtrc_mod_schema.json')
+    with open(pmtrc_mod_schema_path) as schema_file:
+        pmtrc_schema = json.load(schema_file)
+
+    validator_cls = jsonschema.validators.validator_for(pmtrc_schema)
+    validator_cls.check_schema(pmtrc_schema)
+    return validator_cls(pmtrc_schema)
+
+def check_matrices(pmtrc_mod: dict) -> str:
+    '''
+    Check the matrices of the parametric model with numpy instead of validating each value with the schema. The rows must have a value for each
+    parameter, the values must be finite, the normalized values must be in [0, 1] and the selected_indices must be rows of parameter_normalized_values.
+
+    Parameters
+    ----------
+    pmtrc_mod: dict
+        the parametric model, the matrices can be lists or np.ndarray.
+
+    Returns
+    -------
+    str
+        the error message, None if the matrices are valid.
+    '''
+    npmtrs = len(pmtrc_mod['parameters'])
+    nrows = None
+    for key in MATRIX_KEYS:
+        if key not in pmtrc_mod:
+            continue
+        try:
+            mat = np.asarray(pmtrc_mod[key], dtype=float)
+        except (ValueError, TypeError):
+            return f"{key} must be a list of rows of numbers"
+
+        if mat.size == 0:
+            if key == 'parameter_normalized_values':
+                nrows = 0
+            continue
+        if mat.ndim != 2:
+            return f"{key} must be a list of rows of numbers"
+        if mat.shape[1] != npmtrs:
+            return f"{key} has rows of {mat.shape[1]} values instead of a value for each of the {npmtrs} parameters"
+        if not np.isfinite(mat).all():
+            row, col = np.argwhere(~np.isfinite(mat))[0]
+            return f"{key} row {row} column {col} is not a finite number"
+        if key == 'parameter_normalized_values':
+            nrows = len(mat)
+            # min and max are single passes over the matrix without temporary arrays
+            if mat.min() < 0 or mat.max() > 1:
+                row, col = np.argwhere((mat < 0) | (mat > 1))[0]
+                return f"{key} row {row} column {col} is {mat[row, col]}, the normalized values must be in [0, 1]"
+
+    selected = np.asarray(pmtrc_mod.get('selected_indices', []), dtype=int)
+    if nrows is not None and selected.size != 0 and selected.max() >= nrows:
+        return f"selected_indices contains {selected.max()}, there are only {nrows} rows in parameter_normalized_values"
+    return None
+
+def validate_pmtrc_mod(pmtrc_mod: dict) -> bool:
+    '''
+    Validate the parametric model. The structure is validated with the cached validator of pmtrc_mod_schema.json and the matrices are checked
+    with check_matrices. The error is printed if it is not valid.
+
+    Parameters
+    ----------
+    pmtrc_mod: dict
+        the parametric model, the matrices can be lists or np.ndarray.
+
+    Returns
+    -------
+    bool
+        True if the parametric model is valid.
+    '''
+    # the matrices are too large to validate value by value with the schema
+    structure = {key: val for key, val in pmtrc_mod.items() if key not in MATRIX_KEYS}
+    error = jsonschema.exceptions.best_match(get_pmtrc_validator().iter_errors(structure))
+    if error is not None:
+        print(error.schema.get("error_msg", error.message))
+        return False
+
+    error_msg = check_matrices(pmtrc_mod)
+    if error_msg is not None:
+        print(error_msg)
+        return False
+    return True
+
+def read_pmtrc_json(pmtrc_path: str, validate: bool = True) -> dict:
+    '''
+    Read the json parametric model. The matrices stored in a sidecar are loaded with memory mapping, the other matrices are loaded as lists.
+
+    Parameters
+    ----------
+    pmtrc_path: str
+        The file path of the json parametric model.
+
+    validate: bool, optional
+        If True, validate the parametric model with validate_pmtrc_mod. Default = True.
+
+    Returns
+    -------
+    dict
+        the parametric model, None if it is not valid.
+    '''
+    with open(pmtrc_path) as pmtrc_file:
+        pmtrc_mod = json.load(pmtrc_file)
+
+    for key in MATRIX_KEYS:
+        if isinstance(pmtrc_mod.get(key), str):
+            # the sidecar is relative to the json
+            sidecar_path = Path(pmtrc_path).parent.joinpath(pmtrc_mod[key])
+            if not sidecar_path.exists():
+                print(f"The sidecar {sidecar_path} of {key} is not found")
+                return None
+            pmtrc_mod[key] = np.load(sidecar_path, mmap_mode='r')
+
+    if validate and not validate_pmtrc_mod(pmtrc_mod):
+        return None
+    return pmtrc_mod
+
+def is_sidecar_mapped(mat, sidecar_path: str) -> bool:
+    '''
+    Check if a matrix is the whole sidecar memory mapped, i.e. it is unchanged since it is read with read_pmtrc_json.
+
+    Parameters
+    ----------
+    mat: list | np.ndarray
+        the matrix.
+
+    sidecar_path: str
+        the path of the sidecar.
+
+    Returns
+    -------
+    bool
+        True if the matrix is memory mapped from the whole sidecar.
+    '''
+    if not isinstance(mat, np.memmap) or mat.filename is None or not Path(sidecar_path).exists():
+        return False
+    if Path(mat.filename).resolve() != Path(sidecar_path).resolve():
+        return False
+    # a slice of the memory mapped matrix refers to the same file
+    stored = np.load(sidecar_path, mmap_mode='r')
+    return mat.shape == stored.shape and mat.offset == stored.offset and mat.flags.c_contiguous and mat.mode == 'r'
+
+def write_replace(file_path: Path, write_func):
+    '''
+    Write a file to a temporary file in the same directory and replace the file with it, so that the file is never partly written.
+
+    Parameters
+    ----------
+    file_path: Path
+        the path of the file.
+
+    write_func: Callable
+        the function that writes the content into the binary file object.
+    '''
+    # the temporary file is unique to the process so that the machines sharing the directory do not write to the same file
+    tmp_path = file_path.with_name(f"{file_path.name}.{work_queue.get_worker_id()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            write_func(f)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def write_pmtrc_json(pmtrc_mod: dict, pmtrc_path: str, sidecar: bool = None):
+    '''
+    Write the json parametric model. The matrices are written to .npy sidecars next to the json and the json refers to them by file name.
+
+    Parameters
+    ----------
+    pmtrc_mod: dict
+        the parametric model, the matrices can be lists or np.ndarray.
+
+    pmtrc_path: str
+        The file path of the json parametric model.
+
+    sidecar: bool, optional
+        If True, write the matrices to sidecars, if False write them into the json. Default to sidecars for matrices with at least
+        SIDECAR_MIN_VALUES values and for matrices that already have a sidecar.
+    '''
+    pmtrc_json = dict(pmtrc_mod)
+    for key in MATRIX_KEYS:
+        if key not in pmtrc_json:
+            continue
+        mat = pmtrc_json[key]
+        sidecar_path = Path(get_sidecar_path(pmtrc_path, key))
+        is_mapped = is_sidecar_mapped(mat, str(sidecar_path))
+        use_sidecar = sidecar
+        if use_sidecar is None:
+            use_sidecar = sidecar_path.exists() or np.size(mat) >= SIDECAR_MIN_VALUES
+
+        if use_sidecar:
+            # a matrix memory mapped from its own sidecar is unchanged
+            if not is_mapped:
+                # write to a temporary file first so that the arrays memory mapped from the old sidecar stay valid
+                write_replace(sidecar_path, lambda f: np.save(f, np.asarray(mat, dtype=float)))
+            pmtrc_json[key] = sidecar_path.name
+        elif isinstance(mat, np.ndarray):
+            pmtrc_json[key] = mat.tolist()
+
+    pretty_json_data = json.dumps(pmtrc_json, indent=4)
+    # the machines generating the shards of the variants write the same json at the same time
+    write_replace(Path(pmtrc_path), lambda f: f.write(pretty_json_data.encode()))
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
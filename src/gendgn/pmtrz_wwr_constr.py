@@ -3,10 +3,11 @@ import json
 import argparse
 from pathlib import Path
 
-import ifcopenshell
-import ifcopenshell.geom
+from . import lazy_import
 
-import ifc_utils
+# imported on first use so that the arguments are parsed before the geometry stack is loaded
+ifcopenshell = lazy_import.lazy_import('ifcopenshell', submodules=['geom'])
+ifc_utils = lazy_import.lazy_import('ifc_utils', submodules=['ifcopenshell_utils'])
 #===================================================================================================
 # region: FUNCTIONS
 #===================================================================================================
@@ -23,6 +24,10 @@ def parse_args():
                         metavar = 'FILE', 
                         help = 'The file path of the resultant json file')
     
+    parser.add_argument('-a', '--azimuths', type = parse_nazimuths, default = 4,
+                        metavar = 'NAZIMUTHS', 
+                        help = 'The number of orientations with its own wwr parameter, at least 2. 4 gives north_wwr, east_wwr, south_wwr and west_wwr. Other numbers give wwr_az<degrees> parameters e.g. 8 gives wwr_az0, wwr_az45, ... wwr_az315. Default = 4')
+    
     parser.add_argument('-p', '--process', action = 'store_true', default=False,
                         help = 'turn it on if piping in ifc filepath')
     
@@ -30,7 +35,29 @@ def parse_args():
     args = parser.parse_args()
     return args
 
-def pmtrz_wwr_constr(ifc_path: str, res_path: str):
+def parse_nazimuths(nazimuths_str: str) -> int:
+    '''
+    Parse the number of orientations of the --azimuths option.
+
+    Parameters
+    ----------
+    nazimuths_str: str
+        the number of orientations, e.g. '8'.
+
+    Returns
+    -------
+    int
+        the number of orientations.
+    '''
+    try:
+        nazimuths = int(nazimuths_str)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{nazimuths_str} is not a number of orientations, e.g. 8")
+    if nazimuths < 2:
+        raise argparse.ArgumentTypeError(f"the number of orientations {nazimuths} needs to be at least 2, fewer would give no wwr parameter or one for all the facades")
+    return nazimuths
+
+def pmtrz_wwr_constr(ifc_path: str, res_path: str, nazimuths: int = 4):
     '''
     Parameterize an ifc file.
 
@@ -41,8 +68,13 @@ def pmtrz_wwr_constr(ifc_path: str, res_path: str):
 
     res_path : str
         The file path of the resultant json file.
+
+    nazimuths : int, optional
+        The number of orientations with its own wwr parameter, the orientations are evenly spaced starting from north. At least 2. Default = 4.
     
     '''
+    if nazimuths < 2:
+        raise ValueError(f"The number of orientations needs to be at least 2, got {nazimuths}")
     ifcmodel = ifcopenshell.open(ifc_path)
     bldg_dict = ifc_utils.ifcopenshell_utils.get_ifc_building_info(ifcmodel, envlp_pset_name='Pset_OsmodThermalResistance')
     ifc_bldgs = list(bldg_dict.values())
@@ -55,10 +87,15 @@ def pmtrz_wwr_constr(ifc_path: str, res_path: str):
         pmtrs['roof_thermal_resistance'] = {'range': [3, 6]}
         pmtrs['floor_thermal_resistance'] = {'range': [3, 6]}
         pmtrs['glazing_uvalue'] = {'range': [0.5, 3]}
-        pmtrs['north_wwr'] = {'range': [0.1, 0.4]}
-        pmtrs['south_wwr'] = {'range': [0.1, 0.4]}
-        pmtrs['east_wwr'] = {'range': [0.1, 0.4]}
-        pmtrs['west_wwr'] = {'range': [0.1, 0.4]}
+        if nazimuths == 4:
+            pmtrs['north_wwr'] = {'range': [0.1, 0.4]}
+            pmtrs['south_wwr'] = {'range': [0.1, 0.4]}
+            pmtrs['east_wwr'] = {'range': [0.1, 0.4]}
+            pmtrs['west_wwr'] = {'range': [0.1, 0.4]}
+        else:
+            for acnt in range(nazimuths):
+                azimuth = round(acnt*360/nazimuths, 2)
+                pmtrs[f"wwr_az{azimuth:g}"] = {'range': [0.1, 0.4]}
         pmtrc_mod['parameters'] = pmtrs
 
         # pretty json
@@ -80,7 +117,7 @@ def main():
     res_path = args.res
     res_path = str(Path(res_path).resolve())
     ifc_path = str(Path(ifc_path).resolve())
-    pmtrz_wwr_constr(ifc_path, res_path)
+    pmtrz_wwr_constr(ifc_path, res_path, nazimuths=args.azimuths)
     # make sure this output can be piped into another command on the cmd
     print(res_path)
     sys.stdout.flush()
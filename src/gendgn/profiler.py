@@ -0,0 +1,396 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import threading
+import subprocess
+from pathlib import Path
+from contextlib import contextmanager
+
+# the profile of the process, the stages are only recorded if the path of the profile is set with enable_profile
+PROFILE_STATE = {'path': None, 'variant': None}
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Summarize the time spent in each stage of a profile recorded with the --profile option")
+
+    # defining arguments for parser object
+    parser.add_argument('-i', '--input', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the profile (.jsonl)')
+
+    parser.add_argument('-c', '--chrome', type = str, default = None,
+                        metavar = 'FILE',
+                        help = 'The file path to write the profile as a Chrome trace, open it in chrome://tracing or https://ui.perfetto.dev')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def enable_profile(profile_path: str) -> str:
+    '''
+    Record the stages of this process into a profile. The records are appended to the file, one json per line, so the processes of a run and
+    the machines sharing the file can write to the same profile.
+
+    Parameters
+    ----------
+    profile_path: str
+        The file path of the profile (.jsonl). None to stop recording.
+
+    Returns
+    -------
+    str
+        the file path of the previous profile, to restore it with enable_profile.
+    '''
+    prev_path = PROFILE_STATE['path']
+    PROFILE_STATE['path'] = profile_path
+    PROFILE_STATE['variant'] = None
+    return prev_path
+
+def is_enabled() -> bool:
+    '''
+    Check if the stages of this process are recorded.
+
+    Returns
+    -------
+    bool
+        True if the profile is enabled.
+    '''
+    return PROFILE_STATE['path'] is not None
+
+def calc_peak_rss_mb(ru_maxrss: int) -> float:
+    '''
+    Convert the ru_maxrss of resource.getrusage or os.wait4 to MB, it is in kilobytes on linux and in bytes on macOS.
+
+    Parameters
+    ----------
+    ru_maxrss: int
+        the peak resident set size.
+
+    Returns
+    -------
+    float
+        the peak resident set size in MB.
+    '''
+    if sys.platform == 'darwin':
+        return ru_maxrss/(1024*1024)
+    return ru_maxrss/1024
+
+def record_stage(stage: str, ts: float, wall: float, cpu: float = None, peak_rss_mb: float = None, variant: str = None, pid: int = None,
+                 tid: int = None, **args):
+    '''
+    Append the record of a stage to the profile.
+
+    Parameters
+    ----------
+    stage: str
+        the name of the stage.
+
+    ts: float
+        the start of the stage in seconds since the epoch.
+
+    wall: float
+        the wall time of the stage in seconds.
+
+    cpu: float, optional
+        the cpu time of the stage in seconds.
+
+    peak_rss_mb: float, optional
+        the peak resident set size of the process in MB at the end of the stage.
+
+    variant: str, optional
+        the name of the variant. Default to the variant of profile_variant.
+
+    pid: int, optional
+        the process of the stage. Default to this process.
+
+    tid: int, optional
+        the thread of the stage. Default to this thread.
+
+    **args
+        other values to record, e.g. the parameter changed by the stage.
+    '''
+    if PROFILE_STATE['path'] is None:
+        return
+    if variant is None:
+        variant = PROFILE_STATE['variant']
+    if pid is None:
+        pid = os.getpid()
+    if tid is None:
+        tid = threading.get_native_id()
+    record = {'stage': stage, 'variant': variant, 'ts': ts, 'wall': wall, 'cpu': cpu, 'peak_rss_mb': peak_rss_mb, 'host': socket.gethostname(),
+              'pid': pid, 'tid': tid}
+    record.update(args)
+    # one write per record so that the records of the processes appending to the same file are not mixed
+    with open(PROFILE_STATE['path'], 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+@contextmanager
+def profile_stage(stage: str, **args):
+    '''
+    Record the wall time, the cpu time of the process and the peak resident set size of the process of the stage in the with block.
+    Does nothing if the profile is not enabled.
+
+    Parameters
+    ----------
+    stage: str
+        the name of the stage.
+
+    **args
+        other values to record, e.g. the parameter changed by the stage.
+    '''
+    if PROFILE_STATE['path'] is None:
+        yield
+        return
+    ts = time.time()
+    t1 = time.perf_counter()
+    cpu1 = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - t1
+        cpu = time.process_time() - cpu1
+        peak_rss_mb = calc_peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        record_stage(stage, ts, wall, cpu=cpu, peak_rss_mb=peak_rss_mb, **args)
+
+@contextmanager
+def profile_variant(variant: str):
+    '''
+    Record the stages in the with block as the stages of a variant, and the whole block as the stage 'variant'.
+
+    Parameters
+    ----------
+    variant: str
+        the name of the variant.
+    '''
+    prev_variant = PROFILE_STATE['variant']
+    PROFILE_STATE['variant'] = variant
+    try:
+        with profile_stage('variant'):
+            yield
+    finally:
+        PROFILE_STATE['variant'] = prev_variant
+
+def read_proc_hwm_mb(pid: int) -> float:
+    '''
+    Read the peak resident set size of a running process from /proc on linux. Unlike the ru_maxrss of os.wait4, it does not include the memory
+    of this process that the child process had before it executed its command.
+
+    Parameters
+    ----------
+    pid: int
+        the id of the process.
+
+    Returns
+    -------
+    float
+        the peak resident set size in MB, None if it cannot be read.
+    '''
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def wait_procs(procs: list[subprocess.Popen], timeout: float = None) -> list[dict]:
+    '''
+    Wait for the processes like subprocess.Popen.wait and get the resource usage of each process from os.wait4.
+
+    Parameters
+    ----------
+    procs: list[subprocess.Popen]
+        The processes to wait for.
+
+    timeout: float, optional
+        The maximum number of seconds to wait for all the processes. Default = None, no timeout.
+
+    Returns
+    -------
+    list[dict]
+        the usage of each process, None for the processes already waited for.
+        - end: the time the process ended in seconds since the epoch
+        - cpu: the user and system cpu time in seconds
+        - peak_rss_mb: the peak resident set size in MB, read from /proc while the process runs if possible
+
+    Raises
+    ------
+    subprocess.TimeoutExpired
+        if the processes did not end before the timeout.
+    '''
+    t1 = time.perf_counter()
+    usages = [None]*len(procs)
+    is_waiting = [True]*len(procs)
+    hwms = [None]*len(procs)
+    while True:
+        for cnt, proc in enumerate(procs):
+            if not is_waiting[cnt]:
+                continue
+            if proc.returncode is not None:
+                is_waiting[cnt] = False
+                continue
+            try:
+                pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            except ChildProcessError:
+                # the process is already waited for
+                proc.poll()
+                is_waiting[cnt] = False
+                continue
+            if pid != 0:
+                # Popen does not wait for a process with a returncode
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                peak_rss_mb = hwms[cnt]
+                if peak_rss_mb is None:
+                    peak_rss_mb = calc_peak_rss_mb(rusage.ru_maxrss)
+                usages[cnt] = {'end': time.time(), 'cpu': rusage.ru_utime + rusage.ru_stime, 'peak_rss_mb': peak_rss_mb}
+                is_waiting[cnt] = False
+            else:
+                hwm = read_proc_hwm_mb(proc.pid)
+                if hwm is not None:
+                    hwms[cnt] = hwm
+        if not any(is_waiting):
+            return usages
+        if timeout is not None and time.perf_counter() - t1 > timeout:
+            raise subprocess.TimeoutExpired(procs[-1].args, timeout)
+        time.sleep(0.02)
+
+def record_procs(procs: list[subprocess.Popen], usages: list[dict], ts: float, variant: str = None):
+    '''
+    Record each process as a stage named after its command, on its own row of the Chrome trace.
+
+    Parameters
+    ----------
+    procs: list[subprocess.Popen]
+        The processes.
+
+    usages: list[dict]
+        the usage of each process from wait_procs.
+
+    ts: float
+        the time the processes are started in seconds since the epoch.
+
+    variant: str, optional
+        the name of the variant. Default to the variant of profile_variant.
+    '''
+    for proc, usage in zip(procs, usages):
+        if usage is None:
+            continue
+        record_stage(Path(proc.args[0]).name, ts, usage['end'] - ts, cpu=usage['cpu'], peak_rss_mb=usage['peak_rss_mb'], variant=variant,
+                     pid=proc.pid, tid=proc.pid, returncode=proc.returncode)
+
+def read_profile(profile_path: str) -> list[dict]:
+    '''
+    Read the records of a profile.
+
+    Parameters
+    ----------
+    profile_path: str
+        The file path of the profile (.jsonl).
+
+    Returns
+    -------
+    list[dict]
+        the records of the stages, see record_stage.
+    '''
+    records = []
+    with open(profile_path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+def summarize_profile(records: list[dict]) -> list[dict]:
+    '''
+    Sum the records of each stage.
+
+    Parameters
+    ----------
+    records: list[dict]
+        the records from read_profile.
+
+    Returns
+    -------
+    list[dict]
+        the summary of each stage, from the longest total wall time.
+        - stage: the name of the stage
+        - count: the number of records
+        - wall: the total wall time in seconds
+        - mean_wall: the mean wall time in seconds
+        - cpu: the total cpu time in seconds
+        - peak_rss_mb: the largest peak resident set size in MB
+    '''
+    stage_dict = {}
+    for record in records:
+        summary = stage_dict.setdefault(record['stage'], {'stage': record['stage'], 'count': 0, 'wall': 0.0, 'mean_wall': 0.0, 'cpu': 0.0,
+                                                          'peak_rss_mb': None})
+        summary['count'] += 1
+        summary['wall'] += record['wall']
+        if record.get('cpu') is not None:
+            summary['cpu'] += record['cpu']
+        if record.get('peak_rss_mb') is not None:
+            summary['peak_rss_mb'] = max(summary['peak_rss_mb'] or 0.0, record['peak_rss_mb'])
+    for summary in stage_dict.values():
+        summary['mean_wall'] = summary['wall']/summary['count']
+    return sorted(stage_dict.values(), key=lambda summary: summary['wall'], reverse=True)
+
+def write_chrome_trace(records: list[dict], trace_path: str):
+    '''
+    Write the records as a Chrome trace, each stage is a complete event on the row of its process and thread.
+
+    Parameters
+    ----------
+    records: list[dict]
+        the records from read_profile.
+
+    trace_path: str
+        The file path of the trace (.json).
+    '''
+    events = []
+    proc_names = {}
+    for record in records:
+        args = {key: val for key, val in record.items() if key not in ['stage', 'ts', 'wall', 'pid', 'tid']}
+        events.append({'name': record['stage'], 'cat': record.get('variant') or 'base', 'ph': 'X', 'ts': record['ts']*1e6,
+                       'dur': record['wall']*1e6, 'pid': record['pid'], 'tid': record['tid'], 'args': args})
+        proc_names[record['pid']] = f"{record.get('host')} {record['pid']}"
+    for pid, proc_name in proc_names.items():
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': proc_name}})
+
+    pretty_json_data = json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+    with open(trace_path, 'w') as f:
+        f.write(pretty_json_data)
+
+def main():
+    args = parse_args()
+    profile_path = str(Path(args.input).resolve())
+    records = read_profile(profile_path)
+    summaries = summarize_profile(records)
+    print(f"{'stage':<24} {'count':>7} {'wall s':>10} {'mean s':>10} {'cpu s':>10} {'peak MB':>9}")
+    for summary in summaries:
+        peak_str = '-' if summary['peak_rss_mb'] is None else f"{summary['peak_rss_mb']:.0f}"
+        print(f"{summary['stage']:<24} {summary['count']:>7} {summary['wall']:>10.2f} {summary['mean_wall']:>10.4f} {summary['cpu']:>10.2f} "
+              f"{peak_str:>9}")
+    if args.chrome is not None:
+        trace_path = str(Path(args.chrome).resolve())
+        write_chrome_trace(records, trace_path)
+        # make sure this output can be piped into another command on the cmd
+        print(trace_path)
+    sys.stdout.flush()
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
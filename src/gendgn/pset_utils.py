@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from . import lazy_import
+
+ifcopenshell = lazy_import.lazy_import('ifcopenshell', submodules=['util.element'])
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def index_psets(ifcmodel: ifcopenshell.file, pset_names: list[str]) -> dict:
+    '''
+    Index the psets of the objects in one pass over the IfcRelDefinesByProperties, instead of searching the inverse relationships of each object.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model.
+
+    pset_names: list[str]
+        the names of the psets to index, e.g. ['Pset_OsmodThermalResistance'].
+
+    Returns
+    -------
+    dict
+        the psets of each object, {GlobalId: {pset name: [IfcPropertySet]}}.
+    '''
+    pset_index = {}
+    for rel in ifcmodel.by_type('IfcRelDefinesByProperties'):
+        pset_defs = rel.RelatingPropertyDefinition
+        # an IfcPropertySetDefinitionSet of IFC4 is a tuple of psets
+        if not isinstance(pset_defs, tuple):
+            pset_defs = [pset_defs]
+        for pset in pset_defs:
+            if not pset.is_a('IfcPropertySet') or pset.Name not in pset_names:
+                continue
+            for ifc_obj in rel.RelatedObjects:
+                obj_psets = pset_index.setdefault(ifc_obj.GlobalId, {})
+                obj_psets.setdefault(pset.Name, []).append(pset)
+    return pset_index
+
+def find_pset_props(pset_index: dict, guids: list[str], pset_name: str) -> list[tuple]:
+    '''
+    Find the psets of the objects and the property edited in each, the first property of the pset like ifc_utils edit_pset_val.
+
+    Parameters
+    ----------
+    pset_index: dict
+        the index from index_psets.
+
+    guids: list[str]
+        the GlobalIds of the objects.
+
+    pset_name: str
+        the name of the pset.
+
+    Returns
+    -------
+    list[tuple]
+        the pset and its property of each pset once, a pset shared by several objects is edited once. Psets without properties are skipped.
+    '''
+    pset_props = []
+    pset_ids = set()
+    for guid in guids:
+        for pset in pset_index.get(guid, {}).get(pset_name, []):
+            if pset.id() in pset_ids or not pset.HasProperties:
+                continue
+            pset_ids.add(pset.id())
+            pset_props.append((pset, pset.HasProperties[0]))
+    return pset_props
+
+def index_pset_props(ifcmodel: ifcopenshell.file, groups: dict) -> dict:
+    '''
+    Index the properties edited for each group of objects, so that the properties of a variant are edited in place by their id, see edit_props.
+    A property that is also in the psets of other groups or of other objects is copied for the psets of the group, as editing it in place would
+    change the other psets too. The copies are made in ifcmodel, index the model the variants are copied from.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model.
+
+    groups: dict
+        the objects of each group and the name of their pset, {group name: (pset name, [GlobalId])}, e.g. the walls edited by the
+        wall_thermal_resistance parameter.
+
+    Returns
+    -------
+    dict
+        the ids of the properties of each group, {group name: [property id]}.
+    '''
+    pset_names = list(set([pset_name for pset_name, _ in groups.values()]))
+    pset_index = index_psets(ifcmodel, pset_names)
+    prop_id_dict = {}
+    for group_name, (pset_name, guids) in groups.items():
+        pset_props = find_pset_props(pset_index, guids, pset_name)
+        group_pset_ids = set([pset.id() for pset, _ in pset_props])
+        prop_ids = []
+        # the psets of the group sharing a property share its copy
+        prop_copies = {}
+        for pset, prop in pset_props:
+            prop_psets = [inv for inv in ifcmodel.get_inverse(prop) if inv.is_a('IfcPropertySet')]
+            if any(prop_pset.id() not in group_pset_ids for prop_pset in prop_psets):
+                if prop.id() not in prop_copies:
+                    prop_copies[prop.id()] = ifcopenshell.util.element.copy(ifcmodel, prop)
+                prop_copy = prop_copies[prop.id()]
+                pset.HasProperties = [prop_copy if pset_prop == prop else pset_prop for pset_prop in pset.HasProperties]
+                prop = prop_copy
+            if prop.id() not in prop_ids:
+                prop_ids.append(prop.id())
+        prop_id_dict[group_name] = prop_ids
+    return prop_id_dict
+
+def edit_props(ifcmodel: ifcopenshell.file, prop_ids: list[int], nominal_val: ifcopenshell.entity_instance):
+    '''
+    Edit the value of the properties in place. The properties share the value, no property is created.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model.
+
+    prop_ids: list[int]
+        the ids of the IfcPropertySingleValue from index_pset_props.
+
+    nominal_val: ifcopenshell.entity_instance
+        the new value, e.g. IfcThermalResistanceMeasure or IfcThermalTransmittanceMeasure.
+    '''
+    for prop_id in prop_ids:
+        ifcmodel.by_id(prop_id).NominalValue = nominal_val
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
@@ -1,13 +1,20 @@
 import sys
-import json
 import argparse
 from pathlib import Path
 
-from pymoo.core.problem import Problem
-from pymoo.operators.sampling.lhs import LHS
-import jsonschema
+import numpy as np
 
-from . import settings
+from . import pmtrc_utils
+from . import lazy_import
+
+# scipy takes about a second to import, qmc is only needed by the sobol, halton and saltelli methods and spatial by lhs
+qmc = lazy_import.lazy_import('scipy.stats.qmc')
+spatial = lazy_import.lazy_import('scipy.spatial')
+
+# the sampling methods, see sample_unit
+SAMPLING_METHODS = ['lhs', 'sobol', 'halton', 'random', 'morris', 'saltelli']
+# the methods whose sample can be continued from the recorded seed
+CONTINUABLE_METHODS = ['sobol', 'halton', 'random', 'morris', 'saltelli']
 #===================================================================================================
 # region: FUNCTIONS
 #===================================================================================================
@@ -28,6 +35,20 @@ def parse_args():
                         metavar = 'FILE', default= None,
                         help = 'The file path for the result')
     
+    parser.add_argument('-m', '--method', type = str, default = None, choices = SAMPLING_METHODS,
+                        help = 'The sampling method, default to lhs or the method of the existing variants when appending')
+
+    parser.add_argument('-l', '--levels', type = int, default = 4,
+                        metavar = 'NLEVELS',
+                        help = 'The number of levels of each parameter for the morris method')
+
+    parser.add_argument('-s', '--seed', type = int, default = None,
+                        metavar = 'SEED',
+                        help = 'The seed of the sampling method, a random seed is used and recorded in the result if not specified')
+
+    parser.add_argument('-a', '--append', action = 'store_true', default=False,
+                        help = 'turn it on to add NSAMPLES variants to the existing variants instead of replacing them')
+
     parser.add_argument('-p', '--process', action = 'store_true', default=False,
                         help = 'turn it on if piping in json filepath')
     
@@ -35,14 +56,272 @@ def parse_args():
     args = parser.parse_args()
     return args
 
-def sample_pmtrs(nsamples: int, pmtrc_path: str, res_path: str):
+def sample_lhs(nsamples: int, npmtrs: int, niters: int = 20, seed: int = None) -> np.ndarray:
+    '''
+    Generate a latin hypercube sample optimized for maximin. niters random latin hypercubes are drawn and the one with the largest minimum
+    distance between its samples is kept, the same criterion as pymoo LHS. The nearest neighbours are found with a kd-tree instead of the
+    full distance matrix, so the time and memory grow with nsamples*log(nsamples) instead of nsamples**2.
+
+    Parameters
+    ----------
+    nsamples: int
+        number of samples to generate.
+
+    npmtrs: int
+        number of parameters.
+
+    niters: int, optional
+        the number of random latin hypercubes to choose from. Default = 20.
+
+    seed: int, optional
+        the seed of the random latin hypercubes.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nsamples, nparameters)] the normalized samples.
+    '''
+    rng = np.random.default_rng(seed)
+    best_smpls = None
+    best_dist = -1.0
+    for _ in range(niters):
+        # a random stratum for each sample in each parameter and a random position in the stratum
+        smpls = (np.argsort(rng.random((nsamples, npmtrs)), axis=0) + rng.random((nsamples, npmtrs))) / nsamples
+        min_dist = np.inf
+        if nsamples > 1:
+            min_dist = spatial.cKDTree(smpls).query(smpls, k=2)[0][:, 1].min()
+        if min_dist > best_dist:
+            best_smpls = smpls
+            best_dist = min_dist
+    return best_smpls
+
+def sample_morris(ntrajs: int, npmtrs: int, nlevels: int = 4, seed: int = None, nskip: int = 0) -> np.ndarray:
+    '''
+    Generate Morris trajectories for the elementary effects screening. Each trajectory starts from a random point on a grid of nlevels levels and
+    changes one parameter at a time by delta = nlevels/(2*(nlevels-1)) in a random order and direction. Each trajectory is generated from its own
+    random stream, so more trajectories can be added later.
+
+    Parameters
+    ----------
+    ntrajs: int
+        number of trajectories.
+
+    npmtrs: int
+        number of parameters.
+
+    nlevels: int, optional
+        number of levels of each parameter, an even number. Default = 4.
+
+    seed: int, optional
+        the seed of the trajectories.
+
+    nskip: int, optional
+        the number of trajectories generated before with the same seed, to add more trajectories. Default = 0.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(ntrajs*(nparameters+1), nparameters)] the normalized samples, the npmtrs+1 points of each trajectory are consecutive.
+    '''
+    if seed is None:
+        seed = int(np.random.default_rng().integers(2**31))
+    delta = nlevels / (2 * (nlevels - 1))
+    levels = np.arange(nlevels) / (nlevels - 1)
+    # the levels a trajectory can start from so that a step up stays in the range
+    start_levels = levels[levels + delta <= 1 + 1e-9]
+    smpls = np.zeros((ntrajs*(npmtrs+1), npmtrs))
+    for tcnt in range(ntrajs):
+        rng = np.random.default_rng([seed, nskip + tcnt])
+        signs = rng.choice([-1, 1], size=npmtrs)
+        start = rng.choice(start_levels, size=npmtrs)
+        # the parameters that step down start from the upper levels
+        start = np.where(signs > 0, start, start + delta)
+        traj = np.repeat(start[None, :], npmtrs+1, axis=0)
+        for scnt, pcnt in enumerate(rng.permutation(npmtrs)):
+            traj[scnt+1:, pcnt] += signs[pcnt] * delta
+        smpls[tcnt*(npmtrs+1):(tcnt+1)*(npmtrs+1)] = traj
+    return np.clip(smpls, 0, 1)
+
+def sample_saltelli(nbase: int, npmtrs: int, seed: int = None, nskip: int = 0) -> np.ndarray:
+    '''
+    Generate the Saltelli design for the first order and total Sobol indices. The base matrices A and B are the two halves of a scrambled Sobol
+    sequence with 2*npmtrs dimensions. For each base sample the block [A, AB_1, ..., AB_npmtrs, B] is generated, where AB_j is A with the
+    parameter j from B.
+
+    Parameters
+    ----------
+    nbase: int
+        number of base samples, a power of 2 keeps the balance properties of the Sobol sequence.
+
+    npmtrs: int
+        number of parameters.
+
+    seed: int, optional
+        the seed of the Sobol sequence.
+
+    nskip: int, optional
+        the number of base samples generated before with the same seed, to add more base samples. Default = 0.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nbase*(nparameters+2), nparameters)] the normalized samples, the npmtrs+2 rows of each base sample are consecutive.
+    '''
+    engine = qmc.Sobol(d=2*npmtrs, scramble=True, seed=seed)
+    if nskip != 0:
+        engine.fast_forward(nskip)
+    base = engine.random(nbase)
+    amat = base[:, :npmtrs]
+    bmat = base[:, npmtrs:]
+    blocks = np.repeat(amat[:, None, :], npmtrs+2, axis=1)
+    for pcnt in range(npmtrs):
+        blocks[:, pcnt+1, pcnt] = bmat[:, pcnt]
+    blocks[:, npmtrs+1, :] = bmat
+    return blocks.reshape(-1, npmtrs)
+
+def calc_nrows_per_sample(method: str, npmtrs: int) -> int:
+    '''
+    Calculate the number of rows generated for each sample of the method.
+
+    Parameters
+    ----------
+    method: str
+        the sampling method.
+
+    npmtrs: int
+        number of parameters.
+
+    Returns
+    -------
+    int
+        npmtrs+1 for each morris trajectory, npmtrs+2 for each saltelli base sample and 1 for the other methods.
+    '''
+    if method == 'morris':
+        return npmtrs + 1
+    elif method == 'saltelli':
+        return npmtrs + 2
+    return 1
+
+def sample_unit(method: str, nsamples: int, npmtrs: int, seed: int = None, nskip: int = 0, nlevels: int = 4) -> np.ndarray:
+    '''
+    Generate samples in the unit hypercube. The time to generate 10,000 and 50,000 samples of 8 parameters, see benchmarks/bench_samplers.py:
+    - lhs: latin hypercube optimized for maximin with sample_lhs, about 2.6 s and 23 s. pymoo LHS takes about 16 s for 10,000 samples and
+      runs out of memory for 50,000.
+    - sobol: scrambled Sobol sequence, about 0.002 s for both, with the lowest discrepancy. Its balance properties need nsamples to be a power of 2.
+    - halton: scrambled Halton sequence, about 0.01 s and 0.05 s
+    - random: uniform random samples, about 0.002 s for both, with the highest discrepancy
+    The sensitivity analysis designs, see analyze_sensitivity, generate several rows for each sample, see calc_nrows_per_sample:
+    - morris: nsamples Morris trajectories with sample_morris
+    - saltelli: the Saltelli design of nsamples base samples with sample_saltelli
+
+    Parameters
+    ----------
+    method: str
+        'lhs', 'sobol', 'halton' or 'random'.
+
+    nsamples: int
+        number of samples to generate.
+
+    npmtrs: int
+        number of parameters.
+
+    seed: int, optional
+        the seed of the method.
+
+    nskip: int, optional
+        skip the first nskip samples of the sequence generated with the same seed, to continue a sequence. Not available for lhs. Default = 0.
+
+    nlevels: int, optional
+        number of levels of each parameter for morris. Default = 4.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nsamples*calc_nrows_per_sample(method), nparameters)] the normalized samples.
+    '''
+    if method == 'lhs':
+        if nskip != 0:
+            raise ValueError('a latin hypercube cannot be continued, use augment_lhs')
+        return sample_lhs(nsamples, npmtrs, seed=seed)
+    elif method == 'sobol' or method == 'halton':
+        if method == 'sobol':
+            engine = qmc.Sobol(d=npmtrs, scramble=True, seed=seed)
+        else:
+            engine = qmc.Halton(d=npmtrs, scramble=True, seed=seed)
+        if nskip != 0:
+            engine.fast_forward(nskip)
+        return engine.random(nsamples)
+    elif method == 'random':
+        rng = np.random.default_rng(seed)
+        if nskip != 0:
+            # each number takes one step of the generator
+            rng.bit_generator.advance(nskip * npmtrs)
+        return rng.random((nsamples, npmtrs))
+    elif method == 'morris':
+        return sample_morris(nsamples, npmtrs, nlevels=nlevels, seed=seed, nskip=nskip)
+    elif method == 'saltelli':
+        return sample_saltelli(nsamples, npmtrs, seed=seed, nskip=nskip)
+    raise ValueError(f"Unknown sampling method {method}, choose from {SAMPLING_METHODS}")
+
+def augment_lhs(nmlz_pmtrs: np.ndarray, nsamples: int, ntries: int = 10, seed: int = None) -> np.ndarray:
+    '''
+    Add samples to an existing sample while keeping it space-filling. The range of each parameter is divided into as many strata as the
+    combined sample, and the added samples fill the strata not occupied by the existing samples, so an existing latin hypercube stays close to
+    a latin hypercube. Of ntries random fillings, the one with the largest minimum distance between all the samples is kept (maximin).
+
+    Parameters
+    ----------
+    nmlz_pmtrs: np.ndarray
+        np.ndarray[shape(nexisting, nparameters)] the existing normalized samples.
+
+    nsamples: int
+        number of samples to add.
+
+    ntries: int, optional
+        the number of random fillings to choose from. Default = 10.
+
+    seed: int, optional
+        the seed of the random fillings.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(nsamples, nparameters)] the added normalized samples.
+    '''
+    nmlz_pmtrs = np.asarray(nmlz_pmtrs, dtype=float)
+    nexisting, npmtrs = nmlz_pmtrs.shape
+    ntotal = nexisting + nsamples
+    rng = np.random.default_rng(seed)
+    # the existing samples occupy at most nexisting strata, so there are always enough empty strata
+    empty_strata = []
+    for pcnt in range(npmtrs):
+        occupied = np.clip(np.floor(nmlz_pmtrs[:, pcnt] * ntotal).astype(int), 0, ntotal - 1)
+        empty_strata.append(np.setdiff1d(np.arange(ntotal), occupied))
+
+    existing_tree = spatial.cKDTree(nmlz_pmtrs)
+    best_added = None
+    best_dist = -1.0
+    for _ in range(ntries):
+        added = np.zeros((nsamples, npmtrs))
+        for pcnt in range(npmtrs):
+            strata = rng.permutation(empty_strata[pcnt])[:nsamples]
+            added[:, pcnt] = (strata + rng.random(nsamples)) / ntotal
+        min_dist = existing_tree.query(added)[0].min()
+        if nsamples > 1:
+            min_dist = min(min_dist, spatial.cKDTree(added).query(added, k=2)[0][:, 1].min())
+        if min_dist > best_dist:
+            best_added = added
+            best_dist = min_dist
+    return best_added
+
+def sample_pmtrs(nsamples: int, pmtrc_path: str, res_path: str, append: bool = False, method: str = None, seed: int = None, nlevels: int = 4):
     '''
     Generate parameters for the model.
 
     Parameters
     ----------
     nsamples: int
-        number of samples to generate
+        number of samples to generate, the number of trajectories for morris and base samples for saltelli
 
     pmtrc_path: str
         The file path of the json parametric model.
@@ -56,34 +335,77 @@ def sample_pmtrs(nsamples: int, pmtrc_path: str, res_path: str):
     var_dir : str
         The directory to store the generated variants.
 
+    append : bool, optional
+        If True, nsamples samples are added after the existing parameter_normalized_values, the existing samples keep their variant index.
+        A sobol, halton, random, morris or saltelli sample is continued from the method and seed recorded in the sampling of the parametric model,
+        other samples are augmented with augment_lhs and their sampling is recorded as augment_lhs. An explicit method that cannot be continued
+        is rejected, except lhs on a latin hypercube or an unrecorded sample. The indices of the added samples are written to selected_indices
+        so that exe_wwr_constr and gen_eval only generate the new variants. Default = False.
+
+    method : str, optional
+        'lhs', 'sobol', 'halton', 'random', 'morris' or 'saltelli', see sample_unit. Default to 'lhs', or the method of the existing samples
+        when appending.
+
+    seed : int, optional
+        The seed of the method. A random seed is used if not specified. The method and seed are recorded in the sampling of the parametric model.
+
+    nlevels : int, optional
+        number of levels of each parameter for morris. Default = 4.
+
     '''
-    with open(pmtrc_path) as pmtrc_file:
-        pmtrc_mod = json.load(pmtrc_file)
-    
-    # validate the file and make sure it is compliant
-    json_data_dir = settings.JSON_DATA_DIR
-    pmtrc_mod_schema_path = Path(json_data_dir).joinpath('pmtrc_mod_schema.json')
-    with open(pmtrc_mod_schema_path) as schema_file:
-        pmtrc_schema = json.load(schema_file)
-
-    try:
-        is_mod_valid = jsonschema.validate(instance=pmtrc_mod, schema=pmtrc_schema)
-    except jsonschema.ValidationError as e:
-        print(e.schema.get("error_msg", e.message))
-        return False 
-    
+    pmtrc_mod = pmtrc_utils.read_pmtrc_json(pmtrc_path)
+    if pmtrc_mod is None:
+        return False
+
     pmtrs_dict = pmtrc_mod['parameters']
     pmtrs_vals = pmtrs_dict.values()
     npmtrs = len(pmtrs_vals)
-    problem = Problem(n_var=npmtrs, xl=0, xu=1)
-    sampling = LHS()
-    pmtrs_nrmlz = sampling(problem, nsamples).get("X")
-    pmtrs_nrmlz = pmtrs_nrmlz.tolist()
-    pmtrc_mod['parameter_normalized_values'] = pmtrs_nrmlz
-
-    pretty_json_data = json.dumps(pmtrc_mod, indent=4)
-    with open(res_path, 'w') as f:
-        f.write(pretty_json_data)
+    existing = pmtrc_mod.get('parameter_normalized_values', [])
+    sampling = pmtrc_mod.get('sampling', {})
+    if seed is None:
+        seed = int(np.random.default_rng().integers(2**31))
+    if append and len(existing) != 0:
+        existing = np.array(existing, dtype=float)
+        if existing.shape[1] != npmtrs:
+            print(f"The existing variants have {existing.shape[1]} parameters instead of {npmtrs}, they cannot be appended to")
+            return False
+        recorded_method = sampling.get('method')
+        requested_method = method
+        if method is None:
+            method = recorded_method or 'lhs'
+        nrows_per_smpl = calc_nrows_per_sample(method, npmtrs)
+        if method in CONTINUABLE_METHODS and recorded_method == method and sampling.get('nsamples') == len(existing):
+            # continue the sequence, the combined sample is the same as sampling all of them at once
+            nlevels = sampling.get('nlevels', nlevels)
+            pmtrs_nrmlz = sample_unit(method, nsamples, npmtrs, seed=sampling['seed'], nskip=len(existing)//nrows_per_smpl, nlevels=nlevels)
+            sampling['nsamples'] = len(existing) + len(pmtrs_nrmlz)
+        elif nrows_per_smpl != 1:
+            print(f"The existing variants are not a {method} sample with a recorded seed, they cannot be appended to")
+            return False
+        elif requested_method is not None and (requested_method != 'lhs' or recorded_method not in [None, 'lhs', 'augment_lhs']):
+            # augmenting only keeps the sample a latin hypercube, do not pass it off as the requested method
+            print(f"The existing variants are a {recorded_method or 'unrecorded'} sample, they cannot be appended to with -m {requested_method}."
+                  " Leave out -m to append to them with the method they allow")
+            return False
+        else:
+            print(f"Augmenting the existing {recorded_method or 'unrecorded'} sample, its sampling is recorded as augment_lhs", file=sys.stderr)
+            pmtrs_nrmlz = augment_lhs(existing, nsamples, seed=seed)
+            sampling = {'method': 'augment_lhs', 'seed': seed, 'nsamples': len(existing) + nsamples}
+        pmtrc_mod['parameter_normalized_values'] = np.concatenate([existing, pmtrs_nrmlz])
+        pmtrc_mod['selected_indices'] = list(range(len(existing), len(existing) + len(pmtrs_nrmlz)))
+    else:
+        if method is None:
+            method = 'lhs'
+        pmtrs_nrmlz = sample_unit(method, nsamples, npmtrs, seed=seed, nlevels=nlevels)
+        pmtrc_mod['parameter_normalized_values'] = pmtrs_nrmlz
+        sampling = {'method': method, 'seed': seed, 'nsamples': len(pmtrs_nrmlz)}
+        if method == 'morris':
+            sampling['nlevels'] = nlevels
+        # the selection of a previous sample does not apply to the new sample
+        pmtrc_mod.pop('selected_indices', None)
+    pmtrc_mod['sampling'] = sampling
+
+    pmtrc_utils.write_pmtrc_json(pmtrc_mod, res_path)
     return True
 
 def main():
@@ -102,7 +424,8 @@ def main():
         
     res_path = str(Path(res_path).resolve())
 
-    is_executed = sample_pmtrs(nsamples, pmtrc_path, res_path)
+    is_executed = sample_pmtrs(nsamples, pmtrc_path, res_path, append=args.append, method=args.method, seed=args.seed,
+                               nlevels=args.levels)
     if is_executed:
         # make sure this output can be piped into another command on the cmd
         print(res_path)
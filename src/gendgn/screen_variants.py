@@ -0,0 +1,254 @@
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from . import pmtrc_utils
+from . import batch_eval
+from . import collect_results
+from . import variant_delta
+from . import surrogate
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Select the most promising or uncertain variants to evaluate with a surrogate model trained on the evaluated variants")
+
+    # defining arguments for parser object
+    parser.add_argument('-j', '--json', type = str,
+                        metavar = 'FILE',
+                        help = 'The file path of the json parametric file')
+
+    parser.add_argument('-r', '--res', type = str,
+                        metavar = 'DIR',
+                        help = 'The directory path of the results of the evaluated variants')
+
+    parser.add_argument('-n', '--nselect', type = int,
+                        metavar = 'NSELECT',
+                        help = 'The number of variants to select')
+
+    parser.add_argument('-o', '--objective', type = str, default = 'Total Site Energy:Total Energy',
+                        metavar = 'NAME',
+                        help = 'The {row name}:{column name} of the Site and Source Energy table to minimize')
+
+    parser.add_argument('-c', '--criterion', type = str, default = 'lcb', choices = ['lcb', 'best', 'uncertain'],
+                        help = 'lcb selects promising or uncertain variants, best the most promising and uncertain the most uncertain')
+
+    parser.add_argument('-k', '--kappa', type = float, default = 2.0,
+                        metavar = 'KAPPA',
+                        help = 'The weight of the uncertainty for the lcb criterion')
+
+    parser.add_argument('-f', '--refit', action = 'store_true', default=False,
+                        help = 'turn it on to optimize the hyperparameters of the surrogate again instead of updating it with the new results')
+
+    parser.add_argument('-p', '--process', action = 'store_true', default=False,
+                        help = 'turn it on if piping in json filepath')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def read_evaluated(res_dir: str, obj_name: str) -> dict:
+    '''
+    Read the objective of the variants with valid results.
+
+    Parameters
+    ----------
+    res_dir: str
+        The directory path of the results generated by batch_eval or gen_eval.
+
+    obj_name: str
+        the {row name}:{column name} of the Site and Source Energy table, see collect_results.read_sql_scalars.
+
+    Returns
+    -------
+    dict
+        dictionary of the variant index to its objective.
+    '''
+    evaluated = {}
+    res_dir_pobj = Path(res_dir)
+    if not res_dir_pobj.exists():
+        return evaluated
+    for var_dir in res_dir_pobj.iterdir():
+        if not var_dir.is_dir():
+            continue
+        filename = var_dir.name
+        var_indx = variant_delta.get_variant_indx(filename)
+        if var_indx is None or not batch_eval.is_res_valid(res_dir, filename):
+            continue
+        sql_path = batch_eval.get_res_paths(res_dir, filename)['sql']
+        scalars = collect_results.read_sql_scalars(str(sql_path))
+        if obj_name in scalars:
+            evaluated[var_indx] = scalars[obj_name]['value']
+    return evaluated
+
+def read_attempted(res_dir: str) -> dict:
+    '''
+    Read the status of all the variants with a results directory, whether their evaluation succeeded or not.
+
+    Parameters
+    ----------
+    res_dir: str
+        The directory path of the results generated by batch_eval or gen_eval.
+
+    Returns
+    -------
+    dict
+        dictionary of the variant index to the status of its manifest, see batch_eval.get_stored_status. 'incomplete' for a variant without
+        a manifest, e.g. its evaluation crashed or is still running.
+    '''
+    attempted = {}
+    res_dir_pobj = Path(res_dir)
+    if not res_dir_pobj.exists():
+        return attempted
+    for var_dir in res_dir_pobj.iterdir():
+        if not var_dir.is_dir():
+            continue
+        filename = var_dir.name
+        var_indx = variant_delta.get_variant_indx(filename)
+        if var_indx is None:
+            continue
+        status = batch_eval.get_stored_status(res_dir, filename)
+        attempted[var_indx] = status if status is not None else 'incomplete'
+    return attempted
+
+def screen_variants(pmtrc_path: str, res_dir: str, nselect: int, obj_name: str = 'Total Site Energy:Total Energy', criterion: str = 'lcb',
+                    kappa: float = 2.0, refit: bool = False) -> dict:
+    '''
+    Train a gaussian process on the evaluated variants and select the variants to evaluate next among the rows of parameter_normalized_values
+    that are not evaluated yet. Variants whose evaluation failed are not selected again. The indices of the selected rows are written to selected_indices of the json parametric model, exe_wwr_constr and gen_eval
+    then only generate those variants. The gaussian process is saved in the results directory and updated with the new results in the next run,
+    its accuracy is written to surrogate_report.json in the results directory.
+
+    Parameters
+    ----------
+    pmtrc_path: str
+        The file path of the json parametric model.
+
+    res_dir: str
+        The directory path of the results of the evaluated variants.
+
+    nselect: int
+        The number of variants to select.
+
+    obj_name: str, optional
+        the {row name}:{column name} of the Site and Source Energy table to minimize. Default = 'Total Site Energy:Total Energy'.
+
+    criterion: str, optional
+        'lcb', 'best' or 'uncertain', see surrogate.select_batch. Default = 'lcb'.
+
+    kappa: float, optional
+        the weight of the standard deviation for 'lcb'. Default = 2.0.
+
+    refit: bool, optional
+        If True, optimize the hyperparameters again instead of updating the saved gaussian process. Default = False.
+
+    Returns
+    -------
+    dict
+        the report written to surrogate_report.json, None if the json parametric model is not valid.
+        - objective: the name of the objective
+        - ntrain: the number of evaluated variants
+        - hyperparameters: the lengthscales, signal_var and noise_var of the gaussian process
+        - holdout: the accuracy of the previous gaussian process on the results that are new in this run
+        - loo: the leave-one-out accuracy on all the evaluated variants
+        - selected: the index, predicted mean and standard deviation of each selected variant
+        - failed: the indices and statuses of the variants that are evaluated without a valid objective, they are not selected again
+    '''
+    pmtrc_mod = pmtrc_utils.read_pmtrc_json(pmtrc_path)
+    if pmtrc_mod is None:
+        return None
+
+    nmlz_pmtrs = np.array(pmtrc_mod['parameter_normalized_values'], dtype=float)
+    evaluated = read_evaluated(res_dir, obj_name)
+    train_indices = np.array(sorted(indx for indx in evaluated if indx < len(nmlz_pmtrs)), dtype=int)
+    train_vals = np.array([evaluated[indx] for indx in train_indices], dtype=float)
+    train_xyzs = nmlz_pmtrs[train_indices]
+    # a variant that failed would fail again, it is left out like the evaluated ones so that it does not take the place of another variant
+    attempted = read_attempted(res_dir)
+    failed = {indx: status for indx, status in attempted.items() if indx not in evaluated}
+    cand_indices = np.array([indx for indx in range(len(nmlz_pmtrs)) if indx not in evaluated and indx not in attempted], dtype=int)
+
+    report = {'objective': obj_name, 'ntrain': len(train_indices), 'hyperparameters': None, 'holdout': surrogate.calc_accuracy([], [], []),
+              'loo': surrogate.calc_accuracy([], [], []), 'selected': [],
+              'failed': [{'index': int(indx), 'status': status} for indx, status in sorted(failed.items())]}
+    gp_path = Path(res_dir).joinpath('surrogate.npz')
+    # a gaussian process needs a few results to be trained, until then the rows are selected in order
+    if len(train_indices) < 3:
+        print(f"{len(train_indices)} evaluated variants are not enough to train the surrogate, selecting the first {nselect} variants",
+              file=sys.stderr)
+        selected = cand_indices[:nselect]
+        report['selected'] = [{'index': int(indx), 'mean': None, 'std': None} for indx in selected]
+    else:
+        gp = None
+        if not refit:
+            gp = surrogate.load_gp(str(gp_path), name=obj_name)
+        if gp is not None:
+            # the accuracy on the results that are new since the previous run, before they are used for training
+            is_new = ~np.isin(train_indices, gp['indices'])
+            if np.any(is_new):
+                pred_means, pred_stds = surrogate.predict_gp(gp, train_xyzs[is_new])
+                report['holdout'] = surrogate.calc_accuracy(train_vals[is_new], pred_means, pred_stds)
+        gp = surrogate.update_gp(gp, train_xyzs, train_vals, train_indices)
+        surrogate.save_gp(gp, str(gp_path), name=obj_name)
+        loo_means, loo_stds = surrogate.calc_loo(gp)
+        report['loo'] = surrogate.calc_accuracy(gp['vals'], loo_means, loo_stds)
+        report['hyperparameters'] = {'lengthscales': gp['lengthscales'].tolist(), 'signal_var': float(gp['signal_var']),
+                                     'noise_var': float(gp['noise_var'])}
+        selected = np.zeros(0, dtype=int)
+        if len(cand_indices) != 0:
+            sel_cnts, sel_means, sel_stds = surrogate.select_batch(gp, nmlz_pmtrs[cand_indices], nselect, criterion=criterion, kappa=kappa)
+            selected = cand_indices[sel_cnts]
+            report['selected'] = [{'index': int(indx), 'mean': float(mean), 'std': float(std)}
+                                  for indx, mean, std in zip(selected, sel_means, sel_stds)]
+
+    pmtrc_mod['selected_indices'] = sorted(int(indx) for indx in selected)
+    pmtrc_utils.write_pmtrc_json(pmtrc_mod, pmtrc_path)
+
+    Path(res_dir).mkdir(parents=True, exist_ok=True)
+    pretty_json_data = json.dumps(report, indent=4)
+    with open(Path(res_dir).joinpath('surrogate_report.json'), 'w') as f:
+        f.write(pretty_json_data)
+
+    # the summary goes to stderr so that only the json path is piped into the next command
+    for key in ['holdout', 'loo']:
+        acc = report[key]
+        if acc['n'] != 0:
+            print(f"{key} n={acc['n']} rmse={acc['rmse']:.4g} mae={acc['mae']:.4g} r2={acc['r2']} coverage95={acc['coverage95']:.2f}", file=sys.stderr)
+    if len(failed) != 0:
+        print(f"{len(failed)} variants evaluated without a valid {obj_name} are not selected again, see failed in surrogate_report.json",
+              file=sys.stderr)
+    print(f"{len(selected)} of {len(cand_indices)} variants selected", file=sys.stderr)
+    return report
+
+def main():
+    args = parse_args()
+    pipe_input = args.process
+    if pipe_input == False:
+        pmtrc_path = args.json
+    else:
+        lines = list(sys.stdin)
+        pmtrc_path = lines[0].strip()
+
+    pmtrc_path = str(Path(pmtrc_path).resolve())
+    res_dir = str(Path(args.res).resolve())
+    report = screen_variants(pmtrc_path, res_dir, args.nselect, obj_name=args.objective, criterion=args.criterion, kappa=args.kappa,
+                             refit=args.refit)
+    if report is not None:
+        # make sure this output can be piped into exe_wwr_constr or gen_eval
+        print(pmtrc_path)
+        sys.stdout.flush()
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
@@ -0,0 +1,438 @@
+import numpy as np
+from scipy.linalg import cho_solve, solve_triangular
+from scipy.optimize import minimize
+
+# the bounds of the log hyperparameters, the inputs are the normalized parameters and the outputs are standardized
+LOG_LENGTHSCALE_BOUNDS = (np.log(1e-2), np.log(1e2))
+LOG_SIGNAL_VAR_BOUNDS = (np.log(1e-2), np.log(1e2))
+LOG_NOISE_VAR_BOUNDS = (np.log(1e-6), np.log(1.0))
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def calc_kernel(xyzs1: np.ndarray, xyzs2: np.ndarray, lengthscales: np.ndarray, signal_var: float) -> np.ndarray:
+    '''
+    Calculate the squared exponential kernel with a lengthscale for each parameter.
+
+    Parameters
+    ----------
+    xyzs1: np.ndarray
+        np.ndarray[shape(npts1, nparameters)] the normalized parameters.
+
+    xyzs2: np.ndarray
+        np.ndarray[shape(npts2, nparameters)] the normalized parameters.
+
+    lengthscales: np.ndarray
+        np.ndarray[shape(nparameters)] the lengthscales.
+
+    signal_var: float
+        the signal variance.
+
+    Returns
+    -------
+    np.ndarray
+        np.ndarray[shape(npts1, npts2)] the kernel.
+    '''
+    scaled1 = xyzs1 / lengthscales
+    scaled2 = xyzs2 / lengthscales
+    sq_dists = np.sum(scaled1**2, axis=1)[:, None] + np.sum(scaled2**2, axis=1)[None, :] - 2 * scaled1 @ scaled2.T
+    return signal_var * np.exp(-0.5 * np.maximum(sq_dists, 0))
+
+def calc_nll(log_params: np.ndarray, xyzs: np.ndarray, vals: np.ndarray) -> tuple[float, np.ndarray]:
+    '''
+    Calculate the negative log marginal likelihood of the gaussian process and its gradient.
+
+    Parameters
+    ----------
+    log_params: np.ndarray
+        np.ndarray[shape(nparameters+2)] the log of the lengthscales, signal variance and noise variance.
+
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, nparameters)] the normalized parameters of the training data.
+
+    vals: np.ndarray
+        np.ndarray[shape(npts)] the standardized outputs of the training data.
+
+    Returns
+    -------
+    tuple[float, np.ndarray]
+        the negative log marginal likelihood and its gradient with respect to log_params.
+    '''
+    npts, npmtrs = xyzs.shape
+    lengthscales = np.exp(log_params[:npmtrs])
+    signal_var = np.exp(log_params[npmtrs])
+    noise_var = np.exp(log_params[npmtrs+1])
+    kern = calc_kernel(xyzs, xyzs, lengthscales, signal_var)
+    try:
+        chol = np.linalg.cholesky(kern + noise_var * np.eye(npts))
+    except np.linalg.LinAlgError:
+        return 1e25, np.zeros(len(log_params))
+    alpha = cho_solve((chol, True), vals)
+    nll = 0.5 * vals @ alpha + np.sum(np.log(np.diag(chol))) + 0.5 * npts * np.log(2 * np.pi)
+    # dnll/dtheta = -0.5 tr((alpha alpha^T - K^-1) dK/dtheta)
+    wmat = np.outer(alpha, alpha) - cho_solve((chol, True), np.eye(npts))
+    wkern = wmat * kern
+    grad = np.zeros(len(log_params))
+    for pcnt in range(npmtrs):
+        sq_diffs = (xyzs[:, pcnt][:, None] - xyzs[:, pcnt][None, :])**2
+        grad[pcnt] = -0.5 * np.sum(wkern * sq_diffs) / lengthscales[pcnt]**2
+    grad[npmtrs] = -0.5 * np.sum(wkern)
+    grad[npmtrs+1] = -0.5 * noise_var * np.trace(wmat)
+    return nll, grad
+
+def factorize_gp(gp: dict):
+    '''
+    Compute the cholesky factor of the kernel of the training data and the weights of the gaussian process in place.
+
+    Parameters
+    ----------
+    gp: dict
+        dictionary generated from fit_gp.
+    '''
+    npts = len(gp['xyzs'])
+    kern = calc_kernel(gp['xyzs'], gp['xyzs'], gp['lengthscales'], gp['signal_var'])
+    gp['chol'] = np.linalg.cholesky(kern + gp['noise_var'] * np.eye(npts))
+    gp['alpha'] = cho_solve((gp['chol'], True), (gp['vals'] - gp['val_mean']) / gp['val_std'])
+
+def fit_gp(xyzs: np.ndarray, vals: np.ndarray, indices: np.ndarray = None, nrestarts: int = 3, seed: int = None) -> dict:
+    '''
+    Fit a gaussian process to the training data. The hyperparameters are optimized by maximizing the log marginal likelihood.
+
+    Parameters
+    ----------
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, nparameters)] the normalized parameters of the training data.
+
+    vals: np.ndarray
+        np.ndarray[shape(npts)] the outputs of the training data.
+
+    indices: np.ndarray, optional
+        np.ndarray[shape(npts)] the variant index of each training data, used by update_gp to find the new training data.
+
+    nrestarts: int, optional
+        the number of random starting points of the optimization besides the default one. Default = 3.
+
+    seed: int, optional
+        the seed of the random starting points.
+
+    Returns
+    -------
+    dict
+        - xyzs, vals, indices: the training data
+        - val_mean, val_std: the mean and standard deviation used to standardize the outputs
+        - lengthscales, signal_var, noise_var: the hyperparameters
+        - chol, alpha: the cholesky factor of the kernel and the weights
+        - nfit: the number of training data when the hyperparameters are optimized
+    '''
+    xyzs = np.asarray(xyzs, dtype=float)
+    vals = np.asarray(vals, dtype=float)
+    npts, npmtrs = xyzs.shape
+    if indices is None:
+        indices = np.arange(npts)
+    val_mean = np.mean(vals)
+    val_std = np.std(vals)
+    if val_std == 0:
+        val_std = 1.0
+    std_vals = (vals - val_mean) / val_std
+
+    bounds = [LOG_LENGTHSCALE_BOUNDS]*npmtrs + [LOG_SIGNAL_VAR_BOUNDS, LOG_NOISE_VAR_BOUNDS]
+    starts = [np.array([np.log(0.5)]*npmtrs + [0.0, np.log(1e-2)])]
+    rng = np.random.default_rng(seed)
+    for _ in range(nrestarts):
+        starts.append(np.array([rng.uniform(bound[0], bound[1]) for bound in bounds]))
+    best_res = None
+    for start in starts:
+        res = minimize(calc_nll, start, args=(xyzs, std_vals), jac=True, method='L-BFGS-B', bounds=bounds)
+        if best_res is None or res.fun < best_res.fun:
+            best_res = res
+
+    log_params = best_res.x
+    gp = {'xyzs': xyzs, 'vals': vals, 'indices': np.asarray(indices, dtype=int), 'val_mean': val_mean, 'val_std': val_std,
+          'lengthscales': np.exp(log_params[:npmtrs]), 'signal_var': np.exp(log_params[npmtrs]), 'noise_var': np.exp(log_params[npmtrs+1]),
+          'nfit': npts}
+    factorize_gp(gp)
+    return gp
+
+def add_gp_data(gp: dict, xyzs: np.ndarray, vals: np.ndarray, indices: np.ndarray) -> dict:
+    '''
+    Add training data to the gaussian process without optimizing the hyperparameters again. The cholesky factor is extended with a block
+    update instead of factorizing the whole kernel.
+
+    Parameters
+    ----------
+    gp: dict
+        dictionary generated from fit_gp.
+
+    xyzs: np.ndarray
+        np.ndarray[shape(nnew, nparameters)] the normalized parameters of the new training data.
+
+    vals: np.ndarray
+        np.ndarray[shape(nnew)] the outputs of the new training data.
+
+    indices: np.ndarray
+        np.ndarray[shape(nnew)] the variant index of each new training data.
+
+    Returns
+    -------
+    dict
+        the gaussian process with the new training data.
+    '''
+    xyzs = np.asarray(xyzs, dtype=float)
+    if len(xyzs) == 0:
+        return gp
+    kern12 = calc_kernel(gp['xyzs'], xyzs, gp['lengthscales'], gp['signal_var'])
+    kern22 = calc_kernel(xyzs, xyzs, gp['lengthscales'], gp['signal_var']) + gp['noise_var'] * np.eye(len(xyzs))
+    chol12 = solve_triangular(gp['chol'], kern12, lower=True)
+    chol22 = np.linalg.cholesky(kern22 - chol12.T @ chol12)
+    nold = len(gp['chol'])
+    chol = np.zeros((nold + len(xyzs), nold + len(xyzs)))
+    chol[:nold, :nold] = gp['chol']
+    chol[nold:, :nold] = chol12.T
+    chol[nold:, nold:] = chol22
+    gp = dict(gp)
+    gp['xyzs'] = np.concatenate([gp['xyzs'], xyzs])
+    gp['vals'] = np.concatenate([gp['vals'], np.asarray(vals, dtype=float)])
+    gp['indices'] = np.concatenate([gp['indices'], np.asarray(indices, dtype=int)])
+    gp['chol'] = chol
+    gp['alpha'] = cho_solve((chol, True), (gp['vals'] - gp['val_mean']) / gp['val_std'])
+    return gp
+
+def update_gp(gp: dict, xyzs: np.ndarray, vals: np.ndarray, indices: np.ndarray, refit_ratio: float = 1.5, seed: int = None) -> dict:
+    '''
+    Update the gaussian process with all the training data available. Only the new training data are added if the existing training data are
+    unchanged, the hyperparameters are optimized again once the training data grows by refit_ratio since they were last optimized.
+
+    Parameters
+    ----------
+    gp: dict
+        dictionary generated from fit_gp, None to fit a new gaussian process.
+
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, nparameters)] the normalized parameters of all the training data.
+
+    vals: np.ndarray
+        np.ndarray[shape(npts)] the outputs of all the training data.
+
+    indices: np.ndarray
+        np.ndarray[shape(npts)] the variant index of each training data.
+
+    refit_ratio: float, optional
+        the hyperparameters are optimized again when the number of training data reaches refit_ratio times the number when they were last
+        optimized. Default = 1.5.
+
+    seed: int, optional
+        the seed of the random starting points of the optimization.
+
+    Returns
+    -------
+    dict
+        the updated gaussian process.
+    '''
+    xyzs = np.asarray(xyzs, dtype=float)
+    vals = np.asarray(vals, dtype=float)
+    indices = np.asarray(indices, dtype=int)
+    if gp is None or len(xyzs) >= gp['nfit'] * refit_ratio:
+        return fit_gp(xyzs, vals, indices=indices, seed=seed)
+
+    row_map = {indx: cnt for cnt, indx in enumerate(indices)}
+    old_rows = [row_map.get(indx) for indx in gp['indices']]
+    if None in old_rows or xyzs.shape[1] != gp['xyzs'].shape[1]:
+        return fit_gp(xyzs, vals, indices=indices, seed=seed)
+    old_rows = np.array(old_rows, dtype=int)
+    if not np.allclose(xyzs[old_rows], gp['xyzs']) or not np.allclose(vals[old_rows], gp['vals']):
+        return fit_gp(xyzs, vals, indices=indices, seed=seed)
+
+    is_new = np.ones(len(indices), dtype=bool)
+    is_new[old_rows] = False
+    return add_gp_data(gp, xyzs[is_new], vals[is_new], indices[is_new])
+
+def predict_gp(gp: dict, xyzs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Predict the outputs with the gaussian process.
+
+    Parameters
+    ----------
+    gp: dict
+        dictionary generated from fit_gp.
+
+    xyzs: np.ndarray
+        np.ndarray[shape(npts, nparameters)] the normalized parameters.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        np.ndarray[shape(npts)] the predicted mean and standard deviation.
+    '''
+    xyzs = np.asarray(xyzs, dtype=float)
+    kern_s = calc_kernel(gp['xyzs'], xyzs, gp['lengthscales'], gp['signal_var'])
+    mean = kern_s.T @ gp['alpha']
+    vmat = solve_triangular(gp['chol'], kern_s, lower=True)
+    var = np.maximum(gp['signal_var'] - np.sum(vmat**2, axis=0), 0)
+    return mean * gp['val_std'] + gp['val_mean'], np.sqrt(var) * gp['val_std']
+
+def calc_loo(gp: dict) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Calculate the leave-one-out predictions of the training data in closed form, without fitting the gaussian process again.
+
+    Parameters
+    ----------
+    gp: dict
+        dictionary generated from fit_gp.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        np.ndarray[shape(npts)] the leave-one-out mean and standard deviation of each training data.
+    '''
+    kern_inv = cho_solve((gp['chol'], True), np.eye(len(gp['chol'])))
+    kern_inv_diag = np.diag(kern_inv)
+    std_vals = (gp['vals'] - gp['val_mean']) / gp['val_std']
+    loo_mean = std_vals - gp['alpha'] / kern_inv_diag
+    loo_std = np.sqrt(1 / kern_inv_diag)
+    return loo_mean * gp['val_std'] + gp['val_mean'], loo_std * gp['val_std']
+
+def calc_accuracy(vals: np.ndarray, pred_means: np.ndarray, pred_stds: np.ndarray) -> dict:
+    '''
+    Calculate the accuracy of the predictions.
+
+    Parameters
+    ----------
+    vals: np.ndarray
+        np.ndarray[shape(npts)] the actual outputs.
+
+    pred_means: np.ndarray
+        np.ndarray[shape(npts)] the predicted mean.
+
+    pred_stds: np.ndarray
+        np.ndarray[shape(npts)] the predicted standard deviation.
+
+    Returns
+    -------
+    dict
+        - n: the number of predictions
+        - rmse: the root mean square error
+        - mae: the mean absolute error
+        - r2: the coefficient of determination
+        - coverage95: the fraction of the actual outputs within the 95% interval of the predictions
+    '''
+    vals = np.asarray(vals, dtype=float)
+    errs = vals - np.asarray(pred_means, dtype=float)
+    if len(vals) == 0:
+        return {'n': 0, 'rmse': None, 'mae': None, 'r2': None, 'coverage95': None}
+    sst = np.sum((vals - np.mean(vals))**2)
+    r2 = None
+    if sst > 0:
+        r2 = float(1 - np.sum(errs**2) / sst)
+    coverage = float(np.mean(np.abs(errs) <= 1.96 * np.asarray(pred_stds, dtype=float)))
+    return {'n': len(vals), 'rmse': float(np.sqrt(np.mean(errs**2))), 'mae': float(np.mean(np.abs(errs))), 'r2': r2, 'coverage95': coverage}
+
+def select_batch(gp: dict, xyzs: np.ndarray, nselect: int, criterion: str = 'lcb', kappa: float = 2.0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Select a batch of candidates to minimize the output. The candidates are selected one at a time, each selected candidate is assumed to
+    take its predicted mean so that the uncertainty around it is reduced before the next one is selected and the batch does not cluster.
+
+    Parameters
+    ----------
+    gp: dict
+        dictionary generated from fit_gp.
+
+    xyzs: np.ndarray
+        np.ndarray[shape(ncandidates, nparameters)] the normalized parameters of the candidates.
+
+    nselect: int
+        the number of candidates to select.
+
+    criterion: str, optional
+        - 'lcb': the lowest predicted mean - kappa * standard deviation, promising or uncertain candidates
+        - 'best': the lowest predicted mean
+        - 'uncertain': the highest predicted standard deviation
+        Default = 'lcb'.
+
+    kappa: float, optional
+        the weight of the standard deviation for 'lcb'. Default = 2.0.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray]
+        np.ndarray[shape(nselect)] the indices of the selected candidates, and their predicted mean and standard deviation before selection.
+    '''
+    xyzs = np.asarray(xyzs, dtype=float)
+    nselect = min(nselect, len(xyzs))
+    pred_means, pred_stds = predict_gp(gp, xyzs)
+    if criterion == 'best':
+        selected = np.argsort(pred_means, kind='stable')[:nselect]
+        return selected, pred_means[selected], pred_stds[selected]
+
+    # the posterior variance in standardized units, updated with the covariance to each selected candidate
+    kern_s = calc_kernel(gp['xyzs'], xyzs, gp['lengthscales'], gp['signal_var'])
+    vmat = solve_triangular(gp['chol'], kern_s, lower=True)
+    var = np.maximum(gp['signal_var'] - np.sum(vmat**2, axis=0), 0)
+    std_means = (pred_means - gp['val_mean']) / gp['val_std']
+    wrows = []
+    selected = []
+    is_free = np.ones(len(xyzs), dtype=bool)
+    for _ in range(nselect):
+        if criterion == 'uncertain':
+            scores = -var
+        else:
+            scores = std_means - kappa * np.sqrt(var)
+        scores = np.where(is_free, scores, np.inf)
+        scnt = int(np.argmin(scores))
+        selected.append(scnt)
+        is_free[scnt] = False
+        post_cov = calc_kernel(xyzs, xyzs[scnt:scnt+1], gp['lengthscales'], gp['signal_var'])[:, 0] - vmat.T @ vmat[:, scnt]
+        for wrow in wrows:
+            post_cov -= wrow * wrow[scnt]
+        wrow = post_cov / np.sqrt(var[scnt] + gp['noise_var'])
+        wrows.append(wrow)
+        var = np.maximum(var - wrow**2, 0)
+    selected = np.array(selected, dtype=int)
+    return selected, pred_means[selected], pred_stds[selected]
+
+def save_gp(gp: dict, gp_path: str, name: str = ''):
+    '''
+    Save the gaussian process to a .npz file.
+
+    Parameters
+    ----------
+    gp: dict
+        dictionary generated from fit_gp.
+
+    gp_path: str
+        the file path of the .npz file.
+
+    name: str, optional
+        the name of the output the gaussian process predicts.
+    '''
+    np.savez(gp_path, name=np.array(name), **gp)
+
+def load_gp(gp_path: str, name: str = '') -> dict:
+    '''
+    Load a gaussian process saved with save_gp.
+
+    Parameters
+    ----------
+    gp_path: str
+        the file path of the .npz file.
+
+    name: str, optional
+        the name of the output the gaussian process predicts.
+
+    Returns
+    -------
+    dict
+        the gaussian process, None if the file does not exist or the gaussian process predicts another output.
+    '''
+    try:
+        with np.load(gp_path) as gp_file:
+            gp = {key: gp_file[key] for key in gp_file.files}
+    except (OSError, ValueError):
+        return None
+    if str(gp.pop('name')) != name:
+        return None
+    for key in ['val_mean', 'val_std', 'signal_var', 'noise_var']:
+        gp[key] = float(gp[key])
+    gp['nfit'] = int(gp['nfit'])
+    return gp
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
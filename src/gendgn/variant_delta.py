@@ -0,0 +1,535 @@
+from __future__ import annotations
+
+import re
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+
+from . import lazy_import
+
+# only materializing and opening a variant need ifcopenshell, batch_eval reads the variant names and hashes without it
+ifcopenshell = lazy_import.lazy_import('ifcopenshell')
+
+# the suffix of the delta encoded variants
+DELTA_SUFFIX = '.ifcdelta.json'
+# the base models read by the process, keyed by the file path
+BASE_CACHE = {}
+# an entity line of the STEP text, ifcopenshell writes one entity per line
+ENT_LINE_PATTERN = re.compile(rb'^#(\d+)=[^\n]*\n', re.MULTILINE)
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_args():
+    # create parser object
+    parser = argparse.ArgumentParser(description = "Materialize the delta encoded variants into full IFC files")
+
+    # defining arguments for parser object
+    parser.add_argument('-v', '--var', type = str,
+                        metavar = 'DIR',
+                        help = 'The directory path containing the delta encoded variants')
+
+    parser.add_argument('-r', '--res', type = str,
+                        metavar = 'DIR',
+                        help = 'The directory path for the IFC files')
+
+    parser.add_argument('-b', '--base', type = str, default = None,
+                        metavar = 'FILE',
+                        help = 'The file path of the base IFC, if it is moved after the variants are generated')
+
+    parser.add_argument('-p', '--process', action = 'store_true', default=False,
+                        help = 'turn it on if piping in the variant directory path')
+
+    # parse the arguments from standard input
+    args = parser.parse_args()
+    return args
+
+def get_variant_name(var_path: str) -> str:
+    '''
+    Get the name of a variant from its file path, e.g. small_office_0 for both small_office_0.ifc and small_office_0.ifcdelta.json.
+
+    Parameters
+    ----------
+    var_path: str
+        The file path of the variant.
+
+    Returns
+    -------
+    str
+        the name of the variant.
+    '''
+    var_name = Path(var_path).name
+    if var_name.endswith(DELTA_SUFFIX):
+        return var_name[:-len(DELTA_SUFFIX)]
+    return Path(var_path).stem
+
+def get_variant_indx(filename: str) -> int:
+    '''
+    Get the index of the variant from its name.
+
+    Parameters
+    ----------
+    filename: str
+        The name of the variant generated by exe_wwr_constr, {ifc_filename}_{index}.
+
+    Returns
+    -------
+    int
+        the index of the variant. None if the name does not end with an index.
+    '''
+    indx_str = filename.rsplit('_', 1)[-1]
+    if indx_str.isdigit():
+        return int(indx_str)
+    return None
+
+def split_ifc_str(ifc_str: str) -> tuple[str, dict, str]:
+    '''
+    Split the STEP text from ifcopenshell.file.to_string into the header, the entities and the footer. ifcopenshell writes one entity per line.
+
+    Parameters
+    ----------
+    ifc_str: str
+        the STEP text of the ifc model.
+
+    Returns
+    -------
+    tuple[str, dict, str]
+        - the header up to and including the DATA; line
+        - dictionary of the entity id to its line
+        - the footer from the ENDSEC; of the data section
+    '''
+    data_indx = ifc_str.find('DATA;')
+    data_start = ifc_str.index('\n', data_indx) + 1
+    data_end = ifc_str.find('ENDSEC;', data_start)
+    header = ifc_str[:data_start]
+    footer = ifc_str[data_end:]
+    ent_lines = {}
+    for line in ifc_str[data_start:data_end].splitlines():
+        if line.startswith('#'):
+            ent_lines[int(line[1:line.index('=')])] = line
+    return header, ent_lines, footer
+
+def calc_data_hash(ifc_str: str) -> str:
+    '''
+    Calculate the sha256 hash of the data section of the STEP text, same as batch_eval.calc_ifc_str_hash.
+
+    Parameters
+    ----------
+    ifc_str: str
+        the STEP text of the ifc model.
+
+    Returns
+    -------
+    str
+        the hex digest of the data section.
+    '''
+    data_indx = ifc_str.find('DATA;')
+    if data_indx == -1:
+        data_indx = 0
+    return hashlib.sha256(ifc_str[data_indx:].encode()).hexdigest()
+
+def get_tmpl_base(tmpl: dict) -> dict:
+    '''
+    Get the entities and hash of the base model of the variant template. They are computed once and kept in the template.
+
+    Parameters
+    ----------
+    tmpl: dict
+        dictionary generated from exe_wwr_constr.create_variant_template.
+
+    Returns
+    -------
+    dict
+        - ent_lines: dictionary of the entity id to its line
+        - hash: the hash of the data section of the base model
+    '''
+    if 'delta_base' not in tmpl:
+        ifc_str = tmpl['ifc_str']
+        _, ent_lines, _ = split_ifc_str(ifc_str)
+        tmpl['delta_base'] = {'ent_lines': ent_lines, 'hash': calc_data_hash(ifc_str)}
+    return tmpl['delta_base']
+
+def create_variant_delta(base_ent_lines: dict, var_str: str) -> dict:
+    '''
+    Create the delta between the base model and the variant.
+
+    Parameters
+    ----------
+    base_ent_lines: dict
+        dictionary of the entity id to its line of the base model from split_ifc_str.
+
+    var_str: str
+        the STEP text of the variant.
+
+    Returns
+    -------
+    dict
+        - deleted: the ids of the entities of the base model that are not in the variant
+        - entities: the lines of the new and changed entities
+    '''
+    _, var_ent_lines, _ = split_ifc_str(var_str)
+    deleted = [ent_id for ent_id in base_ent_lines if ent_id not in var_ent_lines]
+    entities = [line for ent_id, line in var_ent_lines.items() if base_ent_lines.get(ent_id) != line]
+    return {'deleted': deleted, 'entities': entities}
+
+def write_variant_delta(ifcmodel: ifcopenshell.file, tmpl: dict, base_path: str, delta_path: str, edited_ids: list[int] = None) -> str:
+    '''
+    Write the variant as a delta of the base model.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model of the variant.
+
+    tmpl: dict
+        dictionary generated from exe_wwr_constr.create_variant_template, the variant is generated from.
+
+    base_path: str
+        The file path of the base ifc.
+
+    delta_path: str
+        The file path of the delta, ends with .ifcdelta.json.
+
+    edited_ids: list[int], optional
+        the ids of the entities of the base model that are edited or removed in the variant, see collect_patch_lines. Default to comparing
+        all the entities of the variant with the base model.
+
+    Returns
+    -------
+    str
+        The file path of the delta.
+    '''
+    tmpl_base = get_tmpl_base(tmpl)
+    if edited_ids is None:
+        delta = create_variant_delta(tmpl_base['ent_lines'], ifcmodel.to_string())
+    else:
+        base_ent_lines = tmpl_base['ent_lines']
+        patch_lines = collect_patch_lines(ifcmodel, get_tmpl_step_index(tmpl)['max_id'], edited_ids)
+        deleted = [ent_id for ent_id, line in patch_lines.items() if line is None and ent_id in base_ent_lines]
+        entities = [line for ent_id, line in patch_lines.items() if line is not None and base_ent_lines.get(ent_id) != line]
+        delta = {'deleted': deleted, 'entities': entities}
+    delta_json = {'base': str(Path(base_path).resolve()), 'base_hash': tmpl_base['hash'], 'schema': ifcmodel.schema}
+    delta_json.update(delta)
+    with open(delta_path, 'w') as f:
+        json.dump(delta_json, f)
+    return delta_path
+
+def index_step_text(ifc_str: str) -> dict:
+    '''
+    Index the byte offsets of the entity lines of the STEP text, so that a variant is written by copying the unchanged regions of the text.
+
+    Parameters
+    ----------
+    ifc_str: str
+        the STEP text of the ifc model.
+
+    Returns
+    -------
+    dict
+        - ifc_bytes: the encoded STEP text
+        - offsets: dictionary of the entity id to the start and end offset of its line, including the newline
+        - footer_start: the offset of the ENDSEC; of the data section
+        - max_id: the largest entity id
+    '''
+    ifc_bytes = ifc_str.encode()
+    data_indx = ifc_bytes.find(b'DATA;')
+    data_start = ifc_bytes.index(b'\n', data_indx) + 1
+    footer_start = ifc_bytes.find(b'ENDSEC;', data_start)
+    offsets = {int(match.group(1)): match.span() for match in ENT_LINE_PATTERN.finditer(ifc_bytes, data_start, footer_start)}
+    max_id = max(offsets.keys(), default=0)
+    return {'ifc_bytes': ifc_bytes, 'offsets': offsets, 'footer_start': footer_start, 'max_id': max_id}
+
+def get_tmpl_step_index(tmpl: dict) -> dict:
+    '''
+    Get the index of the STEP text of the base model of the variant template. It is computed once and kept in the template.
+
+    Parameters
+    ----------
+    tmpl: dict
+        dictionary generated from exe_wwr_constr.create_variant_template.
+
+    Returns
+    -------
+    dict
+        the index from index_step_text.
+    '''
+    if 'step_index' not in tmpl:
+        tmpl['step_index'] = index_step_text(tmpl['ifc_str'])
+    return tmpl['step_index']
+
+def collect_patch_lines(ifcmodel: ifcopenshell.file, base_max_id: int, edited_ids: list[int]) -> dict:
+    '''
+    Collect the lines of the edited and new entities of a variant, without serializing the whole model.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model of the variant.
+
+    base_max_id: int
+        the largest entity id of the base model, the entities after it are new.
+
+    edited_ids: list[int]
+        the ids of the entities of the base model that are edited or removed in the variant. All of them need to be listed, the other
+        entities are copied from the base model.
+
+    Returns
+    -------
+    dict
+        the entity id to its line without the newline, None for the removed entities, in the order of the ids.
+    '''
+    # the instances of the underlying file are serialized directly, a third faster than through ifcopenshell.entity_instance
+    ifc_file = ifcmodel.wrapped_data
+    ent_ids = set([ent_id for ent_id in edited_ids if ent_id <= base_max_id])
+    ent_ids.update(range(base_max_id + 1, ifc_file.getMaxId() + 1))
+    patch_lines = {}
+    for ent_id in sorted(ent_ids):
+        try:
+            line = ifc_file.by_id(ent_id).to_string(True) + ';'
+        except RuntimeError:
+            # removed from the variant, or an id that is never used
+            line = None
+        if line is not None or ent_id <= base_max_id:
+            patch_lines[ent_id] = line
+    return patch_lines
+
+def write_variant_patch(ifcmodel: ifcopenshell.file, tmpl: dict, edited_ids: list[int], res_path: str) -> str:
+    '''
+    Write the variant as a full ifc file by patching the STEP text of the base model, the unchanged regions are copied as they are and only
+    the edited and new entities are serialized. The data section is the same as ifcmodel.write, the header is the one of the base model.
+
+    Parameters
+    ----------
+    ifcmodel: ifcopenshell.file
+        the ifc model of the variant.
+
+    tmpl: dict
+        dictionary generated from exe_wwr_constr.create_variant_template, the variant is generated from.
+
+    edited_ids: list[int]
+        the ids of the entities of the base model that are edited or removed in the variant, see collect_patch_lines.
+
+    res_path: str
+        The file path of the ifc.
+
+    Returns
+    -------
+    str
+        The file path of the ifc.
+    '''
+    step_index = get_tmpl_step_index(tmpl)
+    offsets = step_index['offsets']
+    footer_start = step_index['footer_start']
+    ifc_view = memoryview(step_index['ifc_bytes'])
+    patch_lines = collect_patch_lines(ifcmodel, step_index['max_id'], edited_ids)
+    with open(res_path, 'wb') as f:
+        pos = 0
+        new_lines = []
+        for ent_id, line in patch_lines.items():
+            if ent_id not in offsets:
+                if line is not None:
+                    new_lines.append(line)
+                continue
+            start, end = offsets[ent_id]
+            f.write(ifc_view[pos:start])
+            if line is not None:
+                f.write((line + '\n').encode())
+            pos = end
+        f.write(ifc_view[pos:footer_start])
+        if new_lines:
+            f.write(('\n'.join(new_lines) + '\n').encode())
+        f.write(ifc_view[footer_start:])
+    return res_path
+
+def read_base(base_path: str, base_hash: str = None) -> tuple[str, dict, str]:
+    '''
+    Read the base model of the variants, the last base model read is kept in memory for the next variants.
+
+    Parameters
+    ----------
+    base_path: str
+        The file path of the base ifc.
+
+    base_hash: str, optional
+        the hash of the base model recorded in the delta, checked against the base model read.
+
+    Returns
+    -------
+    tuple[str, dict, str]
+        the header, entities and footer from split_ifc_str.
+    '''
+    base_path = str(Path(base_path).resolve())
+    mtime = Path(base_path).stat().st_mtime
+    cached = BASE_CACHE.get(base_path)
+    if cached is None or cached['mtime'] != mtime:
+        # the delta is against the STEP text written by ifcopenshell, not the text in the base file
+        ifc_str = ifcopenshell.open(base_path).to_string()
+        header, ent_lines, footer = split_ifc_str(ifc_str)
+        cached = {'mtime': mtime, 'hash': calc_data_hash(ifc_str), 'header': header, 'ent_lines': ent_lines, 'footer': footer}
+        BASE_CACHE.clear()
+        BASE_CACHE[base_path] = cached
+    if base_hash is not None and cached['hash'] != base_hash:
+        raise ValueError(f"The base ifc {base_path} is not the one the variant is generated from")
+    return cached['header'], cached['ent_lines'], cached['footer']
+
+def iter_variant_lines(delta_path: str, base_path: str = None):
+    '''
+    Stream the STEP text of the full variant line by line, without building the variant in memory.
+
+    Parameters
+    ----------
+    delta_path: str
+        The file path of the delta.
+
+    base_path: str, optional
+        The file path of the base ifc. Default to the path recorded in the delta.
+
+    Yields
+    ------
+    str
+        the lines of the STEP text, each ends with a newline.
+    '''
+    with open(delta_path) as f:
+        delta = json.load(f)
+    if base_path is None:
+        base_path = delta['base']
+    header, base_ent_lines, footer = read_base(base_path, base_hash=delta['base_hash'])
+    deleted = set(delta['deleted'])
+    var_ent_lines = {int(line[1:line.index('=')]): line for line in delta['entities']}
+    yield header
+    # merge the base and the delta in the order of the ids, same as ifcopenshell
+    for ent_id, line in base_ent_lines.items():
+        if ent_id in deleted:
+            continue
+        yield var_ent_lines.pop(ent_id, line) + '\n'
+    for ent_id in sorted(var_ent_lines.keys()):
+        yield var_ent_lines[ent_id] + '\n'
+    yield footer
+
+def calc_delta_hash(delta_path: str, base_path: str = None) -> str:
+    '''
+    Calculate the hash of the data section of the full variant, same as batch_eval.calc_ifc_hash of the materialized variant.
+
+    Parameters
+    ----------
+    delta_path: str
+        The file path of the delta.
+
+    base_path: str, optional
+        The file path of the base ifc. Default to the path recorded in the delta.
+
+    Returns
+    -------
+    str
+        the hex digest of the data section.
+    '''
+    sha = hashlib.sha256()
+    lines = iter_variant_lines(delta_path, base_path=base_path)
+    header = next(lines)
+    sha.update(header[header.find('DATA;'):].encode())
+    for line in lines:
+        sha.update(line.encode())
+    return sha.hexdigest()
+
+def open_variant(delta_path: str, base_path: str = None) -> ifcopenshell.file:
+    '''
+    Open a delta encoded variant as an ifc model in memory.
+
+    Parameters
+    ----------
+    delta_path: str
+        The file path of the delta.
+
+    base_path: str, optional
+        The file path of the base ifc. Default to the path recorded in the delta.
+
+    Returns
+    -------
+    ifcopenshell.file
+        the ifc model of the variant.
+    '''
+    return ifcopenshell.file.from_string(''.join(iter_variant_lines(delta_path, base_path=base_path)))
+
+def materialize_variant(delta_path: str, ifc_path: str, base_path: str = None) -> str:
+    '''
+    Write a delta encoded variant as a full ifc file.
+
+    Parameters
+    ----------
+    delta_path: str
+        The file path of the delta.
+
+    ifc_path: str
+        The file path of the resultant ifc.
+
+    base_path: str, optional
+        The file path of the base ifc. Default to the path recorded in the delta.
+
+    Returns
+    -------
+    str
+        The file path of the ifc.
+    '''
+    with open(ifc_path, 'w') as f:
+        f.writelines(iter_variant_lines(delta_path, base_path=base_path))
+    return ifc_path
+
+def materialize_variants(var_dir: str, res_dir: str, base_path: str = None) -> list[str]:
+    '''
+    Write all the delta encoded variants in the directory as full ifc files.
+
+    Parameters
+    ----------
+    var_dir: str
+        The directory path of the delta encoded variants.
+
+    res_dir: str
+        The directory path for the ifc files.
+
+    base_path: str, optional
+        The file path of the base ifc. Default to the path recorded in the deltas.
+
+    Returns
+    -------
+    list[str]
+        The file paths of the ifc files.
+    '''
+    res_dir = Path(res_dir)
+    res_dir.mkdir(parents=True, exist_ok=True)
+    delta_paths = sorted(Path(var_dir).glob(f"*{DELTA_SUFFIX}"))
+    ifc_paths = []
+    for delta_path in delta_paths:
+        ifc_path = str(res_dir.joinpath(f"{get_variant_name(delta_path)}.ifc"))
+        ifc_paths.append(materialize_variant(str(delta_path), ifc_path, base_path=base_path))
+    return ifc_paths
+
+def main():
+    args = parse_args()
+    pipe_input = args.process
+    if pipe_input == False:
+        var_dir = args.var
+    else:
+        lines = list(sys.stdin)
+        var_dir = lines[0].strip()
+
+    var_dir = str(Path(var_dir).resolve())
+    res_dir = str(Path(args.res).resolve())
+    base_path = args.base
+    if base_path is not None:
+        base_path = str(Path(base_path).resolve())
+    materialize_variants(var_dir, res_dir, base_path=base_path)
+    # make sure this output can be piped into another command on the cmd
+    print(res_dir)
+    sys.stdout.flush()
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================
+#===================================================================================================
+# region: Main
+#===================================================================================================
+if __name__=='__main__':
+    main()
+#===================================================================================================
+# endregion: Main
+#===================================================================================================
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import socket
+import argparse
+from pathlib import Path
+
+# the directory in the results directory with the claims of the variants being evaluated
+CLAIM_DIR_NAME = '.claims'
+# the seconds for a process to write its claim after creating it, an unreadable claim younger than this is still being written
+CLAIM_WRITE_SECS = 60
+# the seconds to wait after taking over a stale claim, for the other processes that found the same stale claim to take it over as well
+CLAIM_SETTLE_SECS = 1
+#===================================================================================================
+# region: FUNCTIONS
+#===================================================================================================
+def parse_shard(shard_str: str) -> tuple[int, int]:
+    '''
+    Parse the shard argument i/N, the i-th of N shards counting from 0. Used as the type of the --shard argument.
+
+    Parameters
+    ----------
+    shard_str: str
+        the shard, e.g. 0/4 for the first of 4 shards.
+
+    Returns
+    -------
+    tuple[int, int]
+        the index of the shard and the number of shards.
+    '''
+    try:
+        shard_indx, nshards = [int(val) for val in shard_str.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{shard_str} is not a shard i/N, e.g. 0/4")
+    if nshards < 1 or not 0 <= shard_indx < nshards:
+        raise argparse.ArgumentTypeError(f"the shard {shard_str} needs 0 <= i < N")
+    return shard_indx, nshards
+
+def select_indices(var_indices: list[int], start: int = None, stop: int = None, shard: tuple[int, int] = None) -> list[int]:
+    '''
+    Select the variants of this machine. The variants are selected by the index of their row in parameter_normalized_values, so exe_wwr_constr
+    and batch_eval select the same variants with the same arguments.
+
+    Parameters
+    ----------
+    var_indices: list[int]
+        the indices of the variants.
+
+    start: int, optional
+        the first index to select. Default to the first variant.
+
+    stop: int, optional
+        the index to stop before, like a python slice. Default to after the last variant.
+
+    shard: tuple[int, int], optional
+        the index of the shard and the number of shards from parse_shard, the variants are dealt to the shards in turn by their index,
+        variant i goes to shard i % N. Default to all the variants.
+
+    Returns
+    -------
+    list[int]
+        the selected indices in the same order.
+    '''
+    selected = []
+    for var_indx in var_indices:
+        if start is not None and var_indx < start:
+            continue
+        if stop is not None and var_indx >= stop:
+            continue
+        if shard is not None and var_indx % shard[1] != shard[0]:
+            continue
+        selected.append(var_indx)
+    return selected
+
+def get_worker_id() -> str:
+    '''
+    Get the id of this process, unique across the machines sharing the results directory.
+
+    Returns
+    -------
+    str
+        {hostname}_{pid}
+    '''
+    return f"{socket.gethostname()}_{os.getpid()}"
+
+def get_claim_path(res_dir: str, filename: str) -> Path:
+    '''
+    Get the path of the claim of a variant.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+
+    Returns
+    -------
+    Path
+        the path of the claim, res_dir/.claims/{filename}.claim
+    '''
+    return Path(res_dir).joinpath(CLAIM_DIR_NAME, f"{filename}.claim")
+
+def read_claim(claim_path: Path) -> dict | None:
+    '''
+    Read a claim.
+
+    Parameters
+    ----------
+    claim_path: Path
+        the path of the claim.
+
+    Returns
+    -------
+    dict | None
+        the host, pid and time of the claim. None if there is no claim or it cannot be read.
+    '''
+    try:
+        with open(claim_path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def is_claim_stale(claim_path: Path, stale_secs: float = None) -> bool:
+    '''
+    Check if a claim is left behind by a process that stopped. A claim of a process of this machine that is no longer running is stale,
+    the claims of the other machines are stale when they are older than stale_secs. A claim that cannot be read, e.g. its process stopped
+    before writing it, is stale when it is older than stale_secs and CLAIM_WRITE_SECS.
+
+    Parameters
+    ----------
+    claim_path: Path
+        the path of the claim.
+
+    stale_secs: float, optional
+        the age in seconds after which a claim is stale, it needs to be longer than the evaluation of a variant. Default to never.
+
+    Returns
+    -------
+    bool
+        True if the claim is stale.
+    '''
+    try:
+        claim_age = time.time() - claim_path.stat().st_mtime
+        with open(claim_path) as f:
+            claim = json.load(f)
+    except OSError:
+        return False
+    except json.JSONDecodeError:
+        # the claim is being written or its process stopped before writing it
+        return stale_secs is not None and claim_age > max(stale_secs, CLAIM_WRITE_SECS)
+
+    if claim.get('host') == socket.gethostname():
+        try:
+            os.kill(claim['pid'], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+    return stale_secs is not None and claim_age > stale_secs
+
+def claim_variant(res_dir: str, filename: str, stale_secs: float = None) -> bool:
+    '''
+    Claim a variant so that the other processes sharing the results directory do not evaluate it. The claim is a file created with O_EXCL,
+    which only one process can create, and that works on shared file systems such as NFS. A stale claim, see is_claim_stale, is taken over by
+    replacing it with the claim of this process and reading it back after CLAIM_SETTLE_SECS.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+
+    stale_secs: float, optional
+        the age in seconds after which the claims of the other machines are taken over. Default to never.
+
+    Returns
+    -------
+    bool
+        True if this process claimed the variant, False if another process has claimed it.
+    '''
+    claim_path = get_claim_path(res_dir, filename)
+    claim_path.parent.mkdir(parents=True, exist_ok=True)
+    claim = {'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time()}
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if not is_claim_stale(claim_path, stale_secs=stale_secs):
+            return False
+        # replace the stale claim in one step, so there is no moment without a claim for another process to create one
+        tmp_path = claim_path.with_name(f"{claim_path.name}.{get_worker_id()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(claim, f)
+        os.replace(tmp_path, claim_path)
+        # the processes that found the same stale claim replace it one after the other, only the last one keeps the variant
+        time.sleep(CLAIM_SETTLE_SECS)
+        return read_claim(claim_path) == claim
+
+    with os.fdopen(fd, 'w') as f:
+        json.dump(claim, f)
+    return True
+
+def release_variant(res_dir: str, filename: str):
+    '''
+    Release the claim of a variant after its results are written. The claim is only removed if it is still the claim of this process,
+    it may have been taken over as stale.
+
+    Parameters
+    ----------
+    res_dir : str
+        The path of the results directory.
+
+    filename: str
+        The name of the variant.
+    '''
+    claim_path = get_claim_path(res_dir, filename)
+    claim = read_claim(claim_path)
+    if claim is None:
+        return
+    if claim.get('host') == socket.gethostname() and claim.get('pid') == os.getpid():
+        claim_path.unlink(missing_ok=True)
+#===================================================================================================
+# endregion: FUNCTIONS
+#===================================================================================================